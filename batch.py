@@ -0,0 +1,167 @@
+"""
+Analisi forense headless su molte immagini (senza GUI, non importa customtkinter).
+
+Esempi:
+    python3 batch.py foto/ -o risultati/
+    python3 batch.py "submissions/**/*.jpg" -o out/ -a ela,edge,Y -j 8
+    python3 batch.py foto/ -o out/ -a none --metadata     (solo metadati, senza decodificare i pixel)
+
+Per ogni immagine e ogni analisi scelta viene salvato un file nella cartella di output;
+manifest.jsonl riceve una riga JSON per immagine (con i tempi) appena l'immagine è completata.
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from PIL import Image
+from core.image_processor import ImageProcessor
+from core.metadata import metadata_extractor
+
+# Nome analisi -> (channel_mode, is_inverted, analysis_mode) della pipeline di visualizzazione
+ANALYSES = {
+    "ela": ("RGB", False, "ELA"),
+    "equalize": ("RGB", False, "Equalize"),
+    "edge": ("RGB", False, "Edge"),
+    "copymove": ("RGB", False, "CopyMove"),
+    "noise": ("RGB", False, "Noise"),
+    "ghost": ("RGB", False, "Ghost"),
+    "invert": ("RGB", True, "Normal"),
+    "R": ("R", False, "Normal"), "G": ("G", False, "Normal"), "B": ("B", False, "Normal"),
+    "H": ("H", False, "Normal"), "S": ("S", False, "Normal"), "V": ("V", False, "Normal"),
+    "YCbCr": ("YCbCr", False, "Normal"), "Y": ("Y", False, "Normal"),
+    "Cb": ("Cb", False, "Normal"), "Cr": ("Cr", False, "Normal"),
+    "L": ("L", False, "Normal"),
+}
+DEFAULT_ANALYSES = ["ela", "equalize", "edge"]
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".webp", ".tif", ".tiff")
+
+def collect_inputs(inputs, recursive=False):
+    """Espande cartelle e pattern glob in una lista ordinata di file immagine (senza duplicati)."""
+    paths = []
+    for item in inputs:
+        if os.path.isdir(item):
+            pattern = os.path.join(item, "**", "*") if recursive else os.path.join(item, "*")
+            candidates = glob.glob(pattern, recursive=recursive)
+        elif os.path.isfile(item):
+            candidates = [item]
+        else:
+            candidates = glob.glob(item, recursive=True)
+        paths.extend(p for p in candidates if os.path.isfile(p) and p.lower().endswith(IMAGE_EXTENSIONS))
+
+    seen, result = set(), []
+    for p in paths:
+        key = os.path.abspath(p)
+        if key not in seen:
+            seen.add(key)
+            result.append(p)
+    return sorted(result)
+
+def output_stems(paths):
+    """Nome base univoco per i file di output di ogni immagine."""
+    stems, used = {}, {}
+    for p in paths:
+        stem = os.path.splitext(os.path.basename(p))[0]
+        n = used.get(stem, 0)
+        used[stem] = n + 1
+        stems[p] = stem if n == 0 else f"{stem}_{n}"
+    return stems
+
+def init_worker(analysis_workers):
+    """Inizializzazione di ogni processo worker: limita i thread dei pool interni dei motori di analisi."""
+    ImageProcessor.ANALYSIS_WORKERS = analysis_workers
+
+def analyze_image(path, analyses, out_dir, stem, fmt="png", metadata=False):
+    """Esegue le analisi su un'immagine (nel processo worker) e restituisce il record per il manifest."""
+    record = {"path": path, "analyses": {}}
+    t_start = time.perf_counter()
+    try:
+        if metadata:
+            t0 = time.perf_counter()
+            record["metadata"] = metadata_extractor.extract(path).to_dict()
+            record["metadata_ms"] = round((time.perf_counter() - t0) * 1000, 2)
+        # Senza analisi (-a none) i pixel non vengono decodificati
+        if not analyses: return record
+
+        t0 = time.perf_counter()
+        image = Image.open(path)
+        image.load()
+        record["load_ms"] = round((time.perf_counter() - t0) * 1000, 2)
+        record["size"] = list(image.size)
+        record["mode"] = image.mode
+        record["format"] = image.format
+
+        for name in analyses:
+            t0 = time.perf_counter()
+            try:
+                channel_mode, is_inverted, analysis_mode = ANALYSES[name]
+                # strict: un'analisi fallita finisce sotto "error" invece di salvare l'immagine di ingresso
+                result = ImageProcessor.apply_view_filters(image, channel_mode, is_inverted, analysis_mode, strict=True)
+                out_path = os.path.join(out_dir, f"{stem}_{name}.{fmt}")
+                result.save(out_path)
+                record["analyses"][name] = {"output": out_path, "ms": round((time.perf_counter() - t0) * 1000, 2)}
+            except Exception as e:
+                record["analyses"][name] = {"error": str(e), "ms": round((time.perf_counter() - t0) * 1000, 2)}
+    except Exception as e:
+        record["error"] = str(e)
+    finally:
+        record["total_ms"] = round((time.perf_counter() - t_start) * 1000, 2)
+    return record
+
+def parse_analyses(value):
+    if value.strip().lower() == "none": return []
+    names = [n.strip() for n in value.split(",") if n.strip()]
+    unknown = [n for n in names if n not in ANALYSES]
+    if unknown:
+        raise argparse.ArgumentTypeError(f"analisi sconosciute: {', '.join(unknown)} (disponibili: {', '.join(ANALYSES)})")
+    return names
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="pyfrg - analisi forense batch (headless)")
+    parser.add_argument("inputs", nargs="+", help="File, cartelle o pattern glob")
+    parser.add_argument("-o", "--output", required=True, help="Cartella di output")
+    parser.add_argument("-a", "--analyses", type=parse_analyses, default=DEFAULT_ANALYSES,
+                        help=f"Analisi separate da virgola (default: {','.join(DEFAULT_ANALYSES)}; "
+                             f"disponibili: {','.join(ANALYSES)}; none per nessuna)")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1, help="Numero di processi worker")
+    parser.add_argument("-r", "--recursive", action="store_true", help="Scansiona le cartelle ricorsivamente")
+    parser.add_argument("--format", default="png", choices=["png", "jpg", "tif", "webp"], help="Formato dei file di output")
+    parser.add_argument("--metadata", action="store_true",
+                        help="Aggiunge al manifest i metadati (EXIF, XMP, IPTC, tabelle di quantizzazione, miniatura)")
+    parser.add_argument("--manifest", default="manifest.jsonl", help="Nome del manifest JSONL nella cartella di output")
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    paths = collect_inputs(args.inputs, args.recursive)
+    if not paths:
+        print("Nessuna immagine trovata.")
+        return 1
+
+    os.makedirs(args.output, exist_ok=True)
+    stems = output_stems(paths)
+    manifest_path = os.path.join(args.output, args.manifest)
+    errors = 0
+    t_start = time.perf_counter()
+    # Il parallelismo è tra processi: nei worker i pool interni dei motori usano un solo thread
+    with open(manifest_path, "w", encoding="utf-8") as manifest, \
+         ProcessPoolExecutor(max_workers=max(1, args.jobs), initializer=init_worker, initargs=(1,)) as pool:
+        futures = [pool.submit(analyze_image, p, args.analyses, args.output, stems[p], args.format, args.metadata) for p in paths]
+        for done, future in enumerate(as_completed(futures), 1):
+            record = future.result()
+            if "error" in record or any("error" in a for a in record["analyses"].values()):
+                errors += 1
+            # Una riga per immagine, scritta appena pronta
+            manifest.write(json.dumps(record) + "\n")
+            manifest.flush()
+            print(f"[{done}/{len(paths)}] {record['path']} ({record['total_ms']:.0f} ms)")
+
+    elapsed = time.perf_counter() - t_start
+    print(f"{len(paths)} immagini in {elapsed:.1f} s, {errors} con errori. Manifest: {manifest_path}")
+    return 1 if errors else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,217 @@
+"""
+Benchmark headless della pipeline di elaborazione e rendering.
+
+Esempi:
+    python3 benchmark.py                       # tutte le fixture (1, 12, 48 MP + assets/Canon_40D.jpg)
+    python3 benchmark.py --sizes 1,12 --only ela,render
+    python3 benchmark.py --save-baseline       # salva i tempi come riferimento
+    python3 benchmark.py --threshold 0.2       # exit code 1 se un'operazione è più lenta del 20% rispetto al riferimento
+
+Per ogni operazione si misura il tempo (minimo e mediana su --repeat esecuzioni) e, in un'esecuzione
+separata, il picco di memoria (allocazioni tracciate da tracemalloc e crescita della RSS del processo).
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+import tracemalloc
+
+import numpy as np
+from PIL import Image, ImageFilter
+
+from core.image_processor import ImageProcessor
+from core.history_manager import HistoryManager
+from core.tile_renderer import TileRenderer
+from core.color_planes import ColorPlaneCache
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+SAMPLE_IMAGE = os.path.join(ROOT, "assets", "Canon_40D.jpg")
+DEFAULT_BASELINE = os.path.join(ROOT, "benchmark_baseline.json")
+ANALYSIS_MODES = ["Equalize", "Edge", "ELA", "Noise", "Ghost", "CopyMove"]
+
+def synthetic_image(megapixels, seed=0):
+    """Immagine RGB deterministica 3:2 con struttura a bassa frequenza e rumore (comprime come una foto)."""
+    w = int((megapixels * 1_000_000 * 1.5) ** 0.5)
+    h = int(w / 1.5)
+    rng = np.random.default_rng(seed)
+    base = Image.fromarray(rng.integers(0, 256, (max(1, h // 16), max(1, w // 16), 3), dtype=np.uint8))
+    base = base.resize((w, h), Image.Resampling.BICUBIC)
+    noise = Image.fromarray(rng.integers(0, 256, (h, w, 3), dtype=np.uint8)).filter(ImageFilter.GaussianBlur(1))
+    return Image.blend(base, noise, 0.25)
+
+def load_fixtures(sizes):
+    fixtures = []
+    if os.path.exists(SAMPLE_IMAGE):
+        img = Image.open(SAMPLE_IMAGE)
+        img.load()
+        fixtures.append(("canon_40d", img))
+    for mp in sizes:
+        fixtures.append((f"synthetic_{mp:g}mp", synthetic_image(mp)))
+    return fixtures
+
+def _rss_bytes():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except Exception:
+        return None
+
+class PeakMemory:
+    """Picco di memoria durante un blocco: tracemalloc + campionamento della RSS (solo Linux)."""
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.traced_peak = 0
+        self.rss_peak = None
+
+    def __enter__(self):
+        self._stop = threading.Event()
+        self._rss_start = _rss_bytes()
+        self._rss_max = self._rss_start
+        if self._rss_start is not None:
+            self._sampler = threading.Thread(target=self._sample, daemon=True)
+            self._sampler.start()
+        tracemalloc.start()
+        tracemalloc.reset_peak()
+        return self
+
+    def _sample(self):
+        while not self._stop.is_set():
+            rss = _rss_bytes()
+            if rss and rss > self._rss_max: self._rss_max = rss
+            self._stop.wait(self.interval)
+
+    def __exit__(self, *exc):
+        self.traced_peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        self._stop.set()
+        if self._rss_start is not None:
+            self._sampler.join()
+            rss = _rss_bytes()
+            if rss and rss > self._rss_max: self._rss_max = rss
+            self.rss_peak = self._rss_max - self._rss_start
+        return False
+
+def build_operations(image):
+    """Lista di (nome, setup, operazione): setup prepara l'input (non cronometrato), operazione lo elabora."""
+    rgb = image.convert("RGB")
+    ops = [
+        ("ela", lambda: rgb, ImageProcessor.compute_ela),
+        ("feathering", lambda: rgb.convert("RGBA"), ImageProcessor.apply_feathering),
+        ("bg_remove_numpy", lambda: rgb, ImageProcessor.corner_background_remove),
+        ("filters/invert", lambda: rgb, lambda img: ImageProcessor.apply_view_filters(img, "RGB", True)),
+    ]
+    for mode in ("RGB",) + ColorPlaneCache.VIEW_MODES:
+        ops.append((f"filters/{mode}", lambda: rgb, lambda img, m=mode: ImageProcessor.apply_view_filters(img, m)))
+    for mode in ANALYSIS_MODES:
+        ops.append((f"analysis/{mode}", lambda: rgb,
+                    lambda img, m=mode: ImageProcessor.apply_view_filters(img, "RGB", False, m)))
+
+    # Render del viewport (1000x700) come nel canvas: adattato allo schermo e zoom 4x al centro
+    def render(img, scale, pan):
+        renderer = TileRenderer()
+        tile_fn = lambda box: ImageProcessor.apply_view_filters(img.crop(box), "Y")
+        return renderer.render(img, scale, pan[0], pan[1], 1000, 700, tile_fn=tile_fn, key="bench", margin=256)
+    w, h = rgb.size
+    fit = min(1000 / w, 700 / h) * 0.9
+    ops.append(("render/viewport_fit", lambda: rgb,
+                lambda img: render(img, fit, ((1000 - int(w * fit)) // 2, (700 - int(h * fit)) // 2))))
+    ops.append(("render/viewport_4x", lambda: rgb, lambda img: render(img, 4.0, (500 - 2 * w, 350 - 2 * h))))
+
+    # Cronologia: salvataggio di una regione, undo e redo
+    def history(img):
+        hm = HistoryManager(background=False)
+        box = (w // 4, h // 4, w // 4 + min(1024, w // 2), h // 4 + min(1024, h // 2))
+        hm.push(img, box)
+        hm.undo(img)
+        hm.redo(img)
+        hm.close()
+    ops.append(("history/push_undo_redo", lambda: rgb.copy(), history))
+    return ops
+
+def run_operation(setup, op, repeat):
+    # Esecuzione di riscaldamento (import pigri, cache di PIL) esclusa dalle misure
+    op(setup())
+    times = []
+    for _ in range(repeat):
+        data = setup()
+        t0 = time.perf_counter()
+        op(data)
+        times.append((time.perf_counter() - t0) * 1000)
+    data = setup()
+    with PeakMemory() as mem:
+        op(data)
+    return {"min_ms": round(min(times), 3), "median_ms": round(statistics.median(times), 3),
+            "traced_peak_mb": round(mem.traced_peak / 2 ** 20, 2),
+            "rss_peak_mb": None if mem.rss_peak is None else round(mem.rss_peak / 2 ** 20, 2)}
+
+def compare(results, baseline, threshold, min_ms=1.0):
+    """
+    Restituisce le regressioni: operazioni con min_ms oltre (1 + threshold) volte il riferimento.
+    Le operazioni sotto min_ms nel riferimento sono troppo rumorose e non vengono segnalate.
+    """
+    regressions = []
+    for key, res in results.items():
+        ref = baseline.get(key)
+        if not ref or not ref.get("min_ms"): continue
+        ratio = res["min_ms"] / ref["min_ms"]
+        res["baseline_ms"] = ref["min_ms"]
+        res["ratio"] = round(ratio, 3)
+        if ratio > 1 + threshold and ref["min_ms"] >= min_ms: regressions.append((key, ratio))
+    return regressions
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="pyfrg - benchmark della pipeline (headless)")
+    parser.add_argument("--sizes", default="1,12,48", help="Megapixel delle immagini sintetiche (default: 1,12,48)")
+    parser.add_argument("--repeat", type=int, default=3, help="Esecuzioni cronometrate per operazione")
+    parser.add_argument("--only", default="", help="Esegui solo le operazioni il cui nome contiene una di queste stringhe")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="File JSON di riferimento")
+    parser.add_argument("--save-baseline", action="store_true", help="Salva i risultati come nuovo riferimento")
+    parser.add_argument("--threshold", type=float, default=0.25, help="Rallentamento tollerato rispetto al riferimento")
+    parser.add_argument("--min-ms", type=float, default=1.0, help="Ignora le regressioni di operazioni più brevi di così")
+    parser.add_argument("--json", help="Scrive i risultati completi in questo file")
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    sizes = [float(s) for s in args.sizes.split(",") if s.strip()]
+    only = [s.strip() for s in args.only.split(",") if s.strip()]
+
+    baseline = {}
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    results = {}
+    for fixture, image in load_fixtures(sizes):
+        print(f"== {fixture} ({image.size[0]}x{image.size[1]})")
+        for name, setup, op in build_operations(image):
+            if only and not any(s in name for s in only): continue
+            key = f"{fixture}/{name}"
+            res = run_operation(setup, op, max(1, args.repeat))
+            results[key] = res
+            ref = baseline.get(key)
+            delta = f"  ({res['min_ms'] / ref['min_ms']:.2f}x)" if ref and ref.get("min_ms") else ""
+            rss = "-" if res["rss_peak_mb"] is None else f"{res['rss_peak_mb']:.1f}"
+            print(f"  {name:<28} {res['min_ms']:>10.1f} ms  med {res['median_ms']:>10.1f} ms  "
+                  f"peak {res['traced_peak_mb']:>8.1f} MB traced / {rss:>8} MB rss{delta}")
+
+    regressions = compare(results, baseline, args.threshold, args.min_ms)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"Riferimento salvato in {args.baseline}")
+    elif not baseline:
+        print(f"Nessun riferimento in {args.baseline}: usa --save-baseline per crearlo.")
+
+    for key, ratio in regressions:
+        print(f"REGRESSIONE {key}: {ratio:.2f}x rispetto al riferimento")
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,233 @@
+from abc import ABC, abstractmethod
+import math
+import os
+import struct
+from PIL import Image
+from core.lazy import lazy_import
+
+np = lazy_import("numpy")
+
+class BackingStore(ABC):
+    """
+    Immagine molto grande letta su richiesta dal disco invece che tenuta in RAM.
+    I pixel vivono in un file mappato in memoria (np.memmap): crop() copia solo la regione chiesta
+    e il sistema operativo carica le pagine del file quando vengono toccate, quindi si possono
+    ispezionare immagini molto più grandi della memoria disponibile.
+    Sola lettura: le sottoclassi devono implementare _read(x0, y0, x1, y1) -> array (h, w, canali).
+    """
+    MODES = {1: "L", 3: "RGB", 4: "RGBA"}
+
+    def __init__(self, width, height, channels, dtype, path=None):
+        if channels not in self.MODES: raise ValueError(f"Numero di canali non supportato: {channels}")
+        self.size = (width, height)
+        self.channels = channels
+        self.mode = self.MODES[channels]
+        self.dtype = np.dtype(dtype)
+        if self.dtype.kind != "u" or self.dtype.itemsize not in (1, 2):
+            raise ValueError(f"Tipo di pixel non supportato: {self.dtype}")
+        self.path = path
+
+    @property
+    def width(self): return self.size[0]
+
+    @property
+    def height(self): return self.size[1]
+
+    @property
+    def nbytes(self):
+        return self.size[0] * self.size[1] * self.channels * self.dtype.itemsize
+
+    def crop(self, box):
+        """Regione box (x0, y0, x1, y1) come immagine PIL a 8 bit; le parti fuori dall'immagine restano nere."""
+        x0, y0, x1, y1 = (int(v) for v in box)
+        w, h = self.size
+        out = np.zeros((max(0, y1 - y0), max(0, x1 - x0), self.channels), dtype=np.uint8)
+        cx0, cy0, cx1, cy1 = max(0, x0), max(0, y0), min(w, x1), min(h, y1)
+        if cx1 > cx0 and cy1 > cy0:
+            out[cy0 - y0:cy1 - y0, cx0 - x0:cx1 - x0] = self._to_8bit(self._read(cx0, cy0, cx1, cy1))
+        return Image.fromarray(out[:, :, 0] if self.channels == 1 else out, self.mode)
+
+    def getpixel(self, x, y):
+        return self.crop((x, y, x + 1, y + 1)).getpixel((0, 0))
+
+    def iter_tiles(self, tile_size=1024):
+        """Genera (box, tile PIL) riga per riga: per filtri e analisi a tile senza caricare l'immagine intera."""
+        w, h = self.size
+        for y in range(0, h, tile_size):
+            for x in range(0, w, tile_size):
+                box = (x, y, min(w, x + tile_size), min(h, y + tile_size))
+                yield box, self.crop(box)
+
+    def overview(self, max_side=4096):
+        """
+        Panoramica ridotta (sottocampionamento a passo intero) per lo zoom out.
+        Restituisce (immagine PIL, fattore): il fattore è il rapporto tra la larghezza piena e quella della panoramica.
+        Si leggono solo le righe campionate, un blocco di righe alla volta.
+        """
+        w, h = self.size
+        step = max(1, math.ceil(max(w, h) / max_side))
+        ow, oh = -(-w // step), -(-h // step)
+        out = np.empty((oh, ow, self.channels), dtype=np.uint8)
+        band = max(1, (64 * 1024 * 1024) // max(1, w * self.channels * self.dtype.itemsize * step))
+        for oy in range(0, oh, band):
+            y0, y1 = oy * step, min(h, (oy + band) * step)
+            rows = self._read(0, y0, w, y1)[::step, ::step]
+            out[oy:oy + len(rows)] = self._to_8bit(rows)
+        return Image.fromarray(out[:, :, 0] if self.channels == 1 else out, self.mode), w / ow
+
+    def close(self):
+        pass
+
+    def _to_8bit(self, arr):
+        if self.dtype.itemsize == 1: return arr
+        return (arr >> 8).astype(np.uint8)
+
+    @abstractmethod
+    def _read(self, x0, y0, x1, y1):
+        """Pixel grezzi della regione (già dentro l'immagine) come array (h, w, canali) nel dtype dello store."""
+
+class ArrayStore(BackingStore):
+    """Array NumPy (tipicamente np.memmap o un .npy aperto con mmap_mode="r") di forma (h, w) o (h, w, canali)."""
+    def __init__(self, array, path=None):
+        if array.ndim == 2: array = array[:, :, None]
+        if array.ndim != 3: raise ValueError(f"Forma dell'array non supportata: {array.shape}")
+        h, w, c = array.shape
+        super().__init__(w, h, c, array.dtype, path)
+        self.array = array
+
+    def _read(self, x0, y0, x1, y1):
+        return self.array[y0:y1, x0:x1]
+
+    def close(self):
+        mm = getattr(self.array, "_mmap", None)
+        self.array = None
+        if mm is not None:
+            try: mm.close()
+            except Exception: pass
+
+class TiffStore(BackingStore):
+    """
+    TIFF o BigTIFF non compresso, a strip o a tile, con campioni interleaved (PlanarConfiguration 1)
+    a 8 o 16 bit. Il file intero è mappato in memoria e ogni strip/tile è una vista senza copie;
+    se le strip sono contigue l'immagine è vista come un unico array (h, w, canali).
+    """
+    TYPES = {1: "B", 3: "H", 4: "I", 16: "Q"}
+
+    def __init__(self, path):
+        self._raw = np.memmap(path, dtype=np.uint8, mode="r")
+        tags, self._endian = self._read_ifd(self._raw)
+
+        def tag(code, default=None):
+            values = tags.get(code)
+            if values is None: return default
+            return values if len(values) > 1 else int(values[0])
+
+        if tag(259, 1) != 1: raise ValueError("TIFF compresso: serve un TIFF non compresso per la lettura a tile")
+        if tag(284, 1) != 1: raise ValueError("TIFF planare (PlanarConfiguration 2) non supportato")
+        if tag(339, 1) != 1: raise ValueError("Solo campioni interi senza segno sono supportati")
+        # Solo MinIsBlack e RGB si mostrano così come sono; CMYK, MinIsWhite, palette e YCbCr li legge PIL
+        if tag(262, 1) not in (1, 2): raise ValueError(f"Interpretazione fotometrica non supportata: {tag(262)}")
+        bits = tags.get(258, [8])
+        if len(set(int(b) for b in bits)) != 1 or int(bits[0]) not in (8, 16):
+            raise ValueError(f"Profondità non supportata: {list(bits)}")
+        channels = tag(277, 1)
+        # Con canali extra (es. alpha non associato oltre RGBA) si tengono solo i primi
+        self._stored_channels = channels
+        width, height = tag(256), tag(257)
+        dtype = np.dtype(f"{self._endian}u{int(bits[0]) // 8}")
+        super().__init__(width, height, min(channels, 4) if channels != 2 else 1, dtype, path)
+
+        self._tiled = 324 in tags
+        if self._tiled:
+            self.tile_w, self.tile_h = tag(322), tag(323)
+            self._offsets = np.asarray(tags[324], dtype=np.int64)
+        else:
+            self.tile_w, self.tile_h = width, min(height, tag(278, height))
+            self._offsets = np.asarray(tags[273], dtype=np.int64)
+        self._row_bytes = self.tile_w * self._stored_channels * self.dtype.itemsize
+        self._tiles_x = -(-width // self.tile_w)
+
+        # Strip contigue: l'intero file è un unico array (h, w, canali)
+        self._array = None
+        if not self._tiled:
+            expected = self._offsets[0] + np.arange(len(self._offsets), dtype=np.int64) * self._row_bytes * self.tile_h
+            if np.array_equal(self._offsets, expected):
+                count = width * height * self._stored_channels
+                flat = self._raw[self._offsets[0]:self._offsets[0] + count * self.dtype.itemsize].view(dtype)
+                self._array = flat.reshape(height, width, self._stored_channels)
+
+    def _read_ifd(self, raw):
+        order = bytes(raw[:2])
+        if order not in (b"II", b"MM"): raise ValueError("Non è un file TIFF")
+        endian = "<" if order == b"II" else ">"
+        magic = struct.unpack(endian + "H", bytes(raw[2:4]))[0]
+        if magic == 42:
+            offset = struct.unpack(endian + "I", bytes(raw[4:8]))[0]
+            count_fmt, entry_fmt, entry_size, inline = "H", "HHI", 12, 4
+        elif magic == 43:
+            offset = struct.unpack(endian + "Q", bytes(raw[8:16]))[0]
+            count_fmt, entry_fmt, entry_size, inline = "Q", "HHQ", 20, 8
+        else:
+            raise ValueError("Non è un file TIFF")
+
+        count_size = struct.calcsize(count_fmt)
+        n = struct.unpack(endian + count_fmt, bytes(raw[offset:offset + count_size]))[0]
+        tags = {}
+        pos = offset + count_size
+        head = struct.calcsize(endian + entry_fmt)
+        for _ in range(n):
+            code, typ, count = struct.unpack(endian + entry_fmt, bytes(raw[pos:pos + head]))
+            fmt = self.TYPES.get(typ)
+            if fmt is not None:
+                size = struct.calcsize(fmt) * count
+                if size <= inline:
+                    start = pos + head
+                else:
+                    start = struct.unpack(endian + ("I" if inline == 4 else "Q"), bytes(raw[pos + head:pos + head + inline]))[0]
+                tags[code] = raw[start:start + size].view(np.dtype(endian + fmt))
+            pos += entry_size
+        return tags, endian
+
+    def _chunk(self, index, rows):
+        """Vista (rows, tile_w, canali) della strip/tile index direttamente sul file mappato."""
+        start = self._offsets[index]
+        count = rows * self.tile_w * self._stored_channels
+        flat = self._raw[start:start + count * self.dtype.itemsize].view(self.dtype)
+        return flat.reshape(rows, self.tile_w, self._stored_channels)
+
+    def _read(self, x0, y0, x1, y1):
+        c = self.channels
+        if self._array is not None: return self._array[y0:y1, x0:x1, :c]
+
+        out = np.empty((y1 - y0, x1 - x0, c), dtype=self.dtype)
+        tw, th = self.tile_w, self.tile_h
+        for ty in range(y0 // th, (y1 - 1) // th + 1):
+            # L'ultima strip di un TIFF a strip può essere più corta
+            rows = th if self._tiled else min(th, self.height - ty * th)
+            for tx in range(x0 // tw, (x1 - 1) // tw + 1):
+                chunk = self._chunk(ty * self._tiles_x + tx, rows)
+                cx0, cy0 = tx * tw, ty * th
+                sx0, sy0 = max(x0, cx0), max(y0, cy0)
+                sx1, sy1 = min(x1, cx0 + tw, self.width), min(y1, cy0 + rows, self.height)
+                out[sy0 - y0:sy1 - y0, sx0 - x0:sx1 - x0] = chunk[sy0 - cy0:sy1 - cy0, sx0 - cx0:sx1 - cx0, :c]
+        return out
+
+    def close(self):
+        self._array = None
+        mm = getattr(self._raw, "_mmap", None)
+        self._raw = None
+        if mm is not None:
+            try: mm.close()
+            except Exception: pass
+
+def open_raw(path, width, height, channels=3, dtype="uint8", offset=0):
+    """File di pixel grezzi interleaved (senza intestazione oltre offset byte)."""
+    array = np.memmap(path, dtype=np.dtype(dtype), mode="r", offset=offset, shape=(height, width, channels))
+    return ArrayStore(array, path)
+
+def open_backing_store(path):
+    """Apre path come backing store (.npy, TIFF/BigTIFF non compresso). Solleva ValueError se non è possibile."""
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".npy": return ArrayStore(np.load(path, mmap_mode="r"), path)
+    if ext in (".tif", ".tiff"): return TiffStore(path)
+    raise ValueError(f"Formato non supportato per il backing store: {ext}")
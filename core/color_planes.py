@@ -0,0 +1,75 @@
+from PIL import Image
+from core.lazy import lazy_import
+from core.render_cache import LRUByteCache
+
+np = lazy_import("numpy")
+
+class ColorPlaneCache:
+    """
+    Piani colore (array NumPy H x W x 3, o H x W per L) dell'immagine corrente.
+    Ogni spazio colore viene convertito una sola volta per revisione dell'immagine, al primo uso:
+    l'ispettore pixel legge per indicizzazione e le viste per canale si ritagliano dagli array.
+    Gli spazi già visitati restano in una cache LRU con budget in byte (max_bytes); lo spazio usato
+    per ultimo resta comunque disponibile anche se da solo supera il budget.
+    """
+    # Modalità canale -> (spazio colore, indice del piano; None = tutti i piani)
+    CHANNELS = {
+        "RGB": ("RGB", None), "R": ("RGB", 0), "G": ("RGB", 1), "B": ("RGB", 2),
+        "HSV": ("HSV", None), "H": ("HSV", 0), "S": ("HSV", 1), "V": ("HSV", 2),
+        "YCbCr": ("YCbCr", None), "Y": ("YCbCr", 0), "Cb": ("YCbCr", 1), "Cr": ("YCbCr", 2),
+        "L": ("L", None),
+    }
+    # Modalità per cui _apply_filters produce una vista dedicata
+    VIEW_MODES = ("R", "G", "B", "H", "S", "V", "YCbCr", "Y", "Cb", "Cr", "L")
+
+    def __init__(self, max_bytes=256 * 1024 * 1024):
+        self.image = None
+        self._planes = LRUByteCache(max_bytes=max_bytes)
+        self._current = None # (spazio, piano) usato per ultimo
+
+    def reset(self, image):
+        """Associa una nuova immagine (o revisione) e scarta i piani calcolati."""
+        self.image = image
+        self._planes.clear()
+        self._current = None
+
+    def get(self, space):
+        current = self._current
+        if current is not None and current[0] == space: return current[1]
+        plane = self._planes.get(space)
+        if plane is None and self.image is not None:
+            rgb = self.image if self.image.mode == "RGB" else self.image.convert("RGB")
+            plane = self._planes.put(space, np.asarray(rgb if space == "RGB" else rgb.convert(space)))
+        if plane is not None: self._current = (space, plane)
+        return plane
+
+    def pixel(self, mode, x, y):
+        """Valori del pixel (x, y) nella modalità indicata: tupla per gli spazi interi, intero per un canale."""
+        space, idx = self.CHANNELS.get(mode, ("RGB", None))
+        p = self.get(space)[y, x]
+        if space == "L": return int(p)
+        if idx is not None: return int(p[idx])
+        return tuple(int(v) for v in p)
+
+    def channel_view(self, mode, box=None):
+        """
+        Vista RGB di un canale (come la produce ImageProcessor.apply_view_filters), opzionalmente
+        ritagliata su box = (x0, y0, x1, y1).
+        """
+        space, idx = self.CHANNELS[mode]
+        plane = self.get(space)
+        if box is not None:
+            x0, y0, x1, y1 = box
+            plane = plane[y0:y1, x0:x1]
+
+        if space == "L":
+            data = np.repeat(plane[:, :, None], 3, axis=2)
+        elif idx is None:
+            data = plane
+        elif space == "RGB":
+            # Solo il canale scelto, gli altri a zero
+            data = np.zeros(plane.shape, dtype=np.uint8)
+            data[:, :, idx] = plane[:, :, idx]
+        else:
+            data = np.repeat(plane[:, :, idx:idx + 1], 3, axis=2)
+        return Image.fromarray(np.ascontiguousarray(data))
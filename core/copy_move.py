@@ -0,0 +1,186 @@
+from concurrent.futures import ThreadPoolExecutor
+import math
+import os
+from PIL import Image
+from core.lazy import lazy_import
+
+np = lazy_import("numpy")
+
+class CopyMoveDetector:
+    """
+    Rilevamento di falsi copy-move a blocchi sovrapposti.
+
+    1. Feature: coefficienti DCT a bassa frequenza di ogni blocco block_size x block_size (passo stride),
+       calcolati per tutti i blocchi insieme con correlazioni separabili in NumPy.
+    2. Matching: ordinamento lessicografico delle feature quantizzate (chiave a 64 bit) e confronto di ogni blocco con i
+       vicini nell'ordinamento; la ricerca è divisa in blocchi elaborati in parallelo da un pool di thread
+       (le operazioni NumPy rilasciano il GIL).
+    3. Clustering dei vettori di spostamento: restano solo gli spostamenti condivisi da molte coppie,
+       tipici di una regione copiata e incollata altrove.
+    4. Heatmap: copertura in pixel dei blocchi coinvolti.
+    """
+    def __init__(self, block_size=16, stride=2, coeffs=3, quant_step=8.0, max_feature_dist=6.0,
+                 neighbors=4, min_shift=24, min_count=40, min_std=3.0, max_pixels=16_000_000, max_workers=None):
+        self.block_size = block_size
+        self.stride = stride
+        self.coeffs = coeffs
+        self.quant_step = quant_step
+        self.max_feature_dist = max_feature_dist
+        self.neighbors = neighbors
+        self.min_shift = min_shift
+        self.min_count = min_count
+        self.min_std = min_std
+        self.max_pixels = max_pixels
+        self.max_workers = max_workers or os.cpu_count() or 1
+
+    def _dct_basis(self):
+        b, k = self.block_size, self.coeffs
+        i = np.arange(b)
+        basis = np.empty((k, b), dtype=np.float32)
+        for u in range(k):
+            alpha = math.sqrt(1.0 / b) if u == 0 else math.sqrt(2.0 / b)
+            basis[u] = alpha * np.cos(np.pi * (2 * i + 1) * u / (2 * b))
+        return basis
+
+    def extract_features(self, gray):
+        """
+        Feature DCT di tutti i blocchi sovrapposti.
+        Restituisce (features N x coeffs², posizioni N x 2 (y, x), deviazione standard N).
+        """
+        b, s = self.block_size, self.stride
+        h, w = gray.shape
+        ny, nx = (h - b) // s + 1, (w - b) // s + 1
+        basis = self._dct_basis()
+
+        # Passata sulle righe: R_u[y, bx] = sum_i c_u(i) * I[y, bx*s + i]
+        rows = np.zeros((self.coeffs, h, nx), dtype=np.float32)
+        for i in range(b):
+            cols = np.ascontiguousarray(gray[:, i:i + (nx - 1) * s + 1:s])
+            for u in range(self.coeffs):
+                rows[u] += basis[u, i] * cols
+
+        # Passata sulle colonne: F_uv[by, bx] = sum_j c_v(j) * R_u[by*s + j, bx]
+        feats = np.zeros((self.coeffs, self.coeffs, ny, nx), dtype=np.float32)
+        for j in range(b):
+            band = rows[:, j:j + (ny - 1) * s + 1:s, :]
+            for u in range(self.coeffs):
+                for v in range(self.coeffs):
+                    feats[u, v] += basis[v, j] * band[u]
+
+        # Deviazione standard di ogni blocco tramite immagini integrali
+        g64 = gray.astype(np.float64)
+        integral = np.zeros((h + 1, w + 1))
+        integral[1:, 1:] = g64.cumsum(0).cumsum(1)
+        integral_sq = np.zeros((h + 1, w + 1))
+        integral_sq[1:, 1:] = (g64 * g64).cumsum(0).cumsum(1)
+        ys = np.arange(ny) * s
+        xs = np.arange(nx) * s
+        def box_sum(table):
+            return (table[ys[:, None] + b, xs[None, :] + b] - table[ys[:, None], xs[None, :] + b]
+                    - table[ys[:, None] + b, xs[None, :]] + table[ys[:, None], xs[None, :]])
+        n = float(b * b)
+        mean = box_sum(integral) / n
+        std = np.sqrt(np.maximum(box_sum(integral_sq) / n - mean * mean, 0))
+
+        yy, xx = np.meshgrid(ys, xs, indexing="ij")
+        positions = np.stack([yy.ravel(), xx.ravel()], axis=1).astype(np.int32)
+        return feats.reshape(self.coeffs * self.coeffs, -1).T.copy(), positions, std.ravel().astype(np.float32)
+
+    def _match_chunk(self, sorted_feats, sorted_pos, start, stop):
+        """
+        Confronta i blocchi start:stop (nell'ordinamento) con i loro vicini successivi.
+        Restituisce gli indici, nell'ordinamento, delle coppie compatibili.
+        """
+        pairs_a, pairs_b = [], []
+        n = len(sorted_feats)
+        max_dist_sq = self.max_feature_dist ** 2
+        for r in range(1, self.neighbors + 1):
+            end = min(stop, n - r)
+            if end <= start: continue
+            shift = sorted_pos[start + r:end + r] - sorted_pos[start:end]
+            far = np.abs(shift).max(axis=1) >= self.min_shift
+            diff = sorted_feats[start + r:end + r] - sorted_feats[start:end]
+            keep = np.flatnonzero(far & (np.einsum("ij,ij->i", diff, diff) <= max_dist_sq)) + start
+            pairs_a.append(keep)
+            pairs_b.append(keep + r)
+        if not pairs_a: return np.empty(0, np.int64), np.empty(0, np.int64)
+        return np.concatenate(pairs_a), np.concatenate(pairs_b)
+
+    def match(self, feats, positions, std):
+        """Restituisce le coppie di blocchi (a, b) con uno spostamento condiviso da almeno min_count coppie."""
+        valid = np.flatnonzero(std >= self.min_std)
+        if len(valid) < 2: return np.empty(0, np.int64), np.empty(0, np.int64)
+        # Ordinamento lessicografico sui primi 4 coefficienti quantizzati, impacchettati in una chiave a 64 bit
+        q = np.round(feats[valid, :4] / self.quant_step).astype(np.int64)
+        q = np.clip(q + 32768, 0, 65535)
+        key = np.zeros(len(valid), dtype=np.int64)
+        for col in range(q.shape[1]):
+            key = (key << 16) | q[:, col]
+        order = valid[np.argsort(key, kind="stable")]
+        # Feature e posizioni riordinate una volta sola: i vicini diventano fette contigue
+        sorted_feats = feats[order]
+        sorted_pos = positions[order]
+
+        chunk = max(1, math.ceil(len(order) / self.max_workers))
+        bounds = [(i, min(i + chunk, len(order))) for i in range(0, len(order), chunk)]
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            results = list(pool.map(lambda se: self._match_chunk(sorted_feats, sorted_pos, *se), bounds))
+        a = order[np.concatenate([r[0] for r in results])]
+        b = order[np.concatenate([r[1] for r in results])]
+        if len(a) == 0: return a, b
+
+        # Spostamento normalizzato nel verso (dx > 0) o (dx == 0 e dy > 0)
+        shift = positions[b] - positions[a]
+        flip = (shift[:, 1] < 0) | ((shift[:, 1] == 0) & (shift[:, 0] < 0))
+        a, b = np.where(flip, b, a), np.where(flip, a, b)
+        shift[flip] *= -1
+
+        # Cluster: conteggio degli spostamenti identici
+        _, inverse, counts = np.unique(shift, axis=0, return_inverse=True, return_counts=True)
+        keep = counts[inverse.ravel()] >= self.min_count
+        return a[keep], b[keep]
+
+    def heatmap(self, positions, blocks, size):
+        """Numero di blocchi sospetti che coprono ogni pixel (array H x W)."""
+        w, h = size
+        b = self.block_size
+        acc = np.zeros((h + 1, w + 1), dtype=np.int32)
+        ys, xs = positions[blocks, 0], positions[blocks, 1]
+        np.add.at(acc, (ys, xs), 1)
+        np.add.at(acc, (ys, xs + b), -1)
+        np.add.at(acc, (ys + b, xs), -1)
+        np.add.at(acc, (ys + b, xs + b), 1)
+        return acc.cumsum(0).cumsum(1)[:h, :w]
+
+    def detect(self, image):
+        """
+        Analizza un'immagine PIL. Restituisce la mappa di copertura (H x W, dimensioni originali)
+        delle regioni duplicate.
+        """
+        gray_img = image.convert("L")
+        size = gray_img.size
+        factor = 1.0
+        if size[0] * size[1] > self.max_pixels:
+            factor = math.sqrt(self.max_pixels / (size[0] * size[1]))
+            gray_img = gray_img.resize((max(1, int(size[0] * factor)), max(1, int(size[1] * factor))),
+                                       Image.Resampling.BILINEAR)
+        gray = np.asarray(gray_img, dtype=np.float32)
+        if min(gray.shape) < self.block_size:
+            return np.zeros((size[1], size[0]), dtype=np.int32)
+
+        feats, positions, std = self.extract_features(gray)
+        a, b = self.match(feats, positions, std)
+        coverage = self.heatmap(positions, np.unique(np.concatenate([a, b])), gray_img.size)
+        if factor != 1.0:
+            coverage = np.asarray(Image.fromarray(coverage.astype(np.int32)).resize(size, Image.Resampling.NEAREST))
+        return coverage
+
+    def render(self, image, coverage):
+        """Visualizzazione: immagine in grigio attenuata, con le regioni duplicate in rosso."""
+        gray = np.asarray(image.convert("L"), dtype=np.float32) * 0.5
+        level = np.clip(coverage.astype(np.float32) / max(1, self.block_size // self.stride) ** 2, 0, 1)
+        out = np.empty(gray.shape + (3,), dtype=np.uint8)
+        out[:, :, 0] = np.clip(gray + level * 200, 0, 255)
+        out[:, :, 1] = gray * (1 - level)
+        out[:, :, 2] = gray * (1 - level)
+        return Image.fromarray(out)
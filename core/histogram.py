@@ -0,0 +1,46 @@
+from PIL import Image
+from core.lazy import lazy_import
+from core.render_cache import LRUByteCache
+
+np = lazy_import("numpy")
+
+class HistogramService:
+    """
+    Istogrammi per canale di immagini (originale e viste filtrate), memorizzati per chiave
+    (es. revisione dell'immagine + filtri): riaprire la finestra o tornare a un filtro già visto è gratuito.
+    Tutti i canali si contano in una sola passata con Image.histogram() (C, senza array intermedi);
+    per le anteprime si conta un sottocampione a passo stride.
+    """
+    PREVIEW_STRIDE = 4
+
+    def __init__(self, max_entries=64):
+        self._cache = LRUByteCache(max_bytes=max_entries * 3 * 256 * 8)
+
+    @staticmethod
+    def compute(image, stride=1):
+        """
+        Conteggi (n_canali, 256) in float64: 3 righe (R, G, B) per immagini a colori, 1 riga per quelle in scala di grigi.
+        Con stride > 1 i conteggi del sottocampione vengono riscalati al numero di pixel dell'immagine intera.
+        """
+        if image.mode not in ("RGB", "L"):
+            image = image.convert("L" if image.mode in ("1", "I", "I;16", "F") else "RGB")
+        w, h = image.size
+        sample = image
+        if stride > 1 and min(w, h) >= stride:
+            # NEAREST su una griglia ridotta = un pixel ogni stride in ciascuna direzione
+            sample = image.resize((w // stride, h // stride), Image.Resampling.NEAREST)
+        counts = np.asarray(sample.histogram(), dtype=np.float64).reshape(-1, 256)
+        if sample is not image:
+            counts *= (w * h) / (sample.size[0] * sample.size[1])
+        return counts
+
+    def get(self, key, image, stride=1):
+        """Istogramma di image per la chiave data, calcolato solo se non è già in cache."""
+        if image is None: return None
+        return self._cache.get_or_compute((key, stride), lambda: self.compute(image, stride))
+
+    def cached(self, key, stride=1):
+        return self._cache.get((key, stride))
+
+    def clear(self):
+        self._cache.clear()
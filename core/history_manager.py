@@ -1,39 +1,233 @@
 from PIL import Image
+import queue
+import tempfile
+import threading
+import zlib
+
+class HistoryStep:
+    """
+    Un passo di cronologia: il contenuto di una regione (box) dell'immagine prima/dopo una modifica.
+    Il contenuto vive in uno di tre livelli:
+    - "raw": immagine PIL non compressa in RAM (passi recenti)
+    - "compressed": byte compressi con zlib in RAM
+    - "disk": byte compressi nel file temporaneo di spill (offset, lunghezza)
+    """
+    def __init__(self, box, region):
+        self.box = box
+        self.tier = "raw"
+        self.region = region
+        self.mode = region.mode
+        self.size = region.size
+        self.palette = region.getpalette() if region.mode == "P" else None
+        self.raw_bytes = region.size[0] * region.size[1] * len(region.getbands())
+        self.data = None
+        self.location = None
+        self.queued = False
+
+    @property
+    def nbytes(self):
+        """Occupazione in RAM del passo."""
+        if self.tier == "raw": return self.raw_bytes
+        if self.tier == "compressed": return len(self.data)
+        return 0
+
+    @property
+    def disk_bytes(self):
+        return self.location[1] if self.tier == "disk" else 0
+
+    def _to_image(self, raw):
+        region = Image.frombytes(self.mode, self.size, raw)
+        if self.palette: region.putpalette(self.palette)
+        return region
+
+class _SpillFile:
+    """File temporaneo append-only per i passi più vecchi, compattato quando è pieno di buchi."""
+    def __init__(self):
+        self.file = None
+        self.end = 0
+        self.live_bytes = 0
+
+    def write(self, data):
+        if self.file is None: self.file = tempfile.TemporaryFile(prefix="pyfrg_history_")
+        self.file.seek(self.end)
+        self.file.write(data)
+        location = (self.end, len(data))
+        self.end += len(data)
+        self.live_bytes += len(data)
+        return location
+
+    def read(self, location):
+        offset, length = location
+        self.file.seek(offset)
+        return self.file.read(length)
+
+    def release(self, location):
+        self.live_bytes -= location[1]
+
+    def compact(self, steps):
+        """Riscrive solo i blocchi ancora referenziati dai passi in un nuovo file."""
+        old, self.file, self.end, self.live_bytes = self.file, None, 0, 0
+        for step in steps:
+            old.seek(step.location[0])
+            step.location = self.write(old.read(step.location[1]))
+        old.close()
+
+    def close(self):
+        if self.file is not None: self.file.close()
+        self.file = None
+        self.end = self.live_bytes = 0
 
 class HistoryManager:
-    def __init__(self, max_steps=20):
+    """
+    Cronologia Undo/Redo a delta di regione, con archiviazione a livelli.
+    Ogni passo salva solo il rettangolo modificato (es. l'area di un incollaggio), non l'intera immagine;
+    undo/redo ripristinano la regione sul posto.
+    I passi più recenti (hot_steps) restano non compressi; i più vecchi vengono compressi senza perdita
+    in un thread in background; oltre il budget di RAM (max_bytes) finiscono su un file temporaneo
+    e vengono riletti solo quando si torna indietro fino a loro. Oltre disk_budget si scartano i più vecchi.
+    """
+    def __init__(self, max_bytes=512 * 1024 * 1024, hot_steps=8, disk_budget=4 * 1024 ** 3, background=True):
         self.undo_stack = []
         self.redo_stack = []
-        self.max_steps = max_steps
+        self.max_bytes = max_bytes
+        self.hot_steps = hot_steps
+        self.disk_budget = disk_budget
+        self._spill = _SpillFile()
+        self._lock = threading.RLock()
+        self._jobs = None
+        if background:
+            self._jobs = queue.Queue()
+            threading.Thread(target=self._compress_worker, daemon=True).start()
+
+    @property
+    def used_bytes(self):
+        """Byte occupati in RAM."""
+        with self._lock:
+            return sum(s.nbytes for s in self.undo_stack) + sum(s.nbytes for s in self.redo_stack)
 
-    def push(self, image):
-        """Salva lo stato corrente nello stack di Undo prima di una modifica."""
+    @property
+    def disk_bytes(self):
+        with self._lock:
+            return sum(s.disk_bytes for s in self.undo_stack) + sum(s.disk_bytes for s in self.redo_stack)
+
+    def push(self, image, box=None):
+        """Salva la regione box (tutta l'immagine se None) nello stack di Undo prima di una modifica."""
         if image is None:
             return
-        
-        self.undo_stack.append(image.copy())
-        
-        if len(self.undo_stack) > self.max_steps:
-            self.undo_stack.pop(0)
-            
-        self.redo_stack.clear()
-
-    def undo(self, current_image):
-        """Torna indietro di uno step. Restituisce la vecchia immagine."""
-        if not self.undo_stack:
+
+        box = self._clip_box(image, box)
+        if box is None:
+            return
+
+        with self._lock:
+            self.undo_stack.append(HistoryStep(box, image.crop(box)))
+            for step in self.redo_stack:
+                if step.tier == "disk": self._spill.release(step.location)
+            self.redo_stack.clear()
+            self._age_steps()
+
+    def undo(self, image):
+        """Torna indietro di uno step ripristinando la regione in image. Restituisce il box modificato."""
+        if not self.undo_stack or image is None:
+            return None
+        return self._swap(image, self.undo_stack, self.redo_stack)
+
+    def redo(self, image):
+        """Rifa un'azione annullata. Restituisce il box modificato."""
+        if not self.redo_stack or image is None:
             return None
-        
-        if current_image:
-            self.redo_stack.append(current_image.copy())
-            
-        return self.undo_stack.pop()
-
-    def redo(self, current_image):
-        """Rifa un'azione annullata."""
-        if not self.redo_stack:
+        return self._swap(image, self.redo_stack, self.undo_stack)
+
+    def close(self):
+        """Ferma il thread di compressione e cancella il file di spill."""
+        if self._jobs is not None: self._jobs.put(None)
+        with self._lock:
+            self.undo_stack.clear()
+            self.redo_stack.clear()
+            self._spill.close()
+
+    def _swap(self, image, source, target):
+        with self._lock:
+            step = source.pop()
+            region = self._load(step)
+            # Lo stato attuale della regione diventa il passo opposto
+            target.append(HistoryStep(step.box, image.crop(step.box)))
+            self._age_steps()
+        image.paste(region, step.box[:2])
+        return step.box
+
+    def _load(self, step):
+        """Reidrata il contenuto di un passo (rimosso dagli stack) come immagine PIL."""
+        if step.tier == "raw": return step.region
+        if step.tier == "compressed": return step._to_image(zlib.decompress(step.data))
+        data = self._spill.read(step.location)
+        self._spill.release(step.location)
+        return step._to_image(zlib.decompress(data))
+
+    def _cold_steps(self):
+        """Passi fuori dalla finestra "hot" di entrambi gli stack, dai più lontani dallo stato corrente."""
+        if not self.hot_steps: return self.undo_stack + self.redo_stack
+        return self.undo_stack[:-self.hot_steps] + self.redo_stack[:-self.hot_steps]
+
+    def _age_steps(self):
+        # I passi fuori dalla finestra "hot" vanno compressi (in background se possibile),
+        # anche quelli di Redo: annullando molti passi la cronologia non deve tornare tutta in RAM
+        for step in self._cold_steps():
+            if step.tier != "raw" or step.queued: continue
+            if self._jobs is not None:
+                step.queued = True
+                self._jobs.put(step)
+            else:
+                self._compress(step, zlib.compress(step.region.tobytes(), 1))
+        self._enforce_budget()
+
+    def _compress_worker(self):
+        while True:
+            step = self._jobs.get()
+            if step is None: return
+            # zlib rilascia il GIL: la compressione non blocca l'interfaccia
+            region = step.region
+            if region is not None:
+                data = zlib.compress(region.tobytes(), 1)
+                with self._lock:
+                    if step.tier == "raw" and (step in self.undo_stack or step in self.redo_stack):
+                        self._compress(step, data)
+                        self._enforce_budget()
+
+    def _compress(self, step, data):
+        step.data, step.region, step.tier = data, None, "compressed"
+
+    def _enforce_budget(self):
+        # Oltre il budget di RAM i passi più vecchi (esclusi quelli "hot") passano su disco
+        used = sum(s.nbytes for s in self.undo_stack) + sum(s.nbytes for s in self.redo_stack)
+        for step in self._cold_steps():
+            if used <= self.max_bytes: break
+            if step.tier == "disk": continue
+            used -= step.nbytes
+            data = step.data if step.tier == "compressed" else zlib.compress(step.region.tobytes(), 1)
+            step.location = self._spill.write(data)
+            step.data, step.region, step.tier = None, None, "disk"
+
+        # Oltre il budget su disco si scartano i passi su disco più lontani, prima di Undo poi di Redo
+        # (l'ultimo di ogni stack resta sempre). I passi sono delta di regione: con il passo cade anche
+        # ciò che sta sotto di lui nello stack, che non si potrebbe più ripristinare correttamente.
+        for stack in (self.undo_stack, self.redo_stack):
+            while self._spill.live_bytes > self.disk_budget:
+                oldest = next((i for i, s in enumerate(stack[:-1]) if s.tier == "disk"), None)
+                if oldest is None: break
+                for dropped in stack[:oldest + 1]:
+                    if dropped.tier == "disk": self._spill.release(dropped.location)
+                del stack[:oldest + 1]
+        if self._spill.end > 2 * self._spill.live_bytes + 64 * 1024 * 1024:
+            self._spill.compact([s for s in self.undo_stack + self.redo_stack if s.tier == "disk"])
+
+    @staticmethod
+    def _clip_box(image, box):
+        w, h = image.size
+        if box is None:
+            return (0, 0, w, h)
+        x0, y0, x1, y1 = (int(v) for v in box)
+        x0, y0, x1, y1 = max(0, x0), max(0, y0), min(w, x1), min(h, y1)
+        if x1 <= x0 or y1 <= y0:
             return None
-            
-        if current_image:
-            self.undo_stack.append(current_image.copy())
-            
-        return self.redo_stack.pop()
+        return (x0, y0, x1, y1)
@@ -1,40 +1,59 @@
-from PIL import Image, ImageTk, ExifTags, ImageChops, ImageEnhance, ImageFilter, ImageOps
+from PIL import Image, ImageFilter, ImageOps
 import os
-import exifread
-import io
-import numpy as np
+from core.lazy import lazy_import
+from core.ela_engine import ELAEngine
+from core.copy_move import CopyMoveDetector
+from core.noise_engine import NoiseEngine
+from core.jpeg_ghost import JPEGGhost
+from core.rembg_session import session_pool
+from core.backing_store import open_backing_store
+from core.metadata import metadata_extractor
+
+# Moduli pesanti: caricati al primo uso (o dal riscaldamento in background dopo l'avvio)
+np = lazy_import("numpy")
 
 class ImageProcessor:
+    # Oltre questa soglia i TIFF non compressi si leggono a tile dal disco invece che in RAM
+    BACKING_STORE_PIXELS = 100_000_000
+    # Lato massimo della panoramica in RAM di un backing store
+    OVERVIEW_SIDE = 4096
+    # Thread dei pool interni dei motori di analisi (None = uno per core). I worker di batch.py lo riducono:
+    # con più processi i pool interni moltiplicherebbero i thread per il numero di processi
+    ANALYSIS_WORKERS = None
+
     def __init__(self):
         self.original_image = None
         self.filename = None
         self.format = None
         self.size = None
+        self.metadata = None # core.metadata.MetadataRecord del file caricato
         self.exif_data = {}
+        self._exif_rows = None
 
     @staticmethod
-    def smart_background_remove(image, tolerance=30):
+    def smart_background_remove(image, tolerance=30, model=None, max_side=1024):
         """
-        Rimuove lo sfondo usando AI (rembg/U2-Net) se disponibile.
+        Rimuove lo sfondo usando AI (rembg) se disponibile, con la sessione del modello riutilizzata
+        tra le chiamate (model=None: il modello scelto nel pool). L'inferenza avviene su una copia
+        ridotta a max_side e la maschera viene riportata a piena risoluzione.
         Altrimenti usa un fallback basato sugli angoli.
         """
-        # Lazy import per evitare conflitti all'avvio
-        try:
-            from rembg import remove as rembg_remove
-            HAS_REMBG = True
-        except ImportError:
-            HAS_REMBG = False
-            print("rembg non installato. Installa con 'pip install rembg[cpu]' per il ritaglio intelligente.")
-
-        if HAS_REMBG:
+        if session_pool.available():
             try:
-                # rembg lavora al meglio su immagini intere
-                output = rembg_remove(image)
-                return output
+                return session_pool.remove(image, model, max_side)
             except Exception as e:
                 print(f"Errore rembg: {e}")
-        
+        else:
+            print("rembg non installato. Installa con 'pip install rembg[cpu]' per il ritaglio intelligente.")
+
         # Fallback (Algoritmo Naive NumPy) se rembg manca o fallisce
+        return ImageProcessor.corner_background_remove(image, tolerance)
+
+    @staticmethod
+    def corner_background_remove(image, tolerance=30):
+        """
+        Rimozione sfondo naive (NumPy): rende trasparenti i pixel simili al colore medio degli angoli.
+        """
         try:
             if image.mode != "RGBA":
                 image = image.convert("RGBA")
@@ -85,68 +104,215 @@ class ImageProcessor:
         Esegue l'Error Level Analysis (ELA).
         """
         try:
-            if image.mode != "RGB":
-                image = image.convert("RGB")
+            return ELAEngine.compute(image, quality)
+        except Exception as e:
+            print(f"Errore ELA: {e}")
+            return image
 
-            buffer = io.BytesIO()
-            image.save(buffer, "JPEG", quality=quality)
-            buffer.seek(0)
-            
-            resaved_image = Image.open(buffer)
-            
-            ela_image = ImageChops.difference(image, resaved_image)
-            
-            extrema = ela_image.getextrema()
-            max_diff = max([ex[1] for ex in extrema])
-            if max_diff == 0:
-                max_diff = 1
-            
-            scale = 255.0 / max_diff
-            ela_image = ImageEnhance.Brightness(ela_image).enhance(scale)
-            
-            return ela_image
+    @staticmethod
+    def compute_ela_sweep(image, qualities=(70, 80, 90, 95), normalize=True):
+        """
+        ELA su più qualità JPEG in una sola chiamata (codifiche in parallelo).
+        Restituisce un array NumPy (Q, H, W, 3) oppure None in caso di errore.
+        """
+        try:
+            return ELAEngine.sweep(image, qualities, normalize=normalize, max_workers=ImageProcessor.ANALYSIS_WORKERS)
         except Exception as e:
             print(f"Errore ELA: {e}")
+            return None
+
+    @staticmethod
+    def compute_jpeg_ghost(image, qualities=JPEGGhost.QUALITIES, block=JPEGGhost.BLOCK):
+        """
+        JPEG ghost: ricompressione alle qualità indicate (in parallelo) e minimi delle differenze per blocco.
+        Le regioni compresse in passato a una qualità diversa dal resto vengono colorate (blu = bassa, rosso = alta).
+        """
+        try:
+            return JPEGGhost(image, qualities, block).run(max_workers=ImageProcessor.ANALYSIS_WORKERS).render()
+        except Exception as e:
+            print(f"Errore JPEG ghost: {e}")
             return image
 
-    def load_image(self, path):
-        """Carica un'immagine e ne salva i metadati di base."""
+    @staticmethod
+    def compute_noise(image, kind="map"):
+        """
+        Analisi del rumore: "map" = livello di rumore locale (deviazione standard del residuo),
+        "residual" = residuo del denoising amplificato attorno al grigio medio.
+        """
+        try:
+            return NoiseEngine.render(NoiseEngine.compute(image, kind, max_workers=ImageProcessor.ANALYSIS_WORKERS), kind)
+        except Exception as e:
+            print(f"Errore analisi rumore: {e}")
+            return image
+
+    @staticmethod
+    def detect_copy_move(image, **params):
+        """
+        Rilevamento copy-move: restituisce una heatmap (immagine in grigio con le regioni duplicate in rosso).
+        params vengono passati a CopyMoveDetector (block_size, stride, min_count, ...).
+        """
+        try:
+            params.setdefault("max_workers", ImageProcessor.ANALYSIS_WORKERS)
+            detector = CopyMoveDetector(**params)
+            return detector.render(image, detector.detect(image))
+        except Exception as e:
+            print(f"Errore Copy-Move: {e}")
+            return image
+
+    @staticmethod
+    def run_analysis(img, analysis_mode):
+        """
+        Analisi della pipeline di visualizzazione chiamando direttamente i motori:
+        a differenza di compute_ela & co. gli errori non vengono intercettati.
+        """
+        workers = ImageProcessor.ANALYSIS_WORKERS
+        if analysis_mode == "Equalize": return ImageOps.equalize(img.convert("RGB"))
+        if analysis_mode == "Edge": return img.convert("RGB").filter(ImageFilter.FIND_EDGES)
+        if analysis_mode == "ELA": return ELAEngine.compute(img)
+        if analysis_mode == "Noise": return NoiseEngine.render(NoiseEngine.compute(img, max_workers=workers))
+        if analysis_mode == "Ghost": return JPEGGhost(img).run(max_workers=workers).render()
+        if analysis_mode == "CopyMove":
+            detector = CopyMoveDetector(max_workers=workers)
+            return detector.render(img, detector.detect(img))
+        raise ValueError(f"Analisi sconosciuta: {analysis_mode}")
+
+    @staticmethod
+    def apply_view_filters(img, channel_mode="RGB", is_inverted=False, analysis_mode="Normal", strict=False):
+        """
+        Applica la pipeline di visualizzazione (canale, negativo, analisi) a un'immagine.
+        Non dipende dalla GUI: la usano il canvas (anche su singoli tile) e gli script headless.
+        Di norma un passo che fallisce viene saltato (la vista resta utilizzabile); con strict=True
+        l'eccezione si propaga, così batch.py non salva come riuscita un'analisi fallita.
+        """
+        img_to_process = img.convert("RGB") if img.mode not in ["RGB", "RGBA"] else img.copy()
+        mode = channel_mode
+        try:
+            if mode in ["R", "G", "B"]:
+                r, g, b = img_to_process.convert("RGB").split()
+                zero = Image.new("L", r.size, 0)
+                if mode == "R": img_to_process = Image.merge("RGB", (r, zero, zero))
+                elif mode == "G": img_to_process = Image.merge("RGB", (zero, g, zero))
+                elif mode == "B": img_to_process = Image.merge("RGB", (zero, zero, b))
+            elif mode in ["H", "S", "V"]:
+                h, s, v = img_to_process.convert("HSV").split()
+                if mode == "H": img_to_process = h.convert("RGB")
+                elif mode == "S": img_to_process = s.convert("RGB")
+                elif mode == "V": img_to_process = v.convert("RGB")
+            elif mode in ["YCbCr", "Y", "Cb", "Cr"]:
+                y, cb, cr = img_to_process.convert("YCbCr").split()
+                if mode == "YCbCr": img_to_process = Image.merge("RGB", (y, cb, cr))
+                elif mode == "Y": img_to_process = y.convert("RGB")
+                elif mode == "Cb": img_to_process = cb.convert("RGB")
+                elif mode == "Cr": img_to_process = cr.convert("RGB")
+            elif mode == "L": img_to_process = img_to_process.convert("L").convert("RGB")
+        except:
+            if strict: raise
+
+        if is_inverted:
+            try: img_to_process = ImageOps.invert(img_to_process.convert("RGB"))
+            except:
+                if strict: raise
+
+        if analysis_mode != "Normal":
+            try: img_to_process = ImageProcessor.run_analysis(img_to_process, analysis_mode)
+            except Exception as e:
+                if strict: raise
+                print(f"Errore analisi {analysis_mode}: {e}")
+        return img_to_process
+
+    @staticmethod
+    def view_filter_halo(analysis_mode):
+        """
+        Bordo (in pixel) che un tile deve avere per essere filtrato in modo indipendente.
+        None indica un'analisi globale (istogramma, normalizzazione ELA, JPEG ghost, copy-move) da calcolare sull'intera immagine.
+        """
+        if analysis_mode == "Normal": return 0
+        if analysis_mode == "Edge": return 1
+        if analysis_mode == "Noise": return NoiseEngine.HALO
+        return None
+
+    def load_image(self, path, metadata=True):
+        """
+        Carica un'immagine e ne salva i metadati di base. Con metadata=False i metadati completi
+        (lettura e impronta dell'intero file) restano da estrarre: vedi set_metadata.
+        """
         try:
             self.original_image = Image.open(path)
             self.filename = os.path.basename(path)
             self.format = self.original_image.format
             self.size = self.original_image.size
-            self.exif_data = {}
-            
-            try:
-                with open(path, 'rb') as f:
-                    tags = exifread.process_file(f, details=False)
-                    if tags:
-                        self.exif_data = tags
-            except Exception: pass
-
-            if not self.exif_data and hasattr(self.original_image, '_getexif'):
-                try:
-                    exif = self.original_image._getexif()
-                    if exif:
-                        for tag_id, value in exif.items():
-                            tag_name = ExifTags.TAGS.get(tag_id, tag_id)
-                            self.exif_data[str(tag_name)] = value
-                except Exception: pass
-            
-            self.exif_data["Format"] = self.format
-            self.exif_data["Size"] = f"{self.size[0]}x{self.size[1]}"
-            self.exif_data["Mode"] = self.original_image.mode
+            self.metadata = metadata_extractor.extract(path) if metadata else None
+            self._set_exif_data(self.original_image.mode)
 
             return self.original_image
         except Exception as e:
             print(f"Errore caricamento immagine: {e}")
             return None
 
+    def set_metadata(self, record):
+        """Completa i metadati dell'immagine corrente con un MetadataRecord estratto a parte (es. in background)."""
+        self.metadata = record
+        self._set_exif_data(self.exif_data.get("Mode"))
+
+    def _set_exif_data(self, mode):
+        self.exif_data = dict(self.metadata.tags()) if self.metadata else {}
+        self.exif_data["Format"] = self.format
+        self.exif_data["Size"] = f"{self.size[0]}x{self.size[1]}"
+        self.exif_data["Mode"] = mode
+        self._exif_rows = None
+
+    @staticmethod
+    def open_backing_store(path, min_pixels=None):
+        """
+        Backing store su disco (memory-mapped) per le immagini troppo grandi per la RAM:
+        file .npy e TIFF/BigTIFF non compressi oltre min_pixels. None se il file va caricato normalmente.
+        """
+        ext = os.path.splitext(path)[1].lower()
+        if ext not in (".npy", ".tif", ".tiff"): return None
+        try:
+            store = open_backing_store(path)
+        except Exception:
+            return None
+        if min_pixels is None: min_pixels = ImageProcessor.BACKING_STORE_PIXELS
+        if ext != ".npy" and store.width * store.height < min_pixels:
+            store.close()
+            return None
+        return store
+
+    def load_backing_store(self, path, store, metadata=True):
+        """Metadati di base di un'immagine aperta come backing store (i pixel restano su disco)."""
+        self.original_image = None
+        self.filename = os.path.basename(path)
+        self.format = "NPY" if path.lower().endswith(".npy") else "TIFF"
+        self.size = store.size
+        self.metadata = metadata_extractor.extract(path) if metadata and self.format == "TIFF" else None
+        self._set_exif_data(f"{store.mode} ({store.dtype.itemsize * 8} bit, memory-mapped)")
+
+    @staticmethod
+    def load_draft(path, max_side=1600):
+        """
+        Anteprima veloce di un JPEG grande: decodifica a scala ridotta (1/2, 1/4 o 1/8) tramite lo scaling
+        DCT di libjpeg (Image.draft), senza mai decodificare l'immagine intera.
+        Restituisce (anteprima, fattore rispetto alla piena risoluzione), oppure None se il file non è un JPEG
+        o è abbastanza piccolo da caricarlo direttamente.
+        """
+        try:
+            img = Image.open(path)
+            w, h = img.size
+            if img.format != "JPEG" or max(w, h) < 2 * max_side: return None
+            ratio = max_side / max(w, h)
+            if not img.draft(img.mode, (max(1, int(w * ratio)), max(1, int(h * ratio)))): return None
+            img.load()
+            return img, w / img.size[0]
+        except Exception as e:
+            print(f"Errore anteprima draft: {e}")
+            return None
+
     def get_formatted_exif(self):
-        """Restituisce una lista di tuple (Tag, Valore) per la UI."""
+        """Restituisce una lista di tuple (Tag, Valore) per la UI (calcolata una volta per immagine)."""
         if not self.exif_data:
             return [("Info", "Nessun metadato EXIF trovato/supportato")]
+        if self._exif_rows is not None: return self._exif_rows
         
         result = []
         for tag, val in self.exif_data.items():
@@ -164,4 +330,5 @@ class ImageProcessor:
             result.append((label, val_str))
         
         result.sort(key=lambda x: x[0])
+        self._exif_rows = result
         return result
\ No newline at end of file
@@ -0,0 +1,44 @@
+import threading
+
+class ImagePyramid:
+    """
+    Piramide multi-risoluzione (mipmap) di un'immagine.
+    Il livello k è l'immagine ridotta di 2**k con Image.reduce (media a box, quindi senza aliasing).
+    I livelli vengono costruiti in background: finché non sono pronti si usa il migliore disponibile.
+    """
+    def __init__(self, image, min_size=256):
+        self.levels = [image]
+        self.min_size = min_size
+        self.ready = False
+        self.cancelled = False
+
+    def build(self):
+        img = self.levels[0]
+        while max(img.size) > self.min_size and min(img.size) >= 2:
+            if self.cancelled: return
+            img = img.reduce(2)
+            self.levels.append(img)
+        self.ready = True
+
+    def build_async(self, on_done=None):
+        """Costruisce i livelli in un thread daemon; on_done viene chiamata dal thread a fine lavoro."""
+        def task():
+            try: self.build()
+            except Exception as e: print(f"Errore piramide: {e}")
+            if on_done and not self.cancelled: on_done(self)
+        threading.Thread(target=task, daemon=True).start()
+        return self
+
+    def cancel(self):
+        self.cancelled = True
+
+    def level_for_scale(self, scale):
+        """
+        Restituisce (immagine_livello, fattore): il livello più piccolo la cui risoluzione
+        è ancora >= a quella richiesta da scale. Va renderizzato con scale * fattore.
+        """
+        levels = self.levels
+        k = 0
+        while k + 1 < len(levels) and scale * (2 ** (k + 1)) <= 1.0:
+            k += 1
+        return levels[k], 2 ** k
@@ -0,0 +1,167 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import os
+import threading
+from PIL import Image
+from core.lazy import lazy_import
+from core.ela_engine import ELAEngine
+
+np = lazy_import("numpy")
+
+class JPEGGhost:
+    """
+    JPEG ghost: l'immagine viene ricompressa a una serie di qualità e per ogni qualità si calcola
+    la differenza quadratica media su blocchi BLOCK x BLOCK. Una regione già compressa in passato
+    a una qualità q ha una differenza molto più bassa del resto dell'immagine quando si ricomprime a q
+    (il "fantasma"): i minimi per blocco indicano dove e a quale qualità.
+    Le qualità vengono elaborate in un pool di thread (encoder/decoder di PIL e NumPy rilasciano il GIL)
+    a partire da un unico array sorgente condiviso in sola lettura; ogni qualità finita è subito
+    disponibile (on_progress), quindi la vista si può aggiornare mentre il calcolo prosegue.
+    """
+    QUALITIES = tuple(range(50, 101, 5))
+    BLOCK = 16
+    BAND_ROWS = 256 # righe elaborate alla volta: la memoria temporanea non dipende dall'altezza
+    MIN_ENERGY = 0.5 # sotto questa differenza media il blocco è piatto e non dice nulla
+    Z_MIN, Z_RANGE = 1.5, 3.0 # scarto dalla curva tipica (in MAD) da cui il blocco inizia a colorarsi / è pieno
+
+    def __init__(self, image, qualities=QUALITIES, block=BLOCK):
+        if image.mode != "RGB": image = image.convert("RGB")
+        self.image = image
+        self.source = np.asarray(image) # decodifica condivisa tra i thread
+        self.qualities = np.array(sorted(set(int(q) for q in qualities)), dtype=np.int32)
+        if not len(self.qualities): raise ValueError("Nessuna qualità JPEG da analizzare")
+        self.block = int(block)
+        h, w = self.source.shape[:2]
+        self.grid = (-(-h // self.block), -(-w // self.block))
+        self.differences = np.zeros((len(self.qualities),) + self.grid, dtype=np.float32)
+        self.done = np.zeros(len(self.qualities), dtype=bool)
+        self.cancelled = False
+        self.ready = False
+        self._lock = threading.Lock()
+        self._minima = None # (numero di qualità finite, qualità, intensità)
+
+    def block_differences(self, quality):
+        """Differenza quadratica media (per pixel e canale) tra sorgente e ricompressione a quality, per blocco."""
+        decoded = ELAEngine.roundtrip(self.image, quality, shared=True)
+        b = self.block
+        h, w = self.source.shape[:2]
+        # Righe viste come w * 3 campioni: i canali si sommano insieme alle colonne del blocco
+        col_starts = np.arange(0, w, b) * 3
+        col_sizes = np.diff(np.append(col_starts, w * 3))
+        out = np.empty(self.grid, dtype=np.float32)
+        band = max(b, self.BAND_ROWS // b * b)
+        for y0 in range(0, h, band):
+            y1 = min(h, y0 + band)
+            energy = ELAEngine.abs_diff(self.source[y0:y1], decoded[y0:y1]).astype(np.uint16).reshape(y1 - y0, w * 3)
+            energy *= energy
+            # Somma delle righe di ogni blocco (l'ultimo blocco in basso può essere più basso)
+            full = (y1 - y0) // b * b
+            rows = [energy[:full].reshape(-1, b, w * 3).sum(axis=1, dtype=np.uint32)]
+            row_sizes = [b] * (full // b)
+            if full < y1 - y0:
+                rows.append(energy[full:].sum(axis=0, dtype=np.uint32)[None])
+                row_sizes.append(y1 - y0 - full)
+            rows = rows[0] if len(rows) == 1 else np.concatenate(rows)
+            sums = np.add.reduceat(rows, col_starts, axis=1)
+            out[y0 // b:y0 // b + len(row_sizes)] = sums / np.outer(row_sizes, col_sizes)
+        return out
+
+    def run(self, max_workers=None, on_progress=None):
+        """
+        Calcola tutte le qualità. on_progress(self) viene chiamata dal thread di lavoro
+        dopo ogni qualità completata (i risultati parziali sono già leggibili).
+        """
+        def one(index):
+            if self.cancelled: return index, None
+            return index, self.block_differences(int(self.qualities[index]))
+
+        workers = min(len(self.qualities), max_workers or os.cpu_count() or 1)
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(one, i) for i in range(len(self.qualities))]
+            for future in as_completed(futures):
+                index, blocks = future.result()
+                if blocks is None or self.cancelled: continue
+                with self._lock:
+                    self.differences[index] = blocks
+                    self.done[index] = True
+                if on_progress: on_progress(self)
+        self.ready = not self.cancelled
+        return self
+
+    def run_async(self, on_progress=None, on_done=None):
+        """Come run() in un thread daemon; on_done(self) viene chiamata dal thread a fine lavoro."""
+        def task():
+            try: self.run(on_progress=on_progress)
+            except Exception as e: print(f"Errore JPEG ghost: {e}")
+            if on_done and not self.cancelled: on_done(self)
+        threading.Thread(target=task, daemon=True).start()
+        return self
+
+    def cancel(self):
+        self.cancelled = True
+
+    @property
+    def progress(self):
+        return int(self.done.sum())
+
+    def minima(self):
+        """
+        (qualità, intensità) per blocco, sulle qualità finite finora.
+        Ogni curva differenza/qualità viene divisa per la sua media (conta la forma, non il contenuto
+        del blocco) e confrontata con la curva mediana dell'immagine, in unità di deviazione robusta (MAD)
+        e mediata su 3x3 blocchi (un fantasma è una regione, non un blocco isolato). La qualità è quella
+        dove il blocco scende di più sotto la mediana, l'intensità (0..1) quanto ci scende.
+        """
+        with self._lock:
+            count = self.progress
+            if self._minima is not None and self._minima[0] == count: return self._minima[1:]
+            index = np.flatnonzero(self.done)
+            d = self.differences[index]
+        if count == 0: return None, None
+
+        energy = d.mean(axis=0)
+        shape = d / np.maximum(energy, 1e-6)
+        flat = shape.reshape(count, -1)
+        typical = np.median(flat, axis=1)
+        spread = np.median(np.abs(flat - typical[:, None]), axis=1) * 1.4826
+        z = (typical[:, None, None] - shape) / np.maximum(spread, 1e-6)[:, None, None]
+        z[:, energy < self.MIN_ENERGY] = 0
+        gh, gw = self.grid
+        padded = np.pad(z, ((0, 0), (1, 1), (1, 1)), mode="edge")
+        z = sum(padded[:, i:i + gh, j:j + gw] for i in range(3) for j in range(3)) / 9
+
+        best = z.argmax(axis=0)
+        quality = self.qualities[index][best]
+        score = np.take_along_axis(z, best[None], axis=0)[0]
+        strength = np.clip((score - self.Z_MIN) / self.Z_RANGE, 0, 1).astype(np.float32)
+        self._minima = (count, quality, strength)
+        return quality, strength
+
+    def block_at(self, x, y):
+        """(qualità, intensità) del blocco che contiene il pixel (x, y), oppure None."""
+        quality, strength = self.minima()
+        if quality is None: return None
+        by, bx = int(y) // self.block, int(x) // self.block
+        if not (0 <= by < self.grid[0] and 0 <= bx < self.grid[1]): return None
+        return int(quality[by, bx]), float(strength[by, bx])
+
+    def render(self):
+        """
+        Visualizzazione: immagine in grigio attenuata con i blocchi fantasma colorati in base
+        alla qualità del minimo (blu = bassa, rosso = alta) e tanto più opachi quanto più marcati.
+        """
+        gray = self.image.convert("L").point(lambda v: v // 2).convert("RGB")
+        quality, strength = self.minima()
+        if quality is None: return gray
+        q0, q1 = int(self.qualities[0]), int(self.qualities[-1])
+        t = (quality - q0) / max(1, q1 - q0)
+        colors = np.empty(self.grid + (3,), dtype=np.uint8)
+        colors[:, :, 0] = 255 * t
+        colors[:, :, 1] = 64
+        colors[:, :, 2] = 255 * (1 - t)
+        alpha = (strength * 255).astype(np.uint8)
+        # Mappe a risoluzione di blocco ingrandite senza interpolazione, poi ritagliate
+        size = (self.grid[1] * self.block, self.grid[0] * self.block)
+        box = (0, 0) + self.image.size
+        overlay = Image.fromarray(colors).resize(size, Image.Resampling.NEAREST).crop(box)
+        mask = Image.fromarray(alpha, "L").resize(size, Image.Resampling.NEAREST).crop(box)
+        return Image.composite(overlay, gray, mask)
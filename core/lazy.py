@@ -0,0 +1,69 @@
+import importlib
+import importlib.util
+import sys
+import threading
+import time
+
+# Nome modulo -> millisecondi impiegati dall'import (al primo uso o durante il riscaldamento)
+import_times = {}
+
+def load(name):
+    """Importa (o restituisce se già caricato) il modulo name, registrando il tempo del primo import."""
+    already = name in sys.modules
+    t0 = time.perf_counter()
+    # import_module attende un eventuale import dello stesso modulo in corso in un altro thread
+    module = importlib.import_module(name)
+    if not already: import_times.setdefault(name, round((time.perf_counter() - t0) * 1000, 1))
+    return module
+
+def is_available(name):
+    """True se il modulo è installato (senza importarlo)."""
+    try:
+        return importlib.util.find_spec(name) is not None
+    except (ImportError, ValueError):
+        return False
+
+class LazyModule:
+    """
+    Segnaposto di un modulo pesante: l'import avviene al primo accesso a un attributo.
+    Dopo il caricamento gli attributi del modulo vengono copiati nel segnaposto,
+    così gli accessi successivi (es. np.asarray nei cicli caldi) non passano più da __getattr__.
+    """
+    def __init__(self, name):
+        self.__dict__["_lazy_name"] = name
+
+    def _load(self):
+        module = load(self._lazy_name)
+        self.__dict__.update(module.__dict__)
+        return module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __repr__(self):
+        state = "caricato" if self._lazy_name in sys.modules else "non caricato"
+        return f"<modulo pigro {self._lazy_name} ({state})>"
+
+def lazy_import(name):
+    """Restituisce il modulo se è già caricato, altrimenti un segnaposto che lo importa al primo uso."""
+    return sys.modules.get(name) or LazyModule(name)
+
+def warm_up(names, on_done=None):
+    """
+    Importa i moduli names in un thread daemon (es. dopo la comparsa della finestra), così il primo uso
+    della funzionalità che li richiede non paga l'import. I moduli non installati vengono saltati.
+    on_done(times) viene chiamata dal thread a fine lavoro con i tempi dei moduli importati.
+    """
+    def task():
+        times = {}
+        for name in names:
+            if not is_available(name.split(".")[0]): continue
+            try:
+                load(name)
+                times[name] = import_times.get(name, 0.0)
+            except Exception as e:
+                print(f"Riscaldamento di {name} fallito: {e}")
+        if on_done: on_done(times)
+    thread = threading.Thread(target=task, daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,283 @@
+import hashlib
+import html
+import io
+import os
+import re
+import struct
+from PIL import Image, ExifTags
+from core.lazy import lazy_import
+from core.render_cache import LRUByteCache
+
+exifread = lazy_import("exifread")
+
+# Dataset IPTC-IIM del record 2 (Application Record) più comuni
+IPTC_NAMES = {
+    5: "ObjectName", 15: "Category", 20: "SupplementalCategories", 25: "Keywords",
+    40: "SpecialInstructions", 55: "DateCreated", 60: "TimeCreated", 62: "DigitalCreationDate",
+    63: "DigitalCreationTime", 65: "OriginatingProgram", 70: "ProgramVersion", 80: "By-line",
+    85: "By-lineTitle", 90: "City", 92: "Sub-location", 95: "Province-State",
+    101: "Country-PrimaryLocationName", 103: "OriginalTransmissionReference", 105: "Headline",
+    110: "Credit", 115: "Source", 116: "CopyrightNotice", 120: "Caption-Abstract", 122: "Writer-Editor",
+}
+
+# Tabella di quantizzazione della luminanza IJG (qualità 50), in ordine zig-zag come nel file
+IJG_LUMINANCE = (
+    16, 11, 12, 14, 12, 10, 16, 14, 13, 14, 18, 17, 16, 19, 24, 40,
+    26, 24, 22, 22, 24, 49, 35, 37, 29, 40, 58, 51, 61, 60, 57, 51,
+    56, 55, 64, 72, 92, 78, 64, 68, 87, 69, 55, 56, 80, 109, 81, 87,
+    95, 98, 103, 104, 103, 62, 77, 113, 121, 112, 100, 120, 92, 101, 103, 99,
+)
+
+XMP_HEADER = b"http://ns.adobe.com/xap/1.0/\x00"
+PHOTOSHOP_HEADER = b"Photoshop 3.0\x00"
+
+class MetadataRecord:
+    """
+    Metadati di un file immagine letti dai soli byte, senza decodificare i pixel:
+    EXIF (come stringhe stampabili), XMP, IPTC, tabelle di quantizzazione e segmenti JPEG,
+    posizione della miniatura EXIF nel file. to_dict() lo rende serializzabile in JSON.
+    """
+    def __init__(self, sha1, file_size):
+        self.sha1 = sha1
+        self.file_size = file_size
+        self.format = None
+        self.size = None
+        self.mode = None
+        self.exif = {}          # "IFD Tag" -> valore (come exifread)
+        self.xmp = {}           # "prefisso:Nome" -> valore
+        self.xmp_packet = None  # XML grezzo del pacchetto XMP
+        self.iptc = {}
+        self.quantization = {}  # id tabella -> 64 coefficienti in ordine zig-zag
+        self.jpeg_frame = None  # SOF: processo, precisione, componenti con campionamento
+        self.segments = []      # (marker, offset, lunghezza) dei segmenti JPEG prima dei dati
+        self.thumbnail = None   # {"offset": offset assoluto nel file, "length": byte}
+        self._tags = None
+
+    @property
+    def nbytes(self):
+        """Stima grossolana dell'occupazione, per il budget della cache."""
+        n = len(self.xmp_packet or "") + 64 * 8 * len(self.quantization) + 32 * len(self.segments)
+        return n + sum(len(k) + len(v) for d in (self.exif, self.xmp, self.iptc) for k, v in d.items()) + 512
+
+    def jpeg_quality(self):
+        """Qualità JPEG stimata (scala IJG 1-100) dalla tabella di luminanza, None se non è un JPEG."""
+        table = self.quantization.get(0)
+        if not table: return None
+        scale = 100.0 * sum(q / s for q, s in zip(table, IJG_LUMINANCE)) / 64
+        quality = (200 - scale) / 2 if scale <= 100 else 5000 / scale
+        return int(round(min(100, max(1, quality))))
+
+    def thumbnail_bytes(self, data):
+        """Byte della miniatura EXIF presi dai byte del file (data)."""
+        if not self.thumbnail: return None
+        start = self.thumbnail["offset"]
+        return bytes(data[start:start + self.thumbnail["length"]])
+
+    def tags(self):
+        """Tutti i tag in un unico dizionario piatto (EXIF, "XMP ...", "IPTC ..."), calcolato una volta."""
+        if self._tags is None:
+            tags = dict(self.exif)
+            tags.update((f"XMP {k}", v) for k, v in self.xmp.items())
+            tags.update((f"IPTC {k}", v) for k, v in self.iptc.items())
+            quality = self.jpeg_quality()
+            if quality is not None: tags["JPEG Quality (estimated)"] = str(quality)
+            if self.jpeg_frame:
+                tags["JPEG Process"] = self.jpeg_frame["process"]
+                tags["JPEG Subsampling"] = self.jpeg_frame["subsampling"]
+            self._tags = tags
+        return self._tags
+
+    def to_dict(self):
+        return {
+            "sha1": self.sha1, "file_size": self.file_size, "format": self.format,
+            "size": list(self.size) if self.size else None, "mode": self.mode,
+            "exif": self.exif, "xmp": self.xmp, "iptc": self.iptc,
+            "quantization": {str(k): v for k, v in self.quantization.items()},
+            "jpeg_quality": self.jpeg_quality(), "jpeg_frame": self.jpeg_frame,
+            "segments": [list(s) for s in self.segments], "thumbnail": self.thumbnail,
+        }
+
+class MetadataExtractor:
+    """
+    Estrae i metadati in una sola lettura del file e una sola passata sui byte: i segmenti JPEG
+    vengono scorsi una volta (EXIF, XMP, IPTC, DQT, SOF), exifread lavora sugli stessi byte in memoria.
+    I risultati restano in cache per impronta del contenuto (sha1), quindi riaprire lo stesso file
+    (anche con un altro nome) non rilegge nulla. Dei file oltre max_read si legge solo la parte
+    iniziale: l'impronta è calcolata su quella più la dimensione del file.
+    """
+    def __init__(self, max_bytes=32 * 1024 * 1024, max_read=64 * 1024 * 1024):
+        self.max_read = max_read
+        self._cache = LRUByteCache(max_bytes=max_bytes)
+
+    def extract(self, path=None, data=None):
+        """MetadataRecord del file path (o dei suoi byte data, se già letti)."""
+        if data is not None:
+            return self._extract(data, len(data), None)
+        with open(path, "rb") as f:
+            file_size = os.fstat(f.fileno()).st_size
+            data = f.read(self.max_read)
+            # File troppo grande per essere letto: exifread segue le IFD direttamente sul file
+            return self._extract(data, file_size, f if len(data) < file_size else None)
+
+    def _extract(self, data, file_size, fh):
+        key = (hashlib.sha1(data).hexdigest(), file_size)
+        record = self._cache.get(key)
+        if record is not None: return record
+        record = MetadataRecord(key[0], file_size)
+        self._parse(data, record, fh)
+        return self._cache.put(key, record, nbytes=record.nbytes)
+
+    def clear(self):
+        self._cache.clear()
+
+    def _parse(self, data, record, fh):
+        view = memoryview(data)
+        tiff_start = None
+        if data[:2] == b"\xff\xd8":
+            tiff_start = self._scan_jpeg(view, record)
+        elif data[:4] in (b"II*\x00", b"MM\x00*", b"II+\x00", b"MM\x00+"):
+            tiff_start = 0
+
+        # Intestazione PIL: formato, dimensioni e modo senza decodificare i pixel
+        image = None
+        try:
+            image = Image.open(io.BytesIO(data))
+            record.format, record.size, record.mode = image.format, image.size, image.mode
+        except Exception:
+            if tiff_start == 0: record.format = "TIFF"
+
+        raw = {}
+        try:
+            raw = exifread.process_file(fh or io.BytesIO(data), details=False, extract_thumbnail=False)
+        except Exception: pass
+        for tag, value in raw.items():
+            record.exif[tag] = str(value)
+        if tiff_start is not None:
+            record.thumbnail = self._thumbnail(raw, tiff_start)
+
+        if not record.exif and image is not None:
+            try:
+                for tag_id, value in image.getexif().items():
+                    record.exif[str(ExifTags.TAGS.get(tag_id, tag_id))] = str(value)
+            except Exception: pass
+
+        if record.xmp_packet is None:
+            # PNG (iTXt), TIFF (tag 700), WebP: il pacchetto XMP è XML in chiaro nel file
+            start = data.find(b"<x:xmpmeta")
+            if start >= 0:
+                end = data.find(b"</x:xmpmeta>", start)
+                if end > 0: record.xmp_packet = bytes(view[start:end + 12]).decode("utf-8", "replace")
+        if record.xmp_packet: record.xmp = self._parse_xmp(record.xmp_packet)
+
+    def _scan_jpeg(self, view, record):
+        """Scorre i segmenti fino a SOS; restituisce l'offset dell'intestazione TIFF dell'EXIF (o None)."""
+        tiff_start = None
+        pos, n = 2, len(view)
+        while pos + 4 <= n:
+            if view[pos] != 0xFF: break
+            marker = view[pos + 1]
+            # Byte di riempimento e marker senza lunghezza
+            if marker == 0xFF: pos += 1; continue
+            if marker == 0x01 or 0xD0 <= marker <= 0xD8: pos += 2; continue
+            if marker == 0xD9: break
+            length = struct.unpack(">H", view[pos + 2:pos + 4])[0]
+            start, end = pos + 4, pos + 2 + length
+            payload = view[start:end]
+            record.segments.append((f"FF{marker:02X}", pos, length + 2))
+
+            if marker == 0xE1 and payload[:6] == b"Exif\x00\x00":
+                if tiff_start is None: tiff_start = start + 6
+            elif marker == 0xE1 and payload[:len(XMP_HEADER)] == XMP_HEADER:
+                record.xmp_packet = bytes(payload[len(XMP_HEADER):]).decode("utf-8", "replace")
+            elif marker == 0xED and payload[:len(PHOTOSHOP_HEADER)] == PHOTOSHOP_HEADER:
+                self._parse_photoshop(payload[len(PHOTOSHOP_HEADER):], record)
+            elif marker == 0xDB:
+                self._parse_dqt(payload, record)
+            elif 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+                self._parse_sof(marker, payload, record)
+            elif marker == 0xDA:
+                # Inizio dei dati compressi: i metadati sono tutti prima
+                break
+            pos = end
+        return tiff_start
+
+    @staticmethod
+    def _parse_dqt(payload, record):
+        i = 0
+        while i < len(payload):
+            precision, table_id = payload[i] >> 4, payload[i] & 0x0F
+            if precision:
+                record.quantization[table_id] = list(struct.unpack(">64H", payload[i + 1:i + 129]))
+                i += 129
+            else:
+                record.quantization[table_id] = list(payload[i + 1:i + 65])
+                i += 65
+
+    @staticmethod
+    def _parse_sof(marker, payload, record):
+        precision, height, width, count = struct.unpack(">BHHB", payload[:6])
+        components = []
+        for c in range(count):
+            cid, sampling, table = payload[6 + 3 * c:9 + 3 * c]
+            components.append({"id": cid, "h": sampling >> 4, "v": sampling & 0x0F, "table": table})
+        process = "Progressive" if marker in (0xC2, 0xC6, 0xCA, 0xCE) else "Baseline" if marker == 0xC0 else "Extended"
+        subsampling = "x".join(f"{c['h']}{c['v']}" for c in components)
+        record.jpeg_frame = {"process": process, "precision": precision, "size": [width, height],
+                             "components": components, "subsampling": subsampling}
+
+    @staticmethod
+    def _parse_photoshop(payload, record):
+        """Risorse 8BIM di APP13: la 0x0404 contiene i dataset IPTC-IIM."""
+        i, n = 0, len(payload)
+        while i + 12 <= n and payload[i:i + 4] == b"8BIM":
+            resource_id = struct.unpack(">H", payload[i + 4:i + 6])[0]
+            name_len = payload[i + 6]
+            # Nome Pascal (byte di lunghezza incluso) allineato a due byte
+            i += 6 + name_len + 1 + ((name_len + 1) & 1)
+            if i + 4 > n: break
+            size = struct.unpack(">I", payload[i:i + 4])[0]
+            block = payload[i + 4:i + 4 + size]
+            if resource_id == 0x0404: MetadataExtractor._parse_iptc(block, record)
+            i += 4 + size + (size & 1)
+
+    @staticmethod
+    def _parse_iptc(block, record):
+        i, n = 0, len(block)
+        while i + 5 <= n and block[i] == 0x1C:
+            rec, dataset = block[i + 1], block[i + 2]
+            size = struct.unpack(">H", block[i + 3:i + 5])[0]
+            # Dataset estesi (bit alto della lunghezza): non usati dai campi testuali
+            if size & 0x8000: break
+            value = bytes(block[i + 5:i + 5 + size])
+            i += 5 + size
+            if rec != 2 or dataset == 0: continue
+            name = IPTC_NAMES.get(dataset, f"2:{dataset}")
+            text = value.decode("utf-8", "replace").strip("\x00")
+            record.iptc[name] = f"{record.iptc[name]}; {text}" if name in record.iptc else text
+
+    @staticmethod
+    def _thumbnail(raw, tiff_start):
+        offset = raw.get("Thumbnail JPEGInterchangeFormat")
+        length = raw.get("Thumbnail JPEGInterchangeFormatLength")
+        if offset is None or length is None: return None
+        try:
+            return {"offset": tiff_start + int(offset.values[0]), "length": int(length.values[0])}
+        except Exception:
+            return None
+
+    @staticmethod
+    def _parse_xmp(packet):
+        """Proprietà semplici del pacchetto XMP: attributi, elementi di testo e liste rdf:Seq/Bag/Alt."""
+        props = {}
+        skip = ("xmlns", "rdf", "x", "xml")
+        for prefix, name, value in re.findall(r'([A-Za-z][\w.-]*):([A-Za-z][\w.-]*)="([^"]*)"', packet):
+            if prefix not in skip: props[f"{prefix}:{name}"] = html.unescape(value)
+        for prefix, name, value in re.findall(r"<([A-Za-z][\w.-]*):([A-Za-z][\w.-]*)(?:\s[^>]*)?>([^<]+)</\1:\2>", packet):
+            if prefix not in skip and value.strip(): props[f"{prefix}:{name}"] = html.unescape(value.strip())
+        for prefix, name, body in re.findall(r"<([A-Za-z][\w.-]*):([A-Za-z][\w.-]*)>\s*<rdf:(?:Seq|Bag|Alt)>(.*?)</rdf:(?:Seq|Bag|Alt)>\s*</\1:\2>",
+                                             packet, re.S):
+            items = [html.unescape(v.strip()) for v in re.findall(r"<rdf:li[^>]*>([^<]*)</rdf:li>", body)]
+            if prefix not in skip and items: props[f"{prefix}:{name}"] = "; ".join(items)
+        return props
+
+metadata_extractor = MetadataExtractor()
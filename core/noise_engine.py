@@ -0,0 +1,96 @@
+from concurrent.futures import ThreadPoolExecutor
+import os
+from PIL import Image
+from core.lazy import lazy_import
+
+np = lazy_import("numpy")
+
+class NoiseEngine:
+    """
+    Analisi del rumore sulla luminanza.
+    - Residuo: immagine meno la sua versione denoisata (filtro binomiale 5x5 separabile).
+    - Mappa del rumore: deviazione standard locale del residuo su una finestra WINDOW x WINDOW;
+      zone incollate o ritoccate hanno spesso un livello di rumore diverso dal resto della foto.
+    Il calcolo procede a tile con un bordo di HALO pixel, in un pool di thread (le operazioni NumPy su
+    blocchi grandi rilasciano il GIL). Ogni pixel dipende solo dal suo intorno e i bordi dell'immagine
+    sono riflessi, quindi il risultato non dipende dalla suddivisione in tile (nemmeno da quella del canvas).
+    """
+    BLUR_RADIUS = 2
+    WINDOW = 7
+    HALO = BLUR_RADIUS + WINDOW // 2
+    MAP_GAIN = 24.0 # livelli di grigio per unità di deviazione standard
+    RESIDUAL_GAIN = 8.0
+    KINDS = ("map", "residual")
+
+    @staticmethod
+    def _binomial(a, axis):
+        """Convoluzione [1, 4, 6, 4, 1] / 16 lungo axis, solo parte valida (4 campioni in meno)."""
+        n = a.shape[axis]
+        part = lambda i: a[i:n - 4 + i] if axis == 0 else a[:, i:n - 4 + i]
+        out = part(0) + part(4)
+        out += 4 * (part(1) + part(3))
+        out += 6 * part(2)
+        out *= 1.0 / 16
+        return out
+
+    @staticmethod
+    def _box(a, k, axis):
+        """Somma mobile di k campioni lungo axis (parte valida) tramite somma cumulativa."""
+        c = np.cumsum(a, axis=axis, dtype=np.float32)
+        n = a.shape[axis]
+        if axis == 0:
+            out = c[k - 1:].copy()
+            out[1:] -= c[:n - k]
+        else:
+            out = c[:, k - 1:].copy()
+            out[:, 1:] -= c[:, :n - k]
+        return out
+
+    @classmethod
+    def _block(cls, block, kind):
+        """Analisi di un blocco con HALO pixel di bordo su ogni lato; restituisce solo la parte interna."""
+        r, h = cls.BLUR_RADIUS, cls.HALO - cls.BLUR_RADIUS
+        residual = block[r:-r, r:-r] - cls._binomial(cls._binomial(block, 0), 1)
+        if kind == "residual": return residual[h:-h, h:-h] if h else residual
+
+        k = cls.WINDOW
+        mean = cls._box(cls._box(residual, k, 0), k, 1)
+        mean *= 1.0 / (k * k)
+        residual *= residual
+        variance = cls._box(cls._box(residual, k, 0), k, 1)
+        variance *= 1.0 / (k * k)
+        variance -= mean * mean
+        np.maximum(variance, 0, out=variance)
+        return np.sqrt(variance, out=variance)
+
+    @classmethod
+    def compute(cls, image, kind="map", tile_size=512, max_workers=None):
+        """Residuo o mappa del rumore (array float32 H x W) della luminanza di image."""
+        if kind not in cls.KINDS: raise ValueError(f"Analisi del rumore sconosciuta: {kind}")
+        gray = np.asarray(image.convert("L"), dtype=np.float32)
+        h, w = gray.shape
+        halo = cls.HALO
+        padded = np.pad(gray, halo, mode="reflect" if min(h, w) > halo else "edge")
+        out = np.empty((h, w), dtype=np.float32)
+
+        def run(box):
+            y0, x0, y1, x1 = box
+            out[y0:y1, x0:x1] = cls._block(padded[y0:y1 + 2 * halo, x0:x1 + 2 * halo], kind)
+
+        boxes = [(y, x, min(h, y + tile_size), min(w, x + tile_size))
+                 for y in range(0, h, tile_size) for x in range(0, w, tile_size)]
+        workers = min(len(boxes), max_workers or os.cpu_count() or 1)
+        if workers <= 1:
+            for box in boxes: run(box)
+        else:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                list(pool.map(run, boxes))
+        return out
+
+    @classmethod
+    def render(cls, values, kind="map"):
+        """Valori di compute() come immagine RGB in scala di grigi (residuo centrato su 128)."""
+        if kind == "residual": values = values * cls.RESIDUAL_GAIN + 128
+        else: values = values * cls.MAP_GAIN
+        gray = Image.fromarray(np.clip(values, 0, 255).astype(np.uint8), "L")
+        return gray.convert("RGB")
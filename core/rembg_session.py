@@ -0,0 +1,89 @@
+from collections import OrderedDict
+import threading
+from PIL import Image, ImageChops
+from core import lazy
+
+class RembgSessionPool:
+    """
+    Sessioni ONNX di rembg create una sola volta e riutilizzate tra una "Mask" e l'altra.
+    rembg.remove() senza sessione ricarica il modello a ogni chiamata (secondi e centinaia di MB);
+    qui ogni modello viene caricato al primo uso (o in anticipo con prewarm) e tenuto in memoria.
+    Oltre max_sessions modelli si scarta quello usato meno di recente.
+    """
+    MODELS = ("u2net", "u2netp", "isnet-general-use", "u2net_human_seg", "silueta")
+    DEFAULT_MODEL = "u2net"
+
+    def __init__(self, max_sessions=2):
+        self.max_sessions = max_sessions
+        self.model = self.DEFAULT_MODEL
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self._model_locks = {}
+
+    @staticmethod
+    def available():
+        return lazy.is_available("rembg")
+
+    def set_model(self, model):
+        if model not in self.MODELS: raise ValueError(f"Modello rembg sconosciuto: {model}")
+        self.model = model
+
+    def get(self, model=None):
+        """Restituisce la sessione del modello, creandola se serve (una sola creazione anche con più thread)."""
+        model = model or self.model
+        with self._lock:
+            session = self._sessions.get(model)
+            if session is not None:
+                self._sessions.move_to_end(model)
+                return session
+            model_lock = self._model_locks.setdefault(model, threading.Lock())
+
+        with model_lock:
+            with self._lock:
+                session = self._sessions.get(model)
+            if session is None:
+                session = lazy.load("rembg").new_session(model)
+            with self._lock:
+                self._sessions[model] = session
+                self._sessions.move_to_end(model)
+                while len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+            return session
+
+    def prewarm(self, model=None, on_done=None):
+        """Carica la sessione in un thread daemon; on_done(model, errore o None) viene chiamata dal thread."""
+        model = model or self.model
+        def task():
+            error = None
+            try: self.get(model)
+            except Exception as e: error = e
+            if on_done: on_done(model, error)
+        if self.available():
+            threading.Thread(target=task, daemon=True).start()
+
+    def mask(self, image, model=None, max_side=1024):
+        """
+        Maschera di primo piano (L) alla risoluzione di image.
+        Con max_side l'inferenza avviene su una copia ridotta e la maschera viene riportata alla piena
+        risoluzione: la rete lavora comunque a ~320 px, quindi la qualità resta la stessa ma pre e
+        post-elaborazione non scalano più con le dimensioni del livello.
+        """
+        source = image.convert("RGB")
+        if max_side and max(source.size) > max_side:
+            factor = max_side / max(source.size)
+            source = source.resize((max(1, round(source.width * factor)), max(1, round(source.height * factor))),
+                                   Image.Resampling.BILINEAR)
+        mask = lazy.load("rembg").remove(source, session=self.get(model), only_mask=True)
+        if mask.mode != "L": mask = mask.convert("L")
+        if mask.size != image.size: mask = mask.resize(image.size, Image.Resampling.BICUBIC)
+        return mask
+
+    def remove(self, image, model=None, max_side=1024):
+        """Ritaglio: image in RGBA con alpha = maschera (combinata con l'eventuale alpha esistente)."""
+        mask = self.mask(image, model, max_side)
+        out = image.convert("RGBA")
+        alpha = out.getchannel("A")
+        out.putalpha(mask if alpha.getextrema() == (255, 255) else ImageChops.darker(alpha, mask))
+        return out
+
+session_pool = RembgSessionPool()
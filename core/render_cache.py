@@ -0,0 +1,69 @@
+from collections import OrderedDict
+import threading
+
+def estimate_nbytes(value):
+    """Stima l'occupazione in memoria di un'immagine PIL o di un array NumPy."""
+    if value is None: return 0
+    if hasattr(value, "nbytes"): return int(value.nbytes)
+    if hasattr(value, "getbands"):
+        w, h = value.size
+        bytes_per_band = 4 if value.mode in ("I", "F", "I;16") else 1
+        return w * h * len(value.getbands()) * bytes_per_band
+    return 0
+
+class LRUByteCache:
+    """
+    Cache LRU con budget in byte (immagini elaborate, tile, piramidi...).
+    Quando si supera il budget vengono scartati gli elementi usati meno di recente.
+    Thread-safe: può essere popolata anche da thread in background.
+    """
+    def __init__(self, max_bytes=256 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._items.get(key)
+            if entry is None: return default
+            self._items.move_to_end(key)
+            return entry[0]
+
+    def put(self, key, value, nbytes=None):
+        if nbytes is None: nbytes = estimate_nbytes(value)
+        # Un elemento più grande dell'intero budget non viene memorizzato
+        if nbytes > self.max_bytes: return value
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None: self.current_bytes -= old[1]
+            self._items[key] = (value, nbytes)
+            self.current_bytes += nbytes
+            while self.current_bytes > self.max_bytes and self._items:
+                _, (_, size) = self._items.popitem(last=False)
+                self.current_bytes -= size
+        return value
+
+    def get_or_compute(self, key, compute):
+        value = self.get(key)
+        if value is None:
+            value = self.put(key, compute())
+        return value
+
+    def discard(self, predicate):
+        """Rimuove tutte le chiavi per cui predicate(key) è vero."""
+        with self._lock:
+            for key in [k for k in self._items if predicate(k)]:
+                self.current_bytes -= self._items.pop(key)[1]
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.current_bytes = 0
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._items
+
+    def __len__(self):
+        return len(self._items)
@@ -0,0 +1,280 @@
+import math
+from PIL import Image
+from core.lazy import lazy_import
+from core.render_cache import LRUByteCache
+
+np = lazy_import("numpy")
+
+class LassoPath:
+    """
+    Tracciato di una selezione a mano libera, in coordinate immagine, costruito un punto alla volta.
+    I punti sono decimati mentre arrivano: si scartano quelli più vicini di spacing all'ultimo tenuto
+    e, finché il tracciato resta dritto (nessun punto saltato dista più di tolerance dalla corda),
+    l'ultimo punto viene spostato invece di aggiungerne uno nuovo.
+    I vertici stanno in un array float32 (n, 2) che cresce per raddoppio.
+    """
+    MAX_SKIPPED = 64
+
+    def __init__(self, spacing=1.0, tolerance=0.5):
+        self.spacing = spacing
+        self.tolerance = tolerance
+        self._points = None
+        self._n = 0
+        self._skipped = [] # punti rimpiazzati dopo l'ultimo vertice fisso
+
+    def __len__(self):
+        return self._n
+
+    @property
+    def points(self):
+        """Vertici (n, 2) in coordinate immagine (vista, non copia)."""
+        if self._points is None: return np.empty((0, 2), dtype=np.float32)
+        return self._points[:self._n]
+
+    def add(self, x, y):
+        """
+        Aggiunge il punto (x, y). Restituisce 0 se è stato scartato, 1 se è stato aggiunto un vertice,
+        2 se è stato spostato l'ultimo vertice (il tracciato da ridisegnare cambia solo in coda).
+        """
+        n = self._n
+        if n == 0:
+            self._points = np.empty((256, 2), dtype=np.float32)
+            self._points[0] = (x, y)
+            self._n = 1
+            return 1
+
+        lx, ly = self._points[n - 1]
+        if math.hypot(x - lx, y - ly) < self.spacing: return 0
+
+        if n >= 2 and len(self._skipped) < self.MAX_SKIPPED:
+            # Corda dal penultimo vertice al nuovo punto: se l'ultimo vertice e quelli già rimpiazzati
+            # le stanno vicini, il nuovo punto prende il posto dell'ultimo
+            ax, ay = self._points[n - 2]
+            dx, dy = x - ax, y - ay
+            length = math.hypot(dx, dy)
+            if length > 0 and (lx - ax) * dx + (ly - ay) * dy > 0:
+                candidates = self._skipped + [(lx, ly)]
+                if all(abs((px - ax) * dy - (py - ay) * dx) <= self.tolerance * length for px, py in candidates):
+                    self._skipped.append((lx, ly))
+                    self._points[n - 1] = (x, y)
+                    return 2
+
+        if n == len(self._points):
+            grown = np.empty((2 * n, 2), dtype=np.float32)
+            grown[:n] = self._points
+            self._points = grown
+        self._points[n] = (x, y)
+        self._n = n + 1
+        self._skipped = []
+        return 1
+
+    def bbox(self):
+        """Rettangolo intero (x0, y0, x1, y1) che contiene il tracciato."""
+        pts = self.points
+        x0, y0 = np.floor(pts.min(axis=0))
+        x1, y1 = np.ceil(pts.max(axis=0))
+        return int(x0), int(y0), int(x1), int(y1)
+
+def polygon_mask(points, box):
+    """
+    Maschera L (0/255) del poligono points (n, 2) nel rettangolo box = (x0, y0, x1, y1), in una passata
+    vettoriale: per ogni lato si calcolano insieme tutti gli incroci con le righe di centri pixel,
+    ogni incrocio accumula ±1 (verso del lato) nella sua colonna e la somma cumulativa lungo le righe
+    dà il numero di avvolgimento; sono dentro i pixel con avvolgimento diverso da zero.
+    """
+    x0, y0, x1, y1 = box
+    w, h = x1 - x0, y1 - y0
+    pts = np.asarray(points, dtype=np.float64) - (x0, y0)
+    if w <= 0 or h <= 0 or len(pts) < 3: return Image.new("L", (max(0, w), max(0, h)), 0)
+
+    ax, ay = pts[:, 0], pts[:, 1]
+    bx, by = np.roll(ax, -1), np.roll(ay, -1)
+    # Righe r il cui centro r + 0.5 sta in [min(ay, by), max(ay, by)) (i lati orizzontali non ne hanno)
+    lo = np.clip(np.ceil(np.minimum(ay, by) - 0.5), 0, h).astype(np.int64)
+    hi = np.clip(np.ceil(np.maximum(ay, by) - 0.5), 0, h).astype(np.int64)
+    counts = hi - lo
+    edges = np.flatnonzero(counts > 0)
+    if len(edges) == 0: return Image.new("L", (w, h), 0)
+    counts = counts[edges]
+
+    edge = np.repeat(edges, counts)
+    starts = np.cumsum(counts) - counts
+    rows = lo[edge] + np.arange(len(edge)) - np.repeat(starts, counts)
+    t = (rows + 0.5 - ay[edge]) / (by[edge] - ay[edge])
+    xs = ax[edge] + t * (bx[edge] - ax[edge])
+    # Primo pixel con centro a destra dell'incrocio
+    cols = np.clip(np.ceil(xs - 0.5), 0, w).astype(np.int64)
+    direction = np.sign(by[edge] - ay[edge]).astype(np.int16)
+
+    acc = np.zeros((h, w + 1), dtype=np.int16)
+    np.add.at(acc, (rows, cols), direction)
+    winding = np.cumsum(acc[:, :w], axis=1, dtype=np.int16)
+    return Image.fromarray((winding != 0).view(np.uint8) * np.uint8(255), "L")
+
+def to_mask(coverage):
+    """Copertura float (0-1) -> maschera L."""
+    return Image.fromarray((coverage * 255 + 0.5).astype(np.uint8), "L")
+
+def rect_coverage(rect, box):
+    """Frazione di ogni pixel di box coperta dal rettangolo rect (x0, y0, x1, y1), esatta."""
+    x0, y0, x1, y1 = box
+    rx0, ry0, rx1, ry1 = rect
+    cols = np.arange(x0, x1, dtype=np.float32)
+    rows = np.arange(y0, y1, dtype=np.float32)
+    ox = np.clip(np.minimum(rx1, cols + 1) - np.maximum(rx0, cols), 0, 1)
+    oy = np.clip(np.minimum(ry1, rows + 1) - np.maximum(ry0, rows), 0, 1)
+    return np.outer(oy, ox)
+
+def oval_coverage(rect, box):
+    """
+    Copertura dell'ellisse inscritta in rect: distanza con segno dal bordo (g / |grad g| sul centro pixel)
+    trasformata in copertura lineare su un pixel di larghezza.
+    """
+    x0, y0, x1, y1 = box
+    rx0, ry0, rx1, ry1 = rect
+    a, b = (rx1 - rx0) / 2, (ry1 - ry0) / 2
+    if a <= 0 or b <= 0: return np.zeros((y1 - y0, x1 - x0), dtype=np.float32)
+    X = (np.arange(x0, x1, dtype=np.float32) + 0.5 - (rx0 + a))[None, :]
+    Y = (np.arange(y0, y1, dtype=np.float32) + 0.5 - (ry0 + b))[:, None]
+    # Termini separabili su una riga e una colonna, poi operazioni in place sulla griglia intera
+    g = (X / a) ** 2 - 1 + (Y / b) ** 2
+    grad = (2 * X / (a * a)) ** 2 + (2 * Y / (b * b)) ** 2
+    np.sqrt(grad, out=grad)
+    np.maximum(grad, 1e-6, out=grad)
+    np.divide(g, grad, out=g)
+    np.subtract(0.5, g, out=g)
+    return np.clip(g, 0, 1, out=g)
+
+def polygon_coverage(points, box, subsamples=4, band_rows=256):
+    """
+    Copertura anti-aliasing del poligono (regola nonzero): subsamples sotto-righe per pixel e, lungo
+    ciascuna, copertura orizzontale esatta: ogni incrocio divide il suo ±1 tra le due colonne
+    adiacenti in proporzione alla posizione, così la somma cumulativa dà l'avvolgimento frazionario.
+    Le sotto-righe di un pixel si sommano prima della somma cumulativa (una sola per riga di pixel):
+    il risultato è esatto dove l'avvolgimento vale 0 o ±1, cioè ovunque per i tracciati che non si
+    sovrappongono a se stessi. Gli incroci si calcolano tutti insieme; l'accumulo procede a bande
+    di band_rows righe per limitare la memoria.
+    """
+    x0, y0, x1, y1 = box
+    w, h = x1 - x0, y1 - y0
+    out = np.zeros((max(0, h), max(0, w)), dtype=np.float32)
+    pts = np.asarray(points, dtype=np.float64) - (x0, y0)
+    if w <= 0 or h <= 0 or len(pts) < 3: return out
+
+    s = subsamples
+    ax, ay = pts[:, 0], pts[:, 1] * s
+    bx, by = np.roll(ax, -1), np.roll(ay, -1)
+    lo = np.clip(np.ceil(np.minimum(ay, by) - 0.5), 0, h * s).astype(np.int64)
+    hi = np.clip(np.ceil(np.maximum(ay, by) - 0.5), 0, h * s).astype(np.int64)
+    counts = hi - lo
+    edges = np.flatnonzero(counts > 0)
+    if len(edges) == 0: return out
+    counts = counts[edges]
+
+    edge = np.repeat(edges, counts)
+    starts = np.cumsum(counts) - counts
+    rows = lo[edge] + np.arange(len(edge)) - np.repeat(starts, counts)
+    t = (rows + 0.5 - ay[edge]) / (by[edge] - ay[edge])
+    xs = np.clip(ax[edge] + t * (bx[edge] - ax[edge]), 0, w)
+    direction = np.sign(by[edge] - ay[edge]) / s
+    cols = np.floor(xs).astype(np.int64)
+    frac = xs - cols
+    rows //= s
+
+    order = np.argsort(rows, kind="stable")
+    rows, cols, frac, direction = rows[order], cols[order], frac[order], direction[order]
+    stride = w + 2
+    for r0 in range(0, h, band_rows):
+        r1 = min(h, r0 + band_rows)
+        i0, i1 = np.searchsorted(rows, (r0, r1))
+        if i0 == i1: continue
+        index = (rows[i0:i1] - r0) * stride + cols[i0:i1]
+        d, f = direction[i0:i1], frac[i0:i1]
+        acc = np.bincount(np.concatenate([index, index + 1]), weights=np.concatenate([d * (1 - f), d * f]),
+                          minlength=(r1 - r0) * stride)
+        winding = np.cumsum(acc.reshape(-1, stride)[:, :w], axis=1, dtype=np.float32)
+        np.abs(winding, out=winding)
+        out[r0:r1] = np.minimum(winding, 1, out=winding)
+    return out
+
+# Maschere renderizzate per (geometria della selezione, rettangolo, anti-aliasing)
+mask_cache = LRUByteCache(max_bytes=64 * 1024 * 1024)
+
+class SelectionMask:
+    """
+    Selezione composta da forme in coordinate immagine combinate in ordine: "rect" e "oval" (rettangolo
+    x0, y0, x1, y1) e "polygon" (vertici (n, 2)), con add (unione), subtract e intersect.
+    La maschera si ottiene dalla copertura analitica delle forme, quindi ha già i bordi anti-aliasing
+    senza passaggi di sfocatura; resta in cache per geometria e rettangolo richiesto.
+    """
+    SHAPES = ("rect", "oval", "polygon")
+    OPS = ("add", "subtract", "intersect")
+
+    def __init__(self, shape=None, geometry=None):
+        self.ops = []
+        self._key = None
+        if shape: self.combine("add", shape, geometry)
+
+    def combine(self, op, shape, geometry):
+        if op not in self.OPS: raise ValueError(f"Operazione di selezione sconosciuta: {op}")
+        if shape not in self.SHAPES: raise ValueError(f"Forma di selezione sconosciuta: {shape}")
+        if shape == "polygon": geometry = np.array(geometry, dtype=np.float32)
+        else: geometry = tuple(float(v) for v in geometry)
+        self.ops.append((op, shape, geometry))
+        self._key = None
+        return self
+
+    @property
+    def key(self):
+        if self._key is None:
+            self._key = tuple((op, shape, g.tobytes() if shape == "polygon" else g) for op, shape, g in self.ops)
+        return self._key
+
+    @property
+    def is_rect(self):
+        """True per un solo rettangolo a coordinate intere (il ritaglio non ha bisogno di maschera)."""
+        return len(self.ops) == 1 and self.ops[0][1] == "rect" and all(v == int(v) for v in self.ops[0][2])
+
+    @staticmethod
+    def _bounds(shape, geometry):
+        if shape == "polygon":
+            (x0, y0), (x1, y1) = geometry.min(axis=0), geometry.max(axis=0)
+            return float(x0), float(y0), float(x1), float(y1)
+        return geometry
+
+    def bbox(self):
+        """Rettangolo intero che contiene l'area selezionata, None se è vuota."""
+        box = None
+        for op, shape, geometry in self.ops:
+            b = self._bounds(shape, geometry)
+            if op == "add":
+                box = b if box is None else (min(box[0], b[0]), min(box[1], b[1]), max(box[2], b[2]), max(box[3], b[3]))
+            elif op == "intersect" and box is not None:
+                box = (max(box[0], b[0]), max(box[1], b[1]), min(box[2], b[2]), min(box[3], b[3]))
+            if box is not None and (box[2] <= box[0] or box[3] <= box[1]): box = None
+        if box is None: return None
+        return math.floor(box[0]), math.floor(box[1]), math.ceil(box[2]), math.ceil(box[3])
+
+    @staticmethod
+    def _coverage(shape, geometry, box, antialias):
+        if shape == "polygon":
+            if antialias: return polygon_coverage(geometry, box)
+            return np.asarray(polygon_mask(geometry, box), dtype=np.float32) / 255
+        coverage = rect_coverage(geometry, box) if shape == "rect" else oval_coverage(geometry, box)
+        return coverage if antialias else (coverage >= 0.5).astype(np.float32)
+
+    def coverage(self, box, antialias=True):
+        """Copertura float32 (0-1) della selezione nel rettangolo box."""
+        x0, y0, x1, y1 = box
+        result = np.zeros((y1 - y0, x1 - x0), dtype=np.float32)
+        for op, shape, geometry in self.ops:
+            c = self._coverage(shape, geometry, box, antialias)
+            if op == "add": np.maximum(result, c, out=result)
+            elif op == "subtract": np.minimum(result, 1 - c, out=result)
+            else: np.minimum(result, c, out=result)
+        return result
+
+    def render(self, box, antialias=True):
+        """Maschera L della selezione nel rettangolo box (in cache)."""
+        box = tuple(int(v) for v in box)
+        return mask_cache.get_or_compute((self.key, box, antialias), lambda: to_mask(self.coverage(box, antialias)))
@@ -0,0 +1,90 @@
+from PIL import Image
+from core.render_cache import LRUByteCache
+
+class TileRenderer:
+    """
+    Renderizza solo la porzione di immagine visibile nel viewport del canvas.
+    L'immagine sorgente viene divisa in tile quadrati: si filtrano (e si tengono in cache)
+    soltanto i tile che cadono nel viewport, poi si ricampiona la sola regione visibile.
+    Il costo di pan e zoom dipende quindi dalla dimensione del viewport, non da quella dell'immagine.
+    """
+    def __init__(self, tile_size=256, max_bytes=64 * 1024 * 1024):
+        self.tile_size = tile_size
+        self._tiles = LRUByteCache(max_bytes)
+
+    def invalidate(self):
+        """Scarta i tile filtrati (da chiamare quando cambia l'immagine)."""
+        self._tiles.clear()
+
+    @staticmethod
+    def visible_region(image_size, scale, pan_x, pan_y, view_w, view_h, margin=0):
+        """
+        Calcola la parte visibile dell'immagine.
+        Restituisce (dest, box): dest è il rettangolo intero sul canvas (x0, y0, x1, y1),
+        box il rettangolo corrispondente in coordinate immagine (float). None se non c'è nulla da mostrare.
+        margin allarga il viewport su ogni lato (contenuto pronto per il pan).
+        """
+        iw, ih = image_size
+        full_w, full_h = int(iw * scale), int(ih * scale)
+        if full_w < 1 or full_h < 1: return None
+
+        px, py = int(round(pan_x)), int(round(pan_y))
+        dx0, dy0 = max(-margin, px), max(-margin, py)
+        dx1, dy1 = min(view_w + margin, px + full_w), min(view_h + margin, py + full_h)
+        if dx1 <= dx0 or dy1 <= dy0: return None
+
+        # Stessa mappatura di un resize dell'intera immagine a (full_w, full_h)
+        sx, sy = iw / full_w, ih / full_h
+        box = ((dx0 - px) * sx, (dy0 - py) * sy, (dx1 - px) * sx, (dy1 - py) * sy)
+        return (dx0, dy0, dx1, dy1), box
+
+    def render(self, source, scale, pan_x, pan_y, view_w, view_h,
+               resample=Image.Resampling.BILINEAR, tile_fn=None, key=None, margin=0):
+        """
+        Restituisce (immagine_viewport, (x, y)) da posizionare sul canvas, oppure None.
+
+        - source: immagine sorgente (serve per dimensioni e, senza tile_fn, come dato già filtrato)
+        - tile_fn(box): se indicata, restituisce il tile filtrato per il box sorgente (x0, y0, x1, y1)
+        - key: identifica lo stato dei filtri, usato per la cache dei tile
+        - margin: pixel di canvas renderizzati oltre i bordi del viewport
+        """
+        region = self.visible_region(source.size, scale, pan_x, pan_y, view_w, view_h, margin)
+        if region is None: return None
+        (dx0, dy0, dx1, dy1), box = region
+        out_size = (dx1 - dx0, dy1 - dy0)
+
+        if tile_fn is None:
+            return source.resize(out_size, resample, box=box), (dx0, dy0)
+
+        # Margine per il supporto del filtro di ricampionamento (in riduzione cresce con 1/scale)
+        pad = 0 if resample == Image.Resampling.NEAREST else int(1.0 / min(scale, 1.0)) + 2
+        iw, ih = source.size
+        rx0, ry0 = max(0, int(box[0]) - pad), max(0, int(box[1]) - pad)
+        rx1, ry1 = min(iw, int(box[2]) + 1 + pad), min(ih, int(box[3]) + 1 + pad)
+
+        # Allinea la regione alla griglia dei tile
+        t = self.tile_size
+        tx0, ty0 = rx0 // t, ry0 // t
+        tx1, ty1 = (rx1 - 1) // t, (ry1 - 1) // t
+        rx0, ry0 = tx0 * t, ty0 * t
+        rx1, ry1 = min(iw, (tx1 + 1) * t), min(ih, (ty1 + 1) * t)
+
+        region_img = None
+        for ty in range(ty0, ty1 + 1):
+            for tx in range(tx0, tx1 + 1):
+                tile = self._get_tile(tile_fn, key, tx, ty, iw, ih)
+                if region_img is None:
+                    region_img = Image.new(tile.mode, (rx1 - rx0, ry1 - ry0))
+                region_img.paste(tile, (tx * t - rx0, ty * t - ry0))
+
+        local_box = (box[0] - rx0, box[1] - ry0, box[2] - rx0, box[3] - ry0)
+        return region_img.resize(out_size, resample, box=local_box), (dx0, dy0)
+
+    def _get_tile(self, tile_fn, key, tx, ty, iw, ih):
+        cache_key = (key, tx, ty)
+        tile = self._tiles.get(cache_key)
+        if tile is not None: return tile
+
+        t = self.tile_size
+        box = (tx * t, ty * t, min(iw, (tx + 1) * t), min(ih, (ty + 1) * t))
+        return self._tiles.put(cache_key, tile_fn(box))
@@ -3,7 +3,10 @@ import tkinter as tk
 from tkinter import filedialog
 from PIL import Image
 from core.image_processor import ImageProcessor
+from core.rembg_session import session_pool
+from core.metadata import metadata_extractor
 from gui.canvas_widget import ImageCanvas
+from gui.metadata_table import MetadataTable
 from gui.tooltip import CTkToolTip
 import os
 import threading
@@ -51,6 +54,10 @@ class ForgeryApp(ctk.CTk):
         self.geometry("1100x700")
 
         self.image_processor = ImageProcessor()
+        # Lato massimo della copia su cui gira la rimozione sfondo (la maschera torna a piena risoluzione)
+        self.mask_max_side = 1024
+        self.histogram_window = None
+        self._load_token = 0 # Scarta i caricamenti in background di immagini non più correnti
 
         # Layout Core
         self.grid_columnconfigure(1, weight=1)
@@ -89,7 +96,7 @@ class ForgeryApp(ctk.CTk):
         self.toolbar.grid(row=0, column=0, sticky="ew", pady=(0, 5))
         self.setup_toolbar()
 
-        self.metadata_view = ctk.CTkScrollableFrame(self.main_container, fg_color="#1a1a1a")
+        self.metadata_view = MetadataTable(self.main_container, fg_color="#1a1a1a")
 
         self.status_bar = ctk.CTkFrame(self.main_container, height=25)
         self.status_bar.grid(row=2, column=0, sticky="ew", pady=(5, 0))
@@ -182,6 +189,14 @@ class ForgeryApp(ctk.CTk):
             self.btn_mask = ctk.CTkButton(self.forge_frame, text="Mask", command=self.run_auto_mask_thread, width=40, fg_color="#444")
             self.btn_mask.pack(side="left", padx=2)
 
+            # Modello rembg: la sessione viene caricata in background e riutilizzata dalle "Mask" successive
+            self.mask_model_menu = ctk.CTkOptionMenu(self.forge_frame, values=list(session_pool.MODELS), width=110,
+                                                     command=self.set_mask_model, fg_color="#444", button_color="#333")
+            self.mask_model_menu.set(session_pool.model)
+            self.mask_model_menu.pack(side="left", padx=2)
+            CTkToolTip(self.mask_model_menu, "Background removal model")
+            session_pool.prewarm(on_done=self._on_mask_model_ready)
+
             btn_feather = ctk.CTkButton(self.forge_frame, text="Blur", command=self.image_canvas.trigger_feathering, width=40, fg_color="#444")
             btn_feather.pack(side="left", padx=2)
 
@@ -211,8 +226,16 @@ class ForgeryApp(ctk.CTk):
     def update_floating_rotate(self, val):
         self.image_canvas.apply_transformations(angle=val)
 
+    def set_mask_model(self, model):
+        session_pool.set_model(model)
+        session_pool.prewarm(model, on_done=self._on_mask_model_ready)
+
+    def _on_mask_model_ready(self, model, error):
+        if error: print(f"Errore caricamento modello {model}: {error}")
+
     def run_auto_mask_thread(self):
         if not self.image_canvas.floating_pil_image: return
+        self.image_canvas.ensure_full_transform()
         self.loading_bar.pack(side="left", padx=10)
         self.loading_bar.start()
         self.btn_mask.configure(state="disabled")
@@ -221,7 +244,7 @@ class ForgeryApp(ctk.CTk):
     def _bg_remove_task(self):
         try:
             img_in = self.image_canvas.floating_pil_image.copy()
-            img_out = ImageProcessor.smart_background_remove(img_in)
+            img_out = ImageProcessor.smart_background_remove(img_in, max_side=self.mask_max_side)
             self.after(0, lambda: self._on_bg_remove_done(img_out))
         except:
             self.after(0, lambda: self._on_bg_remove_done(None))
@@ -252,14 +275,8 @@ class ForgeryApp(ctk.CTk):
         self.image_canvas.set_tool_mode("select")
 
     def update_metadata_ui(self):
-        for widget in self.metadata_view.winfo_children():
-            widget.destroy()
-        data = self.image_processor.get_formatted_exif()
-        for label, value in data:
-            row = ctk.CTkFrame(self.metadata_view, fg_color="transparent")
-            row.pack(fill="x", padx=40, pady=5)
-            ctk.CTkLabel(row, text=f"{label}:", width=200, anchor="w", font=("Arial", 12, "bold")).pack(side="left")
-            ctk.CTkLabel(row, text=value, anchor="w", font=("Arial", 12)).pack(side="left", padx=10)
+        # Le righe sono in cache nel processor: riaprire la pagina non ricrea nulla
+        self.metadata_view.set_rows(self.image_processor.get_formatted_exif())
 
     def setup_toolbar(self):
         t_btn = {"width": 35, "height": 30, "fg_color": "#333", "hover_color": "#8B0000"}
@@ -300,6 +317,18 @@ class ForgeryApp(ctk.CTk):
         self.btn_ela = ctk.CTkButton(self.toolbar, text="ELA", command=lambda: self.toggle_filter("ELA"), **t_btn)
         self.btn_ela.pack(side="left", padx=2)
         CTkToolTip(self.btn_ela, "Error Level Analysis")
+
+        self.btn_noise = ctk.CTkButton(self.toolbar, text="Noise", command=lambda: self.toggle_filter("Noise"), **t_btn)
+        self.btn_noise.pack(side="left", padx=2)
+        CTkToolTip(self.btn_noise, "Noise Residual (local noise level)")
+
+        self.btn_ghost = ctk.CTkButton(self.toolbar, text="Ghost", command=lambda: self.toggle_filter("Ghost"), **t_btn)
+        self.btn_ghost.pack(side="left", padx=2)
+        CTkToolTip(self.btn_ghost, "JPEG Ghost (quality sweep 50-100)")
+
+        self.btn_cm = ctk.CTkButton(self.toolbar, text="CM", command=lambda: self.toggle_filter("CopyMove"), **t_btn)
+        self.btn_cm.pack(side="left", padx=2)
+        CTkToolTip(self.btn_cm, "Copy-Move Detection")
         
         ctk.CTkLabel(self.toolbar, text="|").pack(side="left", padx=5)
 
@@ -312,8 +341,11 @@ class ForgeryApp(ctk.CTk):
     def show_histogram(self):
         try:
             from gui.histogram_window import HistogramWindow
-            if self.image_canvas.original_image:
-                HistogramWindow(self, self.image_canvas.original_image, self.image_canvas.get_current_processed_image())
+            if self.histogram_window is not None and self.histogram_window.winfo_exists():
+                self.histogram_window.lift()
+            elif self.image_canvas.original_image:
+                # La finestra resta collegata al canvas e si aggiorna da sola
+                self.histogram_window = HistogramWindow(self, self.image_canvas)
         except Exception as e:
             print(f"Error opening histogram: {e}")
 
@@ -331,6 +363,9 @@ class ForgeryApp(ctk.CTk):
         self.btn_he.configure(fg_color="#8B0000" if curr == "Equalize" else "#333")
         self.btn_edge.configure(fg_color="#8B0000" if curr == "Edge" else "#333")
         self.btn_ela.configure(fg_color="#8B0000" if curr == "ELA" else "#333")
+        self.btn_noise.configure(fg_color="#8B0000" if curr == "Noise" else "#333")
+        self.btn_ghost.configure(fg_color="#8B0000" if curr == "Ghost" else "#333")
+        self.btn_cm.configure(fg_color="#8B0000" if curr == "CopyMove" else "#333")
 
     def open_channel_selector(self):
         ChannelSelector(self, self.set_channel_from_popup)
@@ -353,20 +388,87 @@ class ForgeryApp(ctk.CTk):
     def zoom(self, f):
         if self.image_canvas.original_image:
             self.image_canvas.scale *= f
-            self.image_canvas.redraw()
+            self.image_canvas.request_redraw()
 
     def load_image(self):
         path = filedialog.askopenfilename(filetypes=[
-            ("Supported Images", "*.jpg *.jpeg *.png *.bmp *.webp"),
+            ("Supported Images", "*.jpg *.jpeg *.png *.bmp *.webp *.tif *.tiff *.npy"),
             ("All Files", "*.*")
         ])
         if path:
-            img = self.image_processor.load_image(path)
+            # Immagini enormi (TIFF non compressi oltre soglia, .npy): lette a tile dal disco
+            store = ImageProcessor.open_backing_store(path)
+            if store:
+                self._load_token += 1
+                self.image_processor.load_backing_store(path, store, metadata=False)
+                self.lbl_file.configure(text=f"File: {os.path.basename(path)} (building overview...)")
+                threading.Thread(target=self._load_store_task, args=(store, path, self._load_token), daemon=True).start()
+                if path.lower().endswith((".tif", ".tiff")): self._start_metadata_task(path)
+                if hasattr(self, 'metadata_view') and self.metadata_view.winfo_ismapped():
+                    self.update_metadata_ui()
+                return
+            # I metadati (lettura e sha1 dell'intero file) si estraggono dopo aver mostrato l'immagine
+            img = self.image_processor.load_image(path, metadata=False)
             if img:
-                self.image_canvas.set_image(img)
-                self.lbl_file.configure(text=f"File: {os.path.basename(path)}")
+                self._load_token += 1
+                # JPEG grandi: anteprima ridotta subito, decodifica completa in background
+                draft = ImageProcessor.load_draft(path, max(self.image_canvas.viewport_size()))
+                if draft:
+                    preview, factor = draft
+                    self.image_canvas.set_image(preview, preview_factor=factor)
+                    self.lbl_file.configure(text=f"File: {os.path.basename(path)} (loading full resolution...)")
+                    threading.Thread(target=self._load_full_task, args=(img, path, self._load_token), daemon=True).start()
+                else:
+                    self.image_canvas.set_image(img)
+                    self.lbl_file.configure(text=f"File: {os.path.basename(path)}")
+                self._start_metadata_task(path)
                 if hasattr(self, 'metadata_view') and self.metadata_view.winfo_ismapped():
                     self.update_metadata_ui()
 
+    def _start_metadata_task(self, path):
+        threading.Thread(target=self._load_metadata_task, args=(path, self._load_token), daemon=True).start()
+
+    def _load_metadata_task(self, path, token):
+        try:
+            record = metadata_extractor.extract(path)
+            self.after(0, lambda: self._on_metadata_ready(record, token))
+        except Exception as e:
+            print(f"Errore lettura metadati: {e}")
+
+    def _on_metadata_ready(self, record, token):
+        if token != self._load_token: return
+        self.image_processor.set_metadata(record)
+        if hasattr(self, 'metadata_view') and self.metadata_view.winfo_ismapped():
+            self.update_metadata_ui()
+
+    def _load_full_task(self, img, path, token):
+        try:
+            img.load()
+            self.after(0, lambda: self._on_full_loaded(img, path, token))
+        except Exception as e:
+            print(f"Errore caricamento completo: {e}")
+
+    def _load_store_task(self, store, path, token):
+        try:
+            overview, factor = store.overview(max_side=ImageProcessor.OVERVIEW_SIDE)
+            self.after(0, lambda: self._on_store_ready(store, overview, factor, path, token))
+        except Exception as e:
+            print(f"Errore lettura backing store: {e}")
+            store.close()
+
+    def _on_store_ready(self, store, overview, factor, path, token):
+        if token != self._load_token:
+            store.close()
+            return
+        self.image_canvas.set_backing_store(store, overview, factor)
+        w, h = store.size
+        self.lbl_file.configure(text=f"File: {os.path.basename(path)} ({w}x{h}, read-only)")
+
+    def _on_full_loaded(self, img, path, token):
+        # Nel frattempo è stata aperta un'altra immagine
+        if token != self._load_token: return
+        self.image_canvas.set_full_resolution(img)
+        self.lbl_file.configure(text=f"File: {os.path.basename(path)}")
+
 if __name__ == "__main__":
     ForgeryApp().mainloop()
\ No newline at end of file
@@ -1,10 +1,17 @@
 import tkinter as tk
 import customtkinter as ctk
-from PIL import Image, ImageTk, ImageOps, ImageFilter
-import colorsys
+from PIL import Image, ImageTk
 import math
+import threading
 from core.image_processor import ImageProcessor
 from core.history_manager import HistoryManager
+from core.tile_renderer import TileRenderer
+from core.render_cache import LRUByteCache
+from core.image_pyramid import ImagePyramid
+from core.color_planes import ColorPlaneCache
+from core.histogram import HistogramService
+from core.selection_mask import LassoPath, SelectionMask
+from core.jpeg_ghost import JPEGGhost
 
 class ImageCanvas(ctk.CTkFrame):
     def __init__(self, master, **kwargs):
@@ -16,14 +23,59 @@ class ImageCanvas(ctk.CTkFrame):
         self.canvas = tk.Canvas(self, bg="#2b2b2b", highlightthickness=0)
         self.canvas.grid(row=0, column=0, sticky="nsew")
 
+        # Scena "retained": gli item del canvas si creano una volta e si aggiornano con coords/itemconfig
+        self.image_item = self.canvas.create_image(0, 0, anchor="nw", state="hidden")
+        self._grid_items = [] # Linee della griglia riusate (solo quelle visibili nel viewport)
+        self._grid_shown = 0
+        self._overlay_items = None # Riquadro e maniglie del livello fluttuante
+        self._overlay_shown = False
+        self._overlay_geometry = None # Riquadro a schermo del livello fluttuante, per l'hit-test
+        self._selection_items = {} # Un item per forma di selezione (rect, oval, free)
+        self._cursor = ""
+        self.handle_size = 8
+        self.rot_handle_offset = 20
+
         self.original_image = None
         self.displayed_image = None
         self.tk_image = None
         
-        self.history = HistoryManager(max_steps=20)
+        self.history_budget = 512 * 1024 * 1024 # Byte massimi per Undo/Redo
+        self.history = HistoryManager(max_bytes=self.history_budget)
         self.scale = 1.0
         self.pan_x = 0
         self.pan_y = 0
+
+        # Rendering a tile del solo viewport
+        self.renderer = TileRenderer()
+        self.render_margin = 256 # Pixel renderizzati oltre il viewport, per il pan senza re-render
+        self._rendered_rect = None # Area del canvas coperta dall'ultimo render
+
+        # Scheduler dei redraw: al massimo un render per frame, anteprima durante l'input
+        self.frame_ms = 16
+        self.settle_ms = 120
+        self.preview_downsample = 2
+        self._frame_job = None
+        self._settle_job = None
+        self._redraw_dirty = False
+        self._preview_shown = False
+        self.image_revision = 0
+        self.backing_store = None # core.backing_store per le immagini lette a tile dal disco
+        self.preview_factor = 1.0 # > 1 mentre original_image è un'anteprima ridotta (draft JPEG)
+        # Immagini elaborate per (revisione, canale, negativo, analisi): condivise da redraw, salvataggio e istogramma
+        self.view_cache = LRUByteCache(max_bytes=256 * 1024 * 1024)
+        # Piramidi mipmap per lo zoom out (immagine originale e viste elaborate)
+        self._pyramids = {}
+        # Piani colore (RGB/HSV/YCbCr/L) per ispettore pixel e viste per canale
+        self.planes = ColorPlaneCache()
+        # Istogrammi per revisione e filtri; i listener (es. la finestra istogramma) vengono avvisati a ogni cambio
+        self.histograms = HistogramService()
+        self.view_listeners = []
+        # JPEG ghost in corso per la vista corrente: ogni qualità completata aggiorna la vista (_ghost_view)
+        self._ghost = None
+        self._ghost_key = None
+        self._ghost_view = None
+        self._ghost_shown = 0 # qualità incluse in _ghost_view
+        self._ghost_lock = threading.Lock()
         
         self.tool_mode = "view"
         self.selection_shape = "rect" # rect, oval, free
@@ -32,7 +84,18 @@ class ImageCanvas(ctk.CTkFrame):
         self.selection_start = None 
         self.selection_rect_id = None 
         self.selection_coords_img = None 
-        self.selection_points = [] # Per freehand
+        # Forme selezionate (coordinate immagine) da cui è stato creato il livello fluttuante;
+        # Shift/Ctrl/Shift+Ctrl + trascinamento aggiungono, sottraggono o intersecano una nuova forma
+        self.selection = None
+        self._selection_op = None
+        # Freehand: tracciato decimato in coordinate immagine, disegnato a spezzoni di lasso_chunk vertici
+        self.lasso = None
+        self.lasso_spacing = 2.0 # px schermo tra due vertici
+        self.lasso_tolerance = 0.75 # px schermo di scostamento ammesso quando si fondono vertici allineati
+        self.lasso_chunk = 64
+        self._lasso_items = []
+        self._lasso_used = 0
+        self._lasso_start = 0 # primo vertice dello spezzone corrente
         
         self.floating_pil_image = None
         self.floating_base_ref = None
@@ -41,6 +104,12 @@ class ImageCanvas(ctk.CTkFrame):
         self.floating_pos = (0, 0)
         self.floating_angle = 0
         self.floating_scale_val = 1.0
+        # Anteprima dei drag di scala/rotazione: copia a risoluzione schermo trasformata con filtri veloci
+        self._floating_proxy = None
+        self._floating_proxy_active = False
+        self._transform_gen = 0 # Scarta le trasformazioni complete in background diventate obsolete
+        self._floating_display_src = None # Sorgente dell'ultima PhotoImage del livello (per riusarla nei move)
+        self._floating_display_size = None
 
         self.show_grid = False
         self.is_inverted = False
@@ -55,28 +124,100 @@ class ImageCanvas(ctk.CTkFrame):
         self.canvas.bind("<Button-4>", self.zoom_image)
         self.canvas.bind("<Button-5>", self.zoom_image)
 
-    def set_image(self, pil_image):
+    def set_image(self, pil_image, preview_factor=1.0):
+        """
+        Mostra una nuova immagine. Con preview_factor > 1 l'immagine è un'anteprima ridotta (draft JPEG)
+        di quel fattore: la modifica resta bloccata finché set_full_resolution non la sostituisce.
+        """
+        # Decodifica completa qui, prima che i thread (piramide, istogramma) vedano l'immagine:
+        # due load() concorrenti sullo stesso ImageFile di PIL corrompono i pixel
+        pil_image.load()
+        self.clear_selection()
+        self._close_backing_store()
         self.original_image = pil_image
-        self.history = HistoryManager(max_steps=20)
+        self.preview_factor = preview_factor
+        self.history.close()
+        self.history = HistoryManager(max_bytes=self.history_budget)
+        self.on_image_changed()
         self.scale = 1.0
         self.pan_x = 0
         self.pan_y = 0
         self.fit_to_screen()
         self.redraw()
+
+    def set_full_resolution(self, full_image):
+        """Sostituisce l'anteprima con l'immagine completa lasciando invariata la vista (stesso zoom e pan a schermo)."""
+        if not self.original_image: return
+        full_image.load()
+        factor = full_image.width / self.original_image.width
+        self.original_image = full_image
+        self.preview_factor = 1.0
+        self.scale /= factor
+        self.history.close()
+        self.history = HistoryManager(max_bytes=self.history_budget)
+        self.on_image_changed()
+        self.redraw()
+
+    def set_backing_store(self, store, overview, factor):
+        """
+        Mostra un'immagine troppo grande per la RAM (core.backing_store): la panoramica ridotta di factor
+        fa da original_image in sola lettura, mentre con lo zoom oltre la sua risoluzione i tile e
+        i valori dei pixel vengono letti a piena risoluzione dallo store.
+        """
+        self.set_image(overview, preview_factor=factor)
+        self.backing_store = store
+        self.renderer.invalidate()
+        self.redraw()
+
+    def _close_backing_store(self):
+        if self.backing_store is None: return
+        self.backing_store.close()
+        self.backing_store = None
+        self.renderer.invalidate()
+
+    @property
+    def editable(self):
+        """False mentre è visualizzata un'anteprima a risoluzione ridotta."""
+        return self.preview_factor == 1.0
         
-    def save_current_state(self):
-        if self.original_image: self.history.push(self.original_image)
+    def on_image_changed(self):
+        """Da chiamare dopo ogni modifica dei pixel di original_image: invalida i dati derivati."""
+        self.image_revision += 1
+        self.renderer.invalidate()
+        self.view_cache.clear()
+        self.histograms.clear()
+        self.planes.reset(self.original_image)
+        self._cancel_ghost()
+        for pyramid in self._pyramids.values(): pyramid.cancel()
+        self._pyramids = {}
+        # La piramide dell'immagine originale si prepara subito, in background
+        if self.original_image: self._get_pyramid(("image", self.image_revision), self.original_image)
+        self._notify_view_changed()
+
+    def add_view_listener(self, callback):
+        """callback() viene chiamata dopo ogni modifica dell'immagine o dei filtri di visualizzazione."""
+        if callback not in self.view_listeners: self.view_listeners.append(callback)
+
+    def remove_view_listener(self, callback):
+        if callback in self.view_listeners: self.view_listeners.remove(callback)
+
+    def _notify_view_changed(self):
+        for callback in list(self.view_listeners):
+            try: callback()
+            except Exception as e: print(f"Errore listener vista: {e}")
+
+    def save_current_state(self, box=None):
+        """Salva per l'Undo la regione box (in coordinate immagine) che sta per essere modificata."""
+        if self.original_image: self.history.push(self.original_image, box)
 
     def perform_undo(self, event=None):
-        prev_img = self.history.undo(self.original_image)
-        if prev_img:
-            self.original_image = prev_img
+        if self.history.undo(self.original_image):
+            self.on_image_changed()
             self.redraw()
 
     def perform_redo(self, event=None):
-        next_img = self.history.redo(self.original_image)
-        if next_img:
-            self.original_image = next_img
+        if self.history.redo(self.original_image):
+            self.on_image_changed()
             self.redraw()
 
     def fit_to_screen(self):
@@ -104,126 +245,363 @@ class ImageCanvas(ctk.CTkFrame):
     def set_channel_mode(self, mode):
         self.channel_mode = mode
         self.redraw()
+        self._notify_view_changed()
         
     def set_analysis_mode(self, mode):
         self.analysis_mode = "Normal" if self.analysis_mode == mode else mode
+        if self.analysis_mode != "Ghost": self._cancel_ghost()
         self.redraw()
+        self._notify_view_changed()
         return self.analysis_mode
 
     def toggle_invert(self):
         self.is_inverted = not self.is_inverted
         self.redraw()
+        self._notify_view_changed()
 
     def get_current_processed_image(self):
+        """Immagine con i filtri correnti, memorizzata nella view_cache. Non va modificata dal chiamante."""
         if not self.original_image: return None
-        return self._apply_filters(self.original_image)
+        if self.analysis_mode == "Ghost": return self._ghost_image()
+        return self.view_cache.get_or_compute(self._filter_key(), lambda: self._filter_region(self.original_image))
 
-    def _apply_filters(self, img):
-        img_to_process = img.convert("RGB") if img.mode not in ["RGB", "RGBA"] else img.copy()
-        mode = self.channel_mode
-        try:
-            if mode in ["R", "G", "B"]:
-                r, g, b = img_to_process.convert("RGB").split()
-                zero = Image.new("L", r.size, 0)
-                if mode == "R": img_to_process = Image.merge("RGB", (r, zero, zero))
-                elif mode == "G": img_to_process = Image.merge("RGB", (zero, g, zero))
-                elif mode == "B": img_to_process = Image.merge("RGB", (zero, zero, b))
-            elif mode in ["H", "S", "V"]:
-                h, s, v = img_to_process.convert("HSV").split()
-                if mode == "H": img_to_process = h.convert("RGB")
-                elif mode == "S": img_to_process = s.convert("RGB")
-                elif mode == "V": img_to_process = v.convert("RGB")
-            elif mode in ["YCbCr", "Y", "Cb", "Cr"]:
-                y, cb, cr = img_to_process.convert("YCbCr").split()
-                if mode == "YCbCr": img_to_process = Image.merge("RGB", (y, cb, cr))
-                elif mode == "Y": img_to_process = y.convert("RGB")
-                elif mode == "Cb": img_to_process = cb.convert("RGB")
-                elif mode == "Cr": img_to_process = cr.convert("RGB")
-            elif mode == "L": img_to_process = img_to_process.convert("L").convert("RGB")
-        except: pass
-
-        if self.is_inverted:
-            try: img_to_process = ImageOps.invert(img_to_process.convert("RGB"))
-            except: pass
-
-        if self.analysis_mode != "Normal":
-            try:
-                if self.analysis_mode == "Equalize": img_to_process = ImageOps.equalize(img_to_process.convert("RGB"))
-                elif self.analysis_mode == "Edge": img_to_process = img_to_process.convert("RGB").filter(ImageFilter.FIND_EDGES)
-                elif self.analysis_mode == "ELA": img_to_process = ImageProcessor.compute_ela(img_to_process)
-            except: pass
-        return img_to_process
-
-    def redraw(self):
-        self.canvas.delete("all")
-        if not self.original_image: return
-        img_to_process = self._apply_filters(self.original_image)
-        width, height = img_to_process.size
-        new_size = (int(width * self.scale), int(height * self.scale))
-        if new_size[0] < 1 or new_size[1] < 1: return
-        resample = Image.Resampling.NEAREST if self.scale > 2.0 else Image.Resampling.BILINEAR
-        self.displayed_image = img_to_process.resize(new_size, resample)
+    def histogram_snapshot(self):
+        """
+        Da chiamare nel thread Tk: chiave della vista e copie delle immagini da cui compute_histograms
+        conta i pixel in background. Incolla e undo/redo modificano original_image sul posto, quindi
+        il thread non deve mai leggerla direttamente (conteggi misti prima/dopo sotto la chiave nuova).
+        """
+        if not self.original_image: return None
+        key = self._view_key()
+        filtered = key[1:] != ("RGB", False, "Normal")
+        view = None
+        if filtered:
+            # Le viste elaborate sono immagini nuove, mai modificate sul posto: basta il riferimento
+            view = self._ghost_image() if self.analysis_mode == "Ghost" else self.view_cache.get(key)
+        need_original = self.histograms.cached(("image", key[0])) is None
+        need_view = filtered and view is None and self.histograms.cached(("view",) + key) is None
+        return {"key": key, "filtered": filtered, "view": view,
+                "original": self.original_image.copy() if need_original or need_view else None,
+                "filters": (self.channel_mode, self.is_inverted, self.analysis_mode)}
+
+    def compute_histograms(self, snapshot, stride=1):
+        """
+        (istogramma originale, istogramma della vista filtrata) di uno snapshot di histogram_snapshot(),
+        dalla cache se già calcolati. Sicura da un thread in background: non legge lo stato del canvas.
+        """
+        if snapshot is None: return None, None
+        key = snapshot["key"]
+
+        def counts(cache_key, image):
+            # Se il conteggio completo è già in cache l'anteprima sottocampionata non serve
+            full = self.histograms.cached(cache_key)
+            return full if full is not None else self.histograms.get(cache_key, image, stride)
+
+        original = counts(("image", key[0]), snapshot["original"])
+        if not snapshot["filtered"]: return original, original
+        if snapshot["view"] is None and self.histograms.cached(("view",) + key) is None:
+            view = ImageProcessor.apply_view_filters(snapshot["original"], *snapshot["filters"])
+            snapshot["view"] = self.view_cache.put(key, view)
+        return original, counts(("view",) + key, snapshot["view"])
+
+    def _apply_filters(self, img, analysis_mode=None):
+        return ImageProcessor.apply_view_filters(img, self.channel_mode, self.is_inverted, analysis_mode or self.analysis_mode)
+
+    def _filter_region(self, src, box=None, analysis_mode=None):
+        """
+        Filtra src (o il suo ritaglio box). Sull'immagine originale le viste per canale
+        si leggono dai piani colore in cache invece di riconvertire l'immagine.
+        """
+        analysis_mode = analysis_mode or self.analysis_mode
+        if src is self.original_image and self.channel_mode in ColorPlaneCache.VIEW_MODES:
+            view = self.planes.channel_view(self.channel_mode, box)
+            return ImageProcessor.apply_view_filters(view, "RGB", self.is_inverted, analysis_mode)
+        return self._apply_filters(src.crop(box) if box else src, analysis_mode)
+
+    def _filter_key(self):
+        return (self.image_revision, self.channel_mode, self.is_inverted, self.analysis_mode)
+
+    def _view_key(self):
+        """Chiave della vista elaborata: col JPEG ghost la vista cresce a ogni qualità completata."""
+        key = self._filter_key()
+        return key + (self._ghost_shown,) if self.analysis_mode == "Ghost" else key
+
+    def _ghost_image(self):
+        """
+        Vista JPEG ghost: al primo accesso avvia la scansione delle qualità in background e restituisce
+        subito l'immagine attenuata; ogni qualità completata sostituisce la vista (_on_ghost_progress).
+        """
+        key = self._filter_key()
+        with self._ghost_lock:
+            if self._ghost_key != key:
+                if self._ghost is not None: self._ghost.cancel()
+                ghost = JPEGGhost(self._filter_region(self.original_image, analysis_mode="Normal"))
+                self._ghost, self._ghost_key, self._ghost_shown = ghost, key, 0
+                self._ghost_view = ghost.render()
+                # Render nel thread di lavoro, consegna della vista nel loop degli eventi
+                ghost.run_async(on_progress=lambda g: self._ghost_progress(g, g.progress))
+            return self._ghost_view
+
+    def _ghost_progress(self, ghost, count):
+        if ghost.cancelled: return
+        image = ghost.render()
+        self.after(0, lambda: self._on_ghost_progress(ghost, count, image))
+
+    def _on_ghost_progress(self, ghost, count, image):
+        if ghost is not self._ghost or ghost.cancelled or count <= self._ghost_shown: return
+        self._ghost_view, self._ghost_shown = image, count
+        self.request_redraw()
+        self._notify_view_changed()
+
+    def _cancel_ghost(self):
+        with self._ghost_lock:
+            if self._ghost is not None: self._ghost.cancel()
+            self._ghost = self._ghost_key = self._ghost_view = None
+            self._ghost_shown = 0
+
+    def _get_pyramid(self, key, image):
+        pyramid = self._pyramids.get(key)
+        if pyramid is None:
+            if key[0] == "view":
+                # Si tiene solo la piramide della vista elaborata corrente
+                for k in [k for k in self._pyramids if k[0] == "view"]: self._pyramids.pop(k).cancel()
+            pyramid = ImagePyramid(image)
+            self._pyramids[key] = pyramid
+            # A piramide pronta ridisegna, se nel frattempo l'immagine non è cambiata
+            pyramid.build_async(on_done=lambda p: self.after(0, self._on_pyramid_ready, p))
+        return pyramid
+
+    def _on_pyramid_ready(self, pyramid):
+        if pyramid in self._pyramids.values() and self.scale < 0.5: self.request_redraw()
+
+    def _tile_source(self, scale):
+        """
+        Restituisce (sorgente, tile_fn, key, fattore) per il renderer.
+        I filtri puntuali vengono applicati tile per tile sul livello di piramide adatto a scale,
+        Edge e Noise hanno bisogno di un bordo di halo, le analisi globali (Equalize, ELA) dell'immagine
+        elaborata per intero (e della sua piramide quando si è in zoom out).
+        Il renderer va chiamato con scale * fattore.
+        """
+        halo = ImageProcessor.view_filter_halo(self.analysis_mode)
+        store = self.backing_store
+        if store is not None and halo is not None and scale > 1.0:
+            # Oltre la risoluzione della panoramica i tile si leggono a piena risoluzione dal disco
+            tile_fn = self._halo_tile_fn(store.size, halo, lambda box: self._apply_filters(store.crop(box)))
+            return store, tile_fn, ("store",) + self._filter_key(), 1.0 / self.preview_factor
+
+        if halo is None or (halo > 0 and scale < 0.5):
+            processed = self.get_current_processed_image()
+            if scale >= 0.5: return processed, None, None, 1
+            level, factor = self._get_pyramid(("view",) + self._view_key(), processed).level_for_scale(scale)
+            return level, None, None, factor
+
+        if scale >= 0.5: src, factor = self.original_image, 1
+        else: src, factor = self._get_pyramid(("image", self.image_revision), self.original_image).level_for_scale(scale)
+        tile_fn = self._halo_tile_fn(src.size, halo, lambda box: self._filter_region(src, box))
+        return src, tile_fn, self._filter_key() + (factor,), factor
+
+    @staticmethod
+    def _halo_tile_fn(size, halo, filter_fn):
+        """tile_fn che filtra il box allargato di halo pixel (dentro l'immagine) e ritaglia il risultato."""
+        w, h = size
+        def tile_fn(box):
+            x0, y0, x1, y1 = box
+            hx0, hy0 = max(0, x0 - halo), max(0, y0 - halo)
+            hx1, hy1 = min(w, x1 + halo), min(h, y1 + halo)
+            tile = filter_fn((hx0, hy0, hx1, hy1))
+            if (hx0, hy0, hx1, hy1) != box:
+                tile = tile.crop((x0 - hx0, y0 - hy0, x1 - hx0, y1 - hy0))
+            return tile
+        return tile_fn
+
+    def viewport_size(self):
+        """Dimensioni del canvas in pixel (800x600 finché il widget non è mappato)."""
+        cw, ch = self.canvas.winfo_width(), self.canvas.winfo_height()
+        if cw < 10: cw, ch = 800, 600
+        return cw, ch
+
+    def request_redraw(self):
+        """
+        Segna la vista come da ridisegnare. Le richieste vengono accorpate in un solo render
+        per frame (anteprima veloce); quando l'input si ferma segue il render in qualità piena.
+        """
+        self._redraw_dirty = True
+        if self._frame_job is None:
+            self._frame_job = self.after(self.frame_ms, self._flush_redraw)
+        if self._settle_job is not None: self.after_cancel(self._settle_job)
+        self._settle_job = self.after(self.settle_ms, self._settle_redraw)
+
+    def _flush_redraw(self):
+        self._frame_job = None
+        if self._redraw_dirty:
+            self._redraw_dirty = False
+            self.redraw(preview=True)
+
+    def _settle_redraw(self):
+        self._settle_job = None
+        if self._frame_job is not None:
+            self.after_cancel(self._frame_job)
+            self._frame_job = None
+        if self._redraw_dirty or self._preview_shown:
+            self._redraw_dirty = False
+            self.redraw()
+
+    def redraw(self, preview=False):
+        self._rendered_rect = None
+        self._preview_shown = preview
+        if not self.original_image:
+            self.canvas.itemconfig(self.image_item, state="hidden")
+            self._draw_grid()
+            return
+        cw, ch = self.viewport_size()
+        if preview:
+            # Anteprima: risoluzione ridotta e NEAREST, poi ingrandita a dimensione canvas
+            f = self.preview_downsample
+            rendered = self._render(self.scale / f, self.pan_x / f, self.pan_y / f, cw // f + 1, ch // f + 1,
+                                    Image.Resampling.NEAREST, self.render_margin // f)
+            if rendered is None: return self._hide_image()
+            small, (dx, dy) = rendered
+            self.displayed_image = small.resize((small.width * f, small.height * f), Image.Resampling.NEAREST)
+            dx, dy = dx * f, dy * f
+        else:
+            resample = Image.Resampling.NEAREST if self.scale > 2.0 else Image.Resampling.BILINEAR
+            rendered = self._render(self.scale, self.pan_x, self.pan_y, cw, ch, resample, self.render_margin)
+            if rendered is None: return self._hide_image()
+            self.displayed_image, (dx, dy) = rendered
         self.tk_image = ImageTk.PhotoImage(self.displayed_image)
-        self.canvas.create_image(self.pan_x, self.pan_y, anchor="nw", image=self.tk_image)
-        if self.show_grid: self._draw_grid(new_size[0], new_size[1])
-
-    def _draw_grid(self, w, h):
-        step = max(10, 50 * self.scale)
-        for i in range(0, int(w), int(step)):
-            x = self.pan_x + i
-            self.canvas.create_line(x, self.pan_y, x, self.pan_y + h, fill="#00ff00", stipple="gray50")
-        for i in range(0, int(h), int(step)):
-            y = self.pan_y + i
-            self.canvas.create_line(self.pan_x, y, self.pan_x + w, y, fill="#00ff00", stipple="gray50")
+        self.canvas.coords(self.image_item, dx, dy)
+        self.canvas.itemconfig(self.image_item, image=self.tk_image, state="normal")
+        self._rendered_rect = (dx, dy, dx + self.displayed_image.width, dy + self.displayed_image.height)
+        self._draw_grid()
+        # Il livello fluttuante segue lo zoom (le sue coordinate sono già sul canvas)
+        if self.floating_pil_image: self.refresh_floating_image()
+
+    def _hide_image(self):
+        # Immagine fuori dal viewport
+        self.canvas.itemconfig(self.image_item, state="hidden")
+        self._draw_grid()
+
+    def _render(self, scale, pan_x, pan_y, view_w, view_h, resample, margin):
+        source, tile_fn, key, factor = self._tile_source(scale)
+        # Un livello ridotto di un fattore f si disegna con scala scale * f (stessa dimensione a schermo)
+        return self.renderer.render(source, scale * factor, pan_x, pan_y, view_w, view_h,
+                                    resample=resample, tile_fn=tile_fn, key=key, margin=margin)
+
+    def pan_view(self, dx, dy):
+        """
+        Pan veloce: trasla gli item già presenti sul canvas (immagine, griglia, overlay)
+        e ri-renderizza solo quando il viewport scopre zone non ancora renderizzate.
+        """
+        self.pan_x += dx
+        self.pan_y += dy
+        if self._rendered_rect is None:
+            self.request_redraw()
+            return
+
+        self.canvas.move("all", dx, dy)
+        if self.floating_pil_image:
+            self.floating_pos = (self.floating_pos[0] + dx, self.floating_pos[1] + dy)
+        if self._overlay_geometry:
+            x0, y0, x1, y1 = self._overlay_geometry
+            self._overlay_geometry = (x0 + dx, y0 + dy, x1 + dx, y1 + dy)
+        x0, y0, x1, y1 = self._rendered_rect
+        self._rendered_rect = (x0 + dx, y0 + dy, x1 + dx, y1 + dy)
+        # La griglia copre solo il viewport: le linee vanno ridistribuite sulla parte appena scoperta
+        if self._grid_shown: self._draw_grid()
+
+        if not self._viewport_covered(): self.request_redraw()
+
+    def _viewport_covered(self):
+        """True se l'ultimo render copre ancora tutta la parte visibile dell'immagine."""
+        cw, ch = self.viewport_size()
+        region = TileRenderer.visible_region(self.original_image.size, self.scale, self.pan_x, self.pan_y, cw, ch)
+        if region is None: return True
+        (vx0, vy0, vx1, vy1), _ = region
+        x0, y0, x1, y1 = self._rendered_rect
+        return x0 <= vx0 and y0 <= vy0 and x1 >= vx1 and y1 >= vy1
+
+    def _draw_grid(self):
+        """
+        Griglia limitata alla parte visibile dell'immagine. Le linee sono item riusati:
+        si riposizionano con coords, quelle in eccesso vengono nascoste.
+        """
+        lines = []
+        if self.show_grid and self.original_image:
+            iw, ih = self.original_image.size
+            w, h = int(iw * self.scale), int(ih * self.scale)
+            step = int(max(10, 50 * self.scale))
+            cw, ch = self.viewport_size()
+            px, py = int(self.pan_x), int(self.pan_y)
+            vx0, vy0 = max(px, 0), max(py, 0)
+            vx1, vy1 = min(px + w, cw), min(py + h, ch)
+            if vx1 > vx0 and vy1 > vy0:
+                # Prima linea della griglia (multipla di step dall'origine dell'immagine) dentro il viewport
+                for i in range(max(0, -(-(vx0 - px) // step)) * step, vx1 - px, step):
+                    lines.append((px + i, vy0, px + i, vy1))
+                for i in range(max(0, -(-(vy0 - py) // step)) * step, vy1 - py, step):
+                    lines.append((vx0, py + i, vx1, py + i))
+
+        for i, coords in enumerate(lines):
+            if i < len(self._grid_items):
+                self.canvas.coords(self._grid_items[i], *coords)
+                if i >= self._grid_shown: self.canvas.itemconfig(self._grid_items[i], state="normal")
+            else:
+                item = self.canvas.create_line(*coords, fill="#00ff00", stipple="gray50")
+                # Sopra l'immagine, sotto il livello fluttuante e le maniglie
+                self.canvas.tag_raise(item, self.image_item)
+                self._grid_items.append(item)
+        for item in self._grid_items[len(lines):self._grid_shown]:
+            self.canvas.itemconfig(item, state="hidden")
+        self._grid_shown = len(lines)
 
     def get_pixel_data(self, canvas_x, canvas_y):
         if not self.original_image: return "No image"
+        if self.backing_store is not None: return self._store_pixel_data(canvas_x, canvas_y)
         ix, iy = self.canvas_to_image(canvas_x, canvas_y)
         w, h = self.original_image.size
         if 0 <= ix < w and 0 <= iy < h:
             try:
-                mode = self.channel_mode
-                label = mode
-                vals = ""
-                
-                if mode == "RGB":
-                    p = self.original_image.convert("RGB").getpixel((ix, iy))
-                    vals = f"{p[0]},{p[1]},{p[2]}"
-                elif mode in ["R", "G", "B"]:
-                    p = self.original_image.convert("RGB").getpixel((ix, iy))
-                    idx = ["R", "G", "B"].index(mode)
-                    vals = f"{p[idx]}"
-                elif mode == "HSV":
-                    p = self.original_image.convert("HSV").getpixel((ix, iy))
-                    vals = f"{p[0]},{p[1]},{p[2]}"
-                elif mode in ["H", "S", "V"]:
-                    p = self.original_image.convert("HSV").getpixel((ix, iy))
-                    idx = ["H", "S", "V"].index(mode)
-                    vals = f"{p[idx]}"
-                elif mode == "YCbCr":
-                    p = self.original_image.convert("YCbCr").getpixel((ix, iy))
-                    vals = f"{p[0]},{p[1]},{p[2]}"
-                elif mode in ["Y", "Cb", "Cr"] or mode == "L":
-                    # Note: L is often handled as Y in YCbCr or separate Grayscale
-                    if mode == "L": 
-                         p = self.original_image.convert("L").getpixel((ix, iy))
-                         vals = f"{p}"
-                    else:
-                        p = self.original_image.convert("YCbCr").getpixel((ix, iy))
-                        idx = ["Y", "Cb", "Cr"].index(mode)
-                        vals = f"{p[idx]}"
-                else:
-                    # Fallback
-                    p = self.original_image.convert("RGB").getpixel((ix, iy))
-                    vals = f"{p[0]},{p[1]},{p[2]}"
-
-                return f"XY: {ix},{iy} | {label}: {vals}"
+                mode = self.channel_mode if self.channel_mode in ColorPlaneCache.CHANNELS else "RGB"
+                # Lettura diretta dai piani in cache: nessuna conversione per evento <Motion>
+                p = self.planes.pixel(mode, ix, iy)
+                vals = ",".join(str(v) for v in p) if isinstance(p, tuple) else f"{p}"
+                vals += self._ghost_pixel_info(ix, iy)
+                if not self.editable:
+                    # Anteprima: coordinate riportate alla piena risoluzione, valori dall'anteprima
+                    f = self.preview_factor
+                    return f"XY: {int(ix * f)},{int(iy * f)} | {self.channel_mode}: {vals} (preview)"
+                return f"XY: {ix},{iy} | {self.channel_mode}: {vals}"
             except: return "Error"
         return "Outside"
 
+    def _ghost_pixel_info(self, ix, iy):
+        """Qualità del minimo JPEG ghost nel blocco sotto il cursore (solo se il blocco è marcato)."""
+        ghost = self._ghost
+        if self.analysis_mode != "Ghost" or ghost is None or not self._ghost_shown: return ""
+        info = ghost.block_at(ix, iy)
+        if not info or info[1] <= 0: return ""
+        return f" | Ghost Q{info[0]} ({info[1]:.0%})"
+
+    def _store_pixel_data(self, canvas_x, canvas_y):
+        """Valore del pixel a piena risoluzione letto dal backing store (un pixel, nessuna conversione dell'immagine)."""
+        f = self.preview_factor
+        ix = int((canvas_x - self.pan_x) * f / self.scale)
+        iy = int((canvas_y - self.pan_y) * f / self.scale)
+        w, h = self.backing_store.size
+        if not (0 <= ix < w and 0 <= iy < h): return "Outside"
+        try:
+            mode = self.channel_mode if self.channel_mode in ColorPlaneCache.CHANNELS else "RGB"
+            planes = ColorPlaneCache()
+            planes.reset(self.backing_store.crop((ix, iy, ix + 1, iy + 1)))
+            p = planes.pixel(mode, 0, 0)
+            vals = ",".join(str(v) for v in p) if isinstance(p, tuple) else f"{p}"
+            return f"XY: {ix},{iy} | {self.channel_mode}: {vals}"
+        except: return "Error"
+
     def set_tool_mode(self, mode):
+        if mode != "view" and not self.editable: return
         self.tool_mode = mode
-        self.canvas.config(cursor="crosshair" if mode == "select" else "")
+        self._set_cursor("crosshair" if mode == "select" else "")
         if mode == "view": self.clear_selection()
 
     def set_selection_shape(self, shape):
@@ -232,10 +610,14 @@ class ImageCanvas(ctk.CTkFrame):
         if self.tool_mode != "view": self.set_tool_mode("select")
 
     def clear_selection(self):
-        if self.selection_rect_id: self.canvas.delete(self.selection_rect_id)
-        if self.floating_image_id: self.canvas.delete(self.floating_image_id)
-        self.selection_rect_id = self.floating_image_id = None
+        self._hide_selection()
+        self.selection_start = None
+        self.selection = None
+        self._selection_op = None
         self.floating_pil_image = self.floating_base_ref = None
+        self._hide_floating()
+        self._floating_proxy, self._floating_proxy_active = None, False
+        self._transform_gen += 1
         if self.tool_mode == "move_floating": self.tool_mode = "view"
 
     def canvas_to_image(self, cx, cy):
@@ -250,42 +632,42 @@ class ImageCanvas(ctk.CTkFrame):
         
         if self.tool_mode == "view":
             self.canvas.scan_mark(event.x, event.y)
+
+        elif not self.editable:
+            return
             
-        elif self.tool_mode == "select":
+        elif self.tool_mode == "select" or (self.tool_mode == "move_floating" and self.selection and event.state & 0x5):
+            # Con un modificatore la nuova forma si combina con la selezione corrente
+            shift, ctrl = event.state & 0x1, event.state & 0x4
+            self._selection_op = ("intersect" if shift and ctrl else "add" if shift else "subtract" if ctrl else None)
+            if not self.selection: self._selection_op = None
+            self.tool_mode = "select"
             self.selection_start = (event.x, event.y)
-            self.selection_points = [(event.x, event.y)]
-            if self.selection_rect_id: self.canvas.delete(self.selection_rect_id)
-            
-            color = "#00ffff"
-            if self.selection_shape == "rect":
-                self.selection_rect_id = self.canvas.create_rectangle(event.x, event.y, event.x, event.y, outline=color, width=2, dash=(4, 4))
-            elif self.selection_shape == "oval":
-                self.selection_rect_id = self.canvas.create_oval(event.x, event.y, event.x, event.y, outline=color, width=2, dash=(4, 4))
-            elif self.selection_shape == "free":
-                self.selection_rect_id = self.canvas.create_line(event.x, event.y, event.x, event.y, fill=color, width=2, dash=(4, 4), tags="free_line")
+            self._hide_selection()
+            if self.selection_shape == "free": self._lasso_begin(event.x, event.y)
+            else: self.selection_rect_id = self._show_selection_item(self.selection_shape, event.x, event.y)
                 
         elif self.tool_mode == "move_floating":
             # Check if clicked on a handle
-            clicked = self.canvas.find_overlapping(event.x-2, event.y-2, event.x+2, event.y+2)
-            tags = []
-            for item in clicked:
-                tags.extend(self.canvas.gettags(item))
+            part = self.hit_test(event.x, event.y)
             
             self._interaction_mode = "move" # default
             
-            if "handle_rot" in tags:
+            if part == "handle_rot":
                 self._interaction_mode = "rotate"
+                self._start_floating_proxy()
                 # Calcola angolo iniziale del click
-                w, h = self.floating_pil_image.size
+                w, h = self._floating_size()
                 dw, dh = int(w * self.scale), int(h * self.scale)
                 cx = self.floating_pos[0] + dw / 2
                 cy = self.floating_pos[1] + dh / 2
                 self._start_angle_ref = math.degrees(math.atan2(event.y - cy, event.x - cx))
                 self._base_angle = self.floating_angle
                 
-            elif "handle" in tags: # Any resize handle
+            elif part == "handle": # Any resize handle
                 self._interaction_mode = "scale"
-                w, h = self.floating_pil_image.size
+                self._start_floating_proxy()
+                w, h = self._floating_size()
                 dw, dh = int(w * self.scale), int(h * self.scale)
                 cx = self.floating_pos[0] + dw / 2
                 cy = self.floating_pos[1] + dh / 2
@@ -300,16 +682,12 @@ class ImageCanvas(ctk.CTkFrame):
     def on_mouse_drag(self, event):
         if self.tool_mode == "view":
             dx, dy = event.x - self._drag_start_x, event.y - self._drag_start_y
-            self.pan_x += dx
-            self.pan_y += dy
             self._drag_start_x, self._drag_start_y = event.x, event.y
-            self.redraw()
+            self.pan_view(dx, dy)
             
         elif self.tool_mode == "select" and self.selection_start:
             if self.selection_shape == "free":
-                self.selection_points.append((event.x, event.y))
-                flat_points = [p for sub in self.selection_points for p in sub]
-                self.canvas.coords(self.selection_rect_id, *flat_points)
+                self._lasso_extend(event.x, event.y)
             else:
                 x1, y1 = self.selection_start
                 self.canvas.coords(self.selection_rect_id, x1, y1, event.x, event.y)
@@ -337,12 +715,9 @@ class ImageCanvas(ctk.CTkFrame):
                     # 1. Update scale value
                     self.floating_scale_val = new_scale
                     
-                    # 2. Recalculate image
-                    self.apply_transformations(scale_percent=None) # Use internal values
-                    
-                    # 3. Re-center: apply_transformations changed the size, so top-left floating_pos must shift
-                    # to keep the center at cx, cy
-                    w, h = self.floating_pil_image.size
+                    # 2. Re-center: the transformed size changed, so top-left floating_pos must shift
+                    # to keep the center at cx, cy (the full-quality image is computed on release)
+                    w, h = self._floating_size()
                     dw, dh = int(w * self.scale), int(h * self.scale)
                     self.floating_pos = (cx - dw/2, cy - dh/2)
                     
@@ -350,7 +725,7 @@ class ImageCanvas(ctk.CTkFrame):
                     
             elif self._interaction_mode == "rotate":
                 # Calcola centro dinamicamente
-                w, h = self.floating_pil_image.size
+                w, h = self._floating_size()
                 dw, dh = int(w * self.scale), int(h * self.scale)
                 cx = self.floating_pos[0] + dw / 2
                 cy = self.floating_pos[1] + dh / 2
@@ -360,9 +735,7 @@ class ImageCanvas(ctk.CTkFrame):
                 
                 self.floating_angle = self._base_angle + delta
                 
-                self.apply_transformations(angle=None)
-                
-                w_new, h_new = self.floating_pil_image.size
+                w_new, h_new = self._floating_size()
                 dw_new, dh_new = int(w_new * self.scale), int(h_new * self.scale)
                 self.floating_pos = (cx - dw_new/2, cy - dh_new/2)
                 
@@ -371,49 +744,74 @@ class ImageCanvas(ctk.CTkFrame):
     def on_mouse_move(self, event):
         # Gestione cursore
         if self.tool_mode == "move_floating":
-            # Check overlap con tolleranza
-            clicked = self.canvas.find_overlapping(event.x-2, event.y-2, event.x+2, event.y+2)
-            tags = []
-            for item in clicked:
-                tags.extend(self.canvas.gettags(item))
+            # Hit-test geometrico con tolleranza
+            part = self.hit_test(event.x, event.y)
                 
-            if "handle_rot" in tags:
-                self.canvas.config(cursor="exchange") # O altro cursore rotazione
-            elif "handle" in tags:
-                self.canvas.config(cursor="sizing") # O doppio arrow
+            if part == "handle_rot":
+                self._set_cursor("exchange") # O altro cursore rotazione
+            elif part == "handle":
+                self._set_cursor("sizing") # O doppio arrow
             else:
-                self.canvas.config(cursor="fleur")
+                self._set_cursor("fleur")
         elif self.tool_mode == "select":
-             self.canvas.config(cursor="crosshair")
+             self._set_cursor("crosshair")
         else:
-             self.canvas.config(cursor="")
+             self._set_cursor("")
+
+    def _set_cursor(self, cursor):
+        # config solo quando il cursore cambia davvero, non a ogni <Motion>
+        if cursor != self._cursor:
+            self._cursor = cursor
+            self.canvas.config(cursor=cursor)
+
+    def hit_test(self, x, y, tolerance=2):
+        """Parte del livello fluttuante sotto (x, y): "handle_rot", "handle", "body" o None (solo geometria)."""
+        if self._overlay_geometry is None: return None
+        x0, y0, x1, y1 = self._overlay_geometry
+        rot_x, rot_y = (x0 + x1) / 2, y0 - self.rot_handle_offset
+        if math.hypot(x - rot_x, y - rot_y) <= 5 + tolerance: return "handle_rot"
+        r = self.handle_size / 2 + tolerance
+        for hx, hy in ((x0, y0), (x1, y0), (x1, y1), (x0, y1)):
+            if abs(x - hx) <= r and abs(y - hy) <= r: return "handle"
+        if x0 - tolerance <= x <= x1 + tolerance and y0 - tolerance <= y <= y1 + tolerance: return "body"
+        return None
 
     def on_mouse_up(self, event):
         if self.tool_mode == "select" and self.selection_start:
             if self.selection_shape == "free":
-                if len(self.selection_points) < 3: return
+                if not self.lasso or len(self.lasso) < 3: return
                 # Chiudi il poligono visivamente
-                self.selection_points.append(self.selection_points[0])
-                flat_points = [p for sub in self.selection_points for p in sub]
-                self.canvas.coords(self.selection_rect_id, *flat_points)
-                
-                # Calcola bounding box per il crop
-                xs = [p[0] for p in self.selection_points]
-                ys = [p[1] for p in self.selection_points]
-                cx1, cx2, cy1, cy2 = min(xs), max(xs), min(ys), max(ys)
+                self._lasso_close()
+                # Il tracciato è già in coordinate immagine
+                ix1, iy1, ix2, iy2 = self.lasso.bbox()
+                if (ix2 - ix1) * self.scale < 5: return
+                shape, geometry = "polygon", self.lasso.points
             else:
                 x1, y1 = self.selection_start
                 x2, y2 = event.x, event.y
                 cx1, cx2, cy1, cy2 = min(x1, x2), max(x1, x2), min(y1, y2), max(y1, y2)
-            
-            if cx2 - cx1 < 5: return
-            
-            ix1, iy1 = self.canvas_to_image(cx1, cy1)
-            ix2, iy2 = self.canvas_to_image(cx2, cy2)
+                if cx2 - cx1 < 5: return
+                ix1, iy1 = self.canvas_to_image(cx1, cy1)
+                ix2, iy2 = self.canvas_to_image(cx2, cy2)
+                shape, geometry = self.selection_shape, (ix1, iy1, ix2, iy2)
+
+            if self._selection_op and self.selection: self.selection.combine(self._selection_op, shape, geometry)
+            else: self.selection = SelectionMask(shape, geometry)
+            self._selection_op = None
+
             w, h = self.original_image.size
+            bbox = self.selection.bbox()
+            if bbox is None:
+                self.clear_selection()
+                return
+            ix1, iy1, ix2, iy2 = bbox
             self.selection_coords_img = (max(0, ix1), max(0, iy1), min(w, ix2), min(h, iy2))
             
             self.create_floating_from_selection()
+
+        elif self.tool_mode == "move_floating" and self._floating_proxy_active:
+            # Fine del drag di scala/rotazione: trasformazione a piena qualità una sola volta, in background
+            self.finish_transform_async()
             
         self._interaction_mode = None
 
@@ -421,51 +819,41 @@ class ImageCanvas(ctk.CTkFrame):
         if not self.selection_coords_img: return
         cropped = self.original_image.crop(self.selection_coords_img)
         
-        # Gestione Maschere (Oval / Free)
-        if self.selection_shape in ["oval", "free"]:
-            mask = Image.new("L", cropped.size, 0)
-            from PIL import ImageDraw
-            draw = ImageDraw.Draw(mask)
-            
-            if self.selection_shape == "oval":
-                draw.ellipse((0, 0) + cropped.size, fill=255)
-            elif self.selection_shape == "free":
-                # Converti i punti canvas in punti relativi all'immagine ritagliata
-                ix1, iy1, _, _ = self.selection_coords_img
-                rel_points = []
-                for px, py in self.selection_points:
-                    img_px, img_py = self.canvas_to_image(px, py)
-                    rel_points.append((img_px - ix1, img_py - iy1))
-                draw.polygon(rel_points, fill=255)
-            
+        # Maschera anti-aliasing delle forme selezionate (un rettangolo semplice non ne ha bisogno)
+        if self.selection and not self.selection.is_rect:
+            mask = self.selection.render(self.selection_coords_img)
             cropped = cropped.convert("RGBA")
             cropped.putalpha(mask)
             
         self.floating_base_ref = cropped
         self.floating_pil_image = cropped.copy()
+        self._floating_proxy_active = False
         self.floating_angle = 0
         self.floating_scale_val = 1.0
         
-        if self.selection_rect_id: self.canvas.delete(self.selection_rect_id)
-        self.refresh_floating_image()
+        self._hide_selection()
+        # Il livello è già in modifica: un solo render, con le maniglie
         self.tool_mode = "move_floating"
-        self.canvas.config(cursor="fleur")
+        self._set_cursor("fleur")
+        self.refresh_floating_image()
 
 
     def set_floating_image_from_external(self, pil_image):
         """
         Carica un'immagine esterna come layer fluttuante per lo Splicing.
         """
-        if not pil_image or not self.original_image: return
+        if not pil_image or not self.original_image or not self.editable: return
 
         self.selection_coords_img = None
         self.selection_rect_id = None
+        self.selection = None
         
         self.tool_mode = "move_floating"
-        self.canvas.config(cursor="fleur")
+        self._set_cursor("fleur")
 
         self.floating_base_ref = pil_image.convert("RGBA")
         self.floating_pil_image = self.floating_base_ref.copy()
+        self._floating_proxy_active = False
         self.floating_angle = 0
         self.floating_scale_val = 1.0
         
@@ -487,14 +875,90 @@ class ImageCanvas(ctk.CTkFrame):
         if scale_percent is not None: self.floating_scale_val = float(scale_percent) / 100.0
         if angle is not None: self.floating_angle = float(angle)
         
+        self._transform_gen += 1
+        self._floating_proxy_active = False
+        self.floating_pil_image = self._full_transform(self.floating_base_ref, self.floating_scale_val, self.floating_angle)
+        self.refresh_floating_image()
+
+    @staticmethod
+    def _full_transform(base, scale_val, angle):
+        """Trasformazione a piena qualità del livello (LANCZOS + BICUBIC)."""
+        w, h = base.size
+        new_w, new_h = max(1, int(w * scale_val)), max(1, int(h * scale_val))
+        transformed = base.resize((new_w, new_h), Image.Resampling.LANCZOS)
+        if angle != 0:
+            transformed = transformed.rotate(angle, resample=Image.Resampling.BICUBIC, expand=True)
+        return transformed
+
+    @staticmethod
+    def _rotated_size(w, h, angle):
+        """Dimensioni di Image.rotate(angle, expand=True) senza ruotare nulla (stesso calcolo di PIL)."""
+        angle = angle % 360.0
+        if angle in (0, 180): return w, h
+        if angle in (90, 270): return h, w
+        a = -math.radians(angle)
+        cos_a, sin_a = round(math.cos(a), 15), round(math.sin(a), 15)
+        cx, cy = w / 2, h / 2
+        tx = cos_a * -cx + sin_a * -cy + cx
+        ty = -sin_a * -cx + cos_a * -cy + cy
+        corners = ((0, 0), (w, 0), (w, h), (0, h))
+        xs = [cos_a * x + sin_a * y + tx for x, y in corners]
+        ys = [-sin_a * x + cos_a * y + ty for x, y in corners]
+        return math.ceil(max(xs)) - math.floor(min(xs)), math.ceil(max(ys)) - math.floor(min(ys))
+
+    def _floating_size(self):
+        """Dimensioni (pixel immagine) del livello trasformato, anche mentre è mostrata l'anteprima."""
+        if not self._floating_proxy_active: return self.floating_pil_image.size
         w, h = self.floating_base_ref.size
-        new_w, new_h = max(1, int(w * self.floating_scale_val)), max(1, int(h * self.floating_scale_val))
-        transformed = self.floating_base_ref.resize((new_w, new_h), Image.Resampling.LANCZOS)
-        if self.floating_angle != 0:
-            transformed = transformed.rotate(self.floating_angle, resample=Image.Resampling.BICUBIC, expand=True)
-        self.floating_pil_image = transformed
+        return self._rotated_size(max(1, int(w * self.floating_scale_val)), max(1, int(h * self.floating_scale_val)),
+                                  self.floating_angle)
+
+    def _start_floating_proxy(self):
+        """Inizio di un drag di scala/rotazione: copia del livello alla risoluzione a cui è visualizzato."""
+        base = self.floating_base_ref
+        if base is None: return
+        factor = min(1.0, self.scale * self.floating_scale_val)
+        size = (max(1, int(base.width * factor)), max(1, int(base.height * factor)))
+        self._floating_proxy = base if size == base.size else base.resize(size, Image.Resampling.BILINEAR, reducing_gap=2.0)
+        self._floating_proxy_active = True
+        self._transform_gen += 1
+
+    def _proxy_display(self, dw, dh):
+        """Livello a schermo ricavato dall'anteprima: resize bilineare e rotazione NEAREST a risoluzione schermo."""
+        bw, bh = self.floating_base_ref.size
+        sw = max(1, int(bw * self.floating_scale_val * self.scale))
+        sh = max(1, int(bh * self.floating_scale_val * self.scale))
+        img = self._floating_proxy.resize((sw, sh), Image.Resampling.BILINEAR)
+        if self.floating_angle % 360:
+            img = img.rotate(self.floating_angle, resample=Image.Resampling.NEAREST, expand=True)
+        if img.size != (dw, dh): img = img.resize((dw, dh), Image.Resampling.NEAREST)
+        return img
+
+    def finish_transform_async(self):
+        """Calcola in un thread la trasformazione completa; fino ad allora resta visibile l'anteprima."""
+        if self.floating_base_ref is None: return
+        self._transform_gen += 1
+        gen = self._transform_gen
+        base, scale_val, angle = self.floating_base_ref, self.floating_scale_val, self.floating_angle
+        def task():
+            try:
+                result = self._full_transform(base, scale_val, angle)
+                self.after(0, lambda: self._on_transform_ready(gen, result))
+            except Exception as e:
+                print(f"Errore trasformazione: {e}")
+        threading.Thread(target=task, daemon=True).start()
+
+    def _on_transform_ready(self, gen, result):
+        if gen != self._transform_gen or self.floating_base_ref is None: return
+        self.floating_pil_image = result
+        self._floating_proxy_active = False
+        self._floating_proxy = None
         self.refresh_floating_image()
 
+    def ensure_full_transform(self):
+        """Se è visibile l'anteprima, calcola subito la trasformazione completa (es. prima di incollare)."""
+        if self._floating_proxy_active: self.apply_transformations()
+
     def _get_corners(self, w, h, angle_deg, cx, cy):
         """Calcola i 4 angoli dell'immagine ruotata rispetto al centro cx,cy."""
         rad = math.radians(angle_deg)
@@ -520,74 +984,149 @@ class ImageCanvas(ctk.CTkFrame):
         return rotated_corners
 
     def refresh_floating_image(self):
-        # Pulisce i vecchi elementi grafici dell'overlay
-        self.canvas.delete("overlay_ui")
-        
-        if not self.floating_pil_image: return
-        if self.floating_image_id: self.canvas.delete(self.floating_image_id)
+        """Aggiorna sul posto l'immagine del livello fluttuante e le sue maniglie (nessun item ricreato)."""
+        if not self.floating_pil_image: return self._hide_floating()
         
         # 1. Disegna l'immagine
-        w, h = self.floating_pil_image.size
+        w, h = self._floating_size()
         dw, dh = int(w * self.scale), int(h * self.scale)
-        
-        if dw > 0 and dh > 0:
+        if dw <= 0 or dh <= 0: return self._hide_floating()
+
+        if self._floating_proxy_active and self._floating_proxy is not None:
+            self.floating_tk_image = ImageTk.PhotoImage(self._proxy_display(dw, dh))
+            self._floating_display_src = None
+        elif self._floating_display_src is not self.floating_pil_image or self._floating_display_size != (dw, dh):
+            # Nei move cambia solo la posizione: la PhotoImage già pronta si riusa
             img_display = self.floating_pil_image.resize((dw, dh), Image.Resampling.BILINEAR)
             self.floating_tk_image = ImageTk.PhotoImage(img_display)
-            
-            if self.tool_mode == "select" and self.selection_coords_img:
-                self.floating_pos = self.image_to_canvas(self.selection_coords_img[0], self.selection_coords_img[1])
+            self._floating_display_src = self.floating_pil_image
+            self._floating_display_size = (dw, dh)
+        
+        if self.tool_mode == "select" and self.selection_coords_img:
+            self.floating_pos = self.image_to_canvas(self.selection_coords_img[0], self.selection_coords_img[1])
 
-            self.floating_image_id = self.canvas.create_image(
-                self.floating_pos[0], self.floating_pos[1], 
-                anchor="nw", image=self.floating_tk_image
-            )
-            
-            # 2. Se siamo in modalità di modifica (move_floating), disegna le maniglie
-            if self.tool_mode == "move_floating":
-                cx = self.floating_pos[0] + dw / 2
-                cy = self.floating_pos[1] + dh / 2
-                
-                rect_coords = (
-                    self.floating_pos[0], self.floating_pos[1],
-                    self.floating_pos[0] + dw, self.floating_pos[1] + dh
-                )
-                self.canvas.create_rectangle(*rect_coords, outline="#00ffff", width=1, tags="overlay_ui")
-                
-                handle_size = 8
-                corners = [
-                    (rect_coords[0], rect_coords[1]), # TL
-                    (rect_coords[2], rect_coords[1]), # TR
-                    (rect_coords[2], rect_coords[3]), # BR
-                    (rect_coords[0], rect_coords[3])  # BL
-                ]
-                tags = ["handle_tl", "handle_tr", "handle_br", "handle_bl"]
-                
-                for i, (hx, hy) in enumerate(corners):
-                    self.canvas.create_rectangle(
-                        hx - handle_size/2, hy - handle_size/2,
-                        hx + handle_size/2, hy + handle_size/2,
-                        fill="white", outline="#00ffff", tags=("overlay_ui", "handle", tags[i])
-                    )
-                
-                top_mid_x = (rect_coords[0] + rect_coords[2]) / 2
-                top_mid_y = rect_coords[1]
-                rot_handle_y = top_mid_y - 20
-                
-                self.canvas.create_line(top_mid_x, top_mid_y, top_mid_x, rot_handle_y, fill="#00ffff", tags="overlay_ui")
-                self.canvas.create_oval(
-                    top_mid_x - 5, rot_handle_y - 5,
-                    top_mid_x + 5, rot_handle_y + 5,
-                    fill="#00ffff", tags=("overlay_ui", "handle_rot")
-                )
+        self._ensure_overlay_items()
+        x0, y0 = self.floating_pos
+        x1, y1 = x0 + dw, y0 + dh
+        self.canvas.coords(self.floating_image_id, x0, y0)
+        self.canvas.itemconfig(self.floating_image_id, image=self.floating_tk_image, state="normal")
+        
+        # 2. Se siamo in modalità di modifica (move_floating), posiziona le maniglie
+        editing = self.tool_mode == "move_floating"
+        self._overlay_geometry = (x0, y0, x1, y1) if editing else None
+        self._show_overlay(editing)
+        if not editing: return
+
+        items = self._overlay_items
+        self.canvas.coords(items["box"], x0, y0, x1, y1)
+        hs = self.handle_size / 2
+        for name, (hx, hy) in zip(("tl", "tr", "br", "bl"), ((x0, y0), (x1, y0), (x1, y1), (x0, y1))):
+            self.canvas.coords(items[name], hx - hs, hy - hs, hx + hs, hy + hs)
+        mid_x, rot_y = (x0 + x1) / 2, y0 - self.rot_handle_offset
+        self.canvas.coords(items["rot_line"], mid_x, y0, mid_x, rot_y)
+        self.canvas.coords(items["rot"], mid_x - 5, rot_y - 5, mid_x + 5, rot_y + 5)
+
+    def _ensure_overlay_items(self):
+        """Crea (una volta sola, nascosti) l'immagine del livello fluttuante, il riquadro e le maniglie."""
+        if self._overlay_items is not None: return
+        c = self.canvas
+        self.floating_image_id = c.create_image(0, 0, anchor="nw", state="hidden")
+        self._overlay_items = {"box": c.create_rectangle(0, 0, 0, 0, outline="#00ffff", width=1, state="hidden")}
+        for name in ("tl", "tr", "br", "bl"):
+            self._overlay_items[name] = c.create_rectangle(0, 0, 0, 0, fill="white", outline="#00ffff", state="hidden")
+        self._overlay_items["rot_line"] = c.create_line(0, 0, 0, 0, fill="#00ffff", state="hidden")
+        self._overlay_items["rot"] = c.create_oval(0, 0, 0, 0, fill="#00ffff", state="hidden")
+
+    def _show_overlay(self, visible):
+        if visible == self._overlay_shown: return
+        self._overlay_shown = visible
+        for item in self._overlay_items.values():
+            self.canvas.itemconfig(item, state="normal" if visible else "hidden")
+
+    def _hide_floating(self):
+        self._overlay_geometry = None
+        if self._overlay_items is None: return
+        self.canvas.itemconfig(self.floating_image_id, state="hidden")
+        self._show_overlay(False)
+
+    def _show_selection_item(self, shape, x, y):
+        """Mostra (creandolo la prima volta) l'item tratteggiato della forma di selezione, in (x, y)."""
+        item = self._selection_items.get(shape)
+        if item is None:
+            color = "#00ffff"
+            if shape == "oval":
+                item = self.canvas.create_oval(x, y, x, y, outline=color, width=2, dash=(4, 4))
+            else:
+                item = self.canvas.create_rectangle(x, y, x, y, outline=color, width=2, dash=(4, 4))
+            self._selection_items[shape] = item
+        else:
+            self.canvas.coords(item, x, y, x, y)
+            self.canvas.itemconfig(item, state="normal")
+            self.canvas.tag_raise(item)
+        return item
+
+    def _hide_selection(self):
+        if self.selection_rect_id: self.canvas.itemconfig(self.selection_rect_id, state="hidden")
+        self.selection_rect_id = None
+        for item in self._lasso_items[:self._lasso_used]:
+            self.canvas.itemconfig(item, state="hidden")
+        self._lasso_used = 0
+
+    def _lasso_begin(self, x, y):
+        # Tolleranze in pixel schermo, quindi più fini in immagine quando si lavora ingranditi
+        self.lasso = LassoPath(spacing=self.lasso_spacing / self.scale, tolerance=self.lasso_tolerance / self.scale)
+        self.lasso.add((x - self.pan_x) / self.scale, (y - self.pan_y) / self.scale)
+        self._lasso_start = 0
+        self._lasso_next_item(x, y)
+
+    def _lasso_next_item(self, x, y):
+        """Mostra il prossimo spezzone del tracciato (riusando gli item delle selezioni precedenti)."""
+        if self._lasso_used < len(self._lasso_items):
+            item = self._lasso_items[self._lasso_used]
+            self.canvas.coords(item, x, y, x, y)
+            self.canvas.itemconfig(item, state="normal")
+            self.canvas.tag_raise(item)
+        else:
+            item = self.canvas.create_line(x, y, x, y, fill="#00ffff", width=2, dash=(4, 4))
+            self._lasso_items.append(item)
+        self._lasso_used += 1
+
+    def _lasso_coords(self, start, end=None, close=False):
+        end = start + 1 if end is None else end
+        coords = (self.lasso.points[start:end] * self.scale + (self.pan_x, self.pan_y)).ravel().tolist()
+        if close: coords += self._lasso_coords(0, 1)
+        return coords
+
+    def _lasso_extend(self, x, y):
+        """
+        Aggiunge un punto del mouse: si aggiorna solo lo spezzone corrente (al massimo lasso_chunk vertici),
+        quindi il costo per evento non cresce con la lunghezza del tracciato.
+        """
+        result = self.lasso.add((x - self.pan_x) / self.scale, (y - self.pan_y) / self.scale)
+        if not result: return
+        n = len(self.lasso)
+        if result == 1 and n - self._lasso_start > self.lasso_chunk:
+            # Spezzone pieno: il successivo riparte dall'ultimo vertice definitivo
+            self._lasso_start = n - 2
+            sx, sy = self._lasso_coords(n - 2)
+            self._lasso_next_item(sx, sy)
+        self.canvas.coords(self._lasso_items[self._lasso_used - 1], self._lasso_coords(self._lasso_start, n))
+
+    def _lasso_close(self):
+        self.canvas.coords(self._lasso_items[self._lasso_used - 1],
+                           self._lasso_coords(self._lasso_start, len(self.lasso), close=True))
 
     def apply_paste(self):
-        if not self.original_image or not self.floating_pil_image: return
-        self.save_current_state()
+        if not self.original_image or not self.floating_pil_image or not self.editable: return
+        self.ensure_full_transform()
         ix, iy = self.canvas_to_image(*self.floating_pos)
+        fw, fh = self.floating_pil_image.size
+        self.save_current_state((ix, iy, ix + fw, iy + fh))
         if self.floating_pil_image.mode == "RGBA":
             self.original_image.paste(self.floating_pil_image, (ix, iy), self.floating_pil_image)
         else:
             self.original_image.paste(self.floating_pil_image, (ix, iy))
+        self.on_image_changed()
         self.clear_selection()
         self.redraw()
         self.set_tool_mode("select") 
@@ -607,4 +1146,4 @@ class ImageCanvas(ctk.CTkFrame):
         zoom_factor = 1.03
         if event.num == 5 or event.delta < 0: self.scale /= zoom_factor
         else: self.scale *= zoom_factor
-        self.redraw()
+        self.request_redraw()
@@ -5,9 +5,19 @@ matplotlib.use("TkAgg") # Fondamentale per evitare conflitti su Linux
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 from matplotlib.figure import Figure
 import numpy as np
+import threading
+from core.histogram import HistogramService
 
 class HistogramWindow(ctk.CTkToplevel):
-    def __init__(self, parent, original_image, current_image):
+    """
+    Istogrammi RGB dell'immagine originale e della vista filtrata.
+    Resta aperta e si aggiorna da sola dopo incollaggi, undo/redo e cambi di filtro: i conteggi arrivano
+    dal servizio istogrammi del canvas (in cache per revisione), calcolati in un thread; prima un'anteprima
+    sottocampionata, poi quella completa. Le curve sono artisti persistenti aggiornati con set_data.
+    """
+    BANDS = (("R", "r"), ("G", "g"), ("B", "b"), ("L", "#cccccc"))
+
+    def __init__(self, parent, image_canvas):
         super().__init__(parent)
         self.title("Analisi Spettrale RGB")
         self.geometry("800x600")
@@ -15,8 +25,10 @@ class HistogramWindow(ctk.CTkToplevel):
         # Rendiamo la finestra modale (opzionale, per ora lasciamola libera)
         # self.transient(parent) 
         
-        self.original_image = original_image
-        self.current_image = current_image
+        self.image_canvas = image_canvas
+        self.refresh_delay_ms = 50
+        self._refresh_job = None
+        self._generation = 0
 
         # Layout
         self.grid_columnconfigure(0, weight=1)
@@ -29,10 +41,8 @@ class HistogramWindow(ctk.CTkToplevel):
         # Creiamo 2 subplot: Originale vs Corrente
         self.ax1 = self.figure.add_subplot(211)
         self.ax2 = self.figure.add_subplot(212)
-        
-        self.plot_histogram(self.ax1, self.original_image, "Istogramma Originale")
-        if self.current_image:
-            self.plot_histogram(self.ax2, self.current_image, "Istogramma Attuale (Filtrato)")
+        self.panels = [self.setup_axes(self.ax1, "Istogramma Originale"),
+                       self.setup_axes(self.ax2, "Istogramma Attuale (Filtrato)")]
         
         self.figure.tight_layout()
 
@@ -45,26 +55,68 @@ class HistogramWindow(ctk.CTkToplevel):
         self.btn_close = ctk.CTkButton(self, text="Chiudi", command=self.destroy, fg_color="#8B0000")
         self.btn_close.grid(row=1, column=0, pady=10)
 
-    def plot_histogram(self, ax, image, title):
+        self.image_canvas.add_view_listener(self.schedule_refresh)
+        self.refresh()
+
+    def destroy(self):
+        self.image_canvas.remove_view_listener(self.schedule_refresh)
+        if self._refresh_job: self.after_cancel(self._refresh_job)
+        self._generation += 1
+        super().destroy()
+
+    def setup_axes(self, ax, title):
+        """Crea una volta sola le curve (linea + riempimento a gradini) per ogni canale."""
         ax.set_facecolor('#333333')
         ax.set_title(title, color='white', fontsize=10)
         ax.tick_params(axis='x', colors='white')
         ax.tick_params(axis='y', colors='white')
-        
-        if image is None:
-            return
-
-        # Converti in RGB array
-        if image.mode != "RGB":
-            image = image.convert("RGB")
-        
-        img_array = np.array(image)
-        
-        colors = ('r', 'g', 'b')
-        for i, color in enumerate(colors):
-            hist, bins = np.histogram(img_array[:, :, i], 256, [0, 256])
-            ax.plot(hist, color=color, alpha=0.8, linewidth=1)
-            ax.fill_between(range(256), hist, color=color, alpha=0.1)
-        
         ax.set_xlim([0, 256])
         ax.grid(True, linestyle='--', alpha=0.2)
+
+        zeros = np.zeros(256)
+        artists = {}
+        for band, color in self.BANDS:
+            line, = ax.plot(np.arange(256), zeros, color=color, alpha=0.8, linewidth=1, visible=False)
+            fill = ax.stairs(zeros, np.arange(257), fill=True, color=color, alpha=0.1, visible=False)
+            artists[band] = (line, fill)
+        return ax, artists
+
+    def schedule_refresh(self):
+        # Più notifiche ravvicinate (es. undo ripetuti) producono un solo aggiornamento
+        if self._refresh_job is None:
+            self._refresh_job = self.after(self.refresh_delay_ms, self.refresh)
+
+    def refresh(self):
+        self._refresh_job = None
+        self._generation += 1
+        # Chiave e copie dell'immagine si prendono qui, nel thread Tk: il thread lavora solo sullo snapshot
+        snapshot = self.image_canvas.histogram_snapshot()
+        threading.Thread(target=self._compute, args=(self._generation, snapshot), daemon=True).start()
+
+    def _compute(self, generation, snapshot):
+        try:
+            for stride in (HistogramService.PREVIEW_STRIDE, 1):
+                if generation != self._generation: return
+                hists = self.image_canvas.compute_histograms(snapshot, stride)
+                self.after(0, lambda h=hists: self._apply(generation, h))
+        except Exception as e:
+            print(f"Errore istogramma: {e}")
+
+    def _apply(self, generation, hists):
+        if generation != self._generation or not self.winfo_exists(): return
+        for (ax, artists), counts in zip(self.panels, hists):
+            self.update_axes(ax, artists, counts)
+        self.canvas.draw_idle()
+
+    def update_axes(self, ax, artists, counts):
+        bands = ("L",) if counts is not None and len(counts) == 1 else ("R", "G", "B")
+        for band, (line, fill) in artists.items():
+            visible = counts is not None and band in bands
+            line.set_visible(visible)
+            fill.set_visible(visible)
+            if visible:
+                values = counts[bands.index(band)]
+                line.set_ydata(values)
+                fill.set_data(values)
+        top = float(counts.max()) if counts is not None else 0.0
+        ax.set_ylim(0, top * 1.05 if top > 0 else 1)
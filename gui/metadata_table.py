@@ -0,0 +1,156 @@
+import customtkinter as ctk
+
+class MetadataTable(ctk.CTkFrame):
+    """
+    Tabella (Tag, Valore) virtualizzata per la pagina Metadata.
+    Esistono solo le righe di widget che entrano nel riquadro: scorrendo vengono riutilizzate
+    cambiandone il testo, quindi il costo non dipende dal numero di tag.
+    La ricerca filtra a blocchi con after() (mai un ciclo lungo nel loop degli eventi) e, se la
+    query estende la precedente, cerca solo tra i risultati già trovati.
+    """
+    ROW_HEIGHT = 28
+    WHEEL_ROWS = 3
+    FILTER_CHUNK = 2000
+
+    def __init__(self, parent, **kwargs):
+        super().__init__(parent, **kwargs)
+        self.rows = []       # (tag, valore)
+        self._keys = []      # "tag\nvalore" in minuscolo, per la ricerca
+        self.visible = []    # indici in rows delle righe che passano il filtro
+        self.top = 0         # prima riga visibile (indice in visible)
+        self._pool = []      # (frame, label tag, label valore) riutilizzati
+        self._slots = []     # indice mostrato da ogni riga del pool (None = nascosta)
+        self._query = ""
+        self._filter_done = True
+        self._filter_job = None
+        self._filter_gen = 0
+
+        self.grid_columnconfigure(0, weight=1)
+        self.grid_rowconfigure(1, weight=1)
+
+        bar = ctk.CTkFrame(self, fg_color="transparent")
+        bar.grid(row=0, column=0, columnspan=2, sticky="ew", padx=40, pady=(10, 5))
+        self.search = ctk.CTkEntry(bar, placeholder_text="Search tag or value...", width=300)
+        self.search.pack(side="left")
+        self.search.bind("<KeyRelease>", lambda e: self.schedule_filter())
+        self.lbl_count = ctk.CTkLabel(bar, text="", font=("Arial", 11), text_color="gray")
+        self.lbl_count.pack(side="left", padx=10)
+
+        self.body = ctk.CTkFrame(self, fg_color="transparent")
+        self.body.grid(row=1, column=0, sticky="nsew", padx=(40, 0), pady=(0, 10))
+        self.scrollbar = ctk.CTkScrollbar(self, command=self.on_scrollbar)
+        self.scrollbar.grid(row=1, column=1, sticky="ns", pady=(0, 10))
+        self.body.bind("<Configure>", lambda e: self.layout())
+        self._bind_wheel(self.body)
+
+    def _bind_wheel(self, widget):
+        widget.bind("<MouseWheel>", self.on_wheel)
+        widget.bind("<Button-4>", self.on_wheel)
+        widget.bind("<Button-5>", self.on_wheel)
+
+    def _make_row(self):
+        row = ctk.CTkFrame(self.body, fg_color="transparent", height=self.ROW_HEIGHT)
+        lbl_tag = ctk.CTkLabel(row, text="", width=200, anchor="w", font=("Arial", 12, "bold"))
+        lbl_tag.pack(side="left")
+        lbl_value = ctk.CTkLabel(row, text="", anchor="w", font=("Arial", 12))
+        lbl_value.pack(side="left", padx=10)
+        for widget in (row, lbl_tag, lbl_value): self._bind_wheel(widget)
+        return row, lbl_tag, lbl_value
+
+    def set_rows(self, rows):
+        """Mostra rows (lista di (tag, valore)) mantenendo il filtro di ricerca corrente."""
+        if rows is self.rows: return
+        self.rows = rows
+        self._keys = [f"{tag}\n{value}".lower() for tag, value in rows]
+        # Stessi indici, contenuto diverso: le righe già visibili vanno riscritte
+        self._slots = [None if slot is None else -1 for slot in self._slots]
+        self.visible = list(range(len(rows)))
+        self.top = 0
+        self._query = ""
+        self._filter_done = True
+        self.apply_filter()
+
+    def _page_rows(self):
+        """Numero di righe che entrano per intero nel riquadro."""
+        return max(1, self.body.winfo_height() // self.ROW_HEIGHT)
+
+    def layout(self):
+        """Adatta il pool di righe all'altezza del riquadro (le righe in più vengono solo nascoste)."""
+        needed = self._page_rows() + 1
+        while len(self._pool) < needed:
+            self._pool.append(self._make_row())
+            self._slots.append(None)
+        self.render()
+
+    def render(self):
+        page = self._page_rows()
+        self.top = max(0, min(self.top, len(self.visible) - page))
+        for i, (row, lbl_tag, lbl_value) in enumerate(self._pool):
+            pos = self.top + i
+            index = self.visible[pos] if i <= page and pos < len(self.visible) else None
+            if index == self._slots[i]: continue
+            if index is None:
+                row.place_forget()
+            else:
+                tag, value = self.rows[index]
+                lbl_tag.configure(text=f"{tag}:")
+                lbl_value.configure(text=value)
+                if self._slots[i] is None: row.place(x=0, y=i * self.ROW_HEIGHT, relwidth=1)
+            self._slots[i] = index
+
+        total = len(self.visible)
+        if total: self.scrollbar.set(self.top / total, min(1.0, (self.top + page) / total))
+        else: self.scrollbar.set(0.0, 1.0)
+
+    def scroll_to(self, top):
+        self.top = int(top)
+        self.render()
+
+    def on_scrollbar(self, *args):
+        if args[0] == "moveto":
+            self.scroll_to(float(args[1]) * len(self.visible))
+        elif args[0] == "scroll":
+            step = self._page_rows() if args[2] == "pages" else 1
+            self.scroll_to(self.top + int(args[1]) * step)
+
+    def on_wheel(self, event):
+        if event.num == 4 or event.delta > 0: self.scroll_to(self.top - self.WHEEL_ROWS)
+        elif event.num == 5 or event.delta < 0: self.scroll_to(self.top + self.WHEEL_ROWS)
+        return "break"
+
+    def schedule_filter(self, delay=150):
+        """Filtra dopo una breve pausa nella digitazione."""
+        if self._filter_job is not None: self.after_cancel(self._filter_job)
+        self._filter_job = self.after(delay, self.apply_filter)
+
+    def apply_filter(self):
+        self._filter_job = None
+        self._filter_gen += 1
+        gen = self._filter_gen
+        query = self.search.get().strip().lower()
+        if not query:
+            self._finish_filter(query, list(range(len(self.rows))))
+            return
+
+        # Ricerca incrementale: una query che estende la precedente può solo restringere i risultati
+        if self._filter_done and self._query and query.startswith(self._query): candidates = self.visible
+        else: candidates = range(len(self.rows))
+        self._filter_done = False
+        keys, matches = self._keys, []
+
+        def step(start):
+            if gen != self._filter_gen: return
+            end = start + self.FILTER_CHUNK
+            matches.extend(i for i in candidates[start:end] if query in keys[i])
+            if end < len(candidates): self.after(1, lambda: step(end))
+            else: self._finish_filter(query, matches)
+        step(0)
+
+    def _finish_filter(self, query, matches):
+        self._query = query
+        self._filter_done = True
+        self.visible = matches
+        self.top = 0
+        shown = f"{len(matches)} of {len(self.rows)} tags" if query else f"{len(self.rows)} tags"
+        self.lbl_count.configure(text=shown)
+        self.render()
@@ -0,0 +1,110 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image
+from core.history_manager import HistoryManager
+
+MB = 1024 * 1024
+
+def _frames(count, size=(1000, 1000)):
+    # Contenuto diverso per ogni passo, poco comprimibile (rumore)
+    return [Image.effect_noise(size, 40 + i).convert("RGB") for i in range(count)]
+
+def test_undo_run_stays_within_budget():
+    hm = HistoryManager(max_bytes=20 * MB, hot_steps=2, background=False)
+    image = Image.new("RGB", (1000, 1000))
+    for frame in _frames(40):
+        hm.push(image)
+        image.paste(frame)
+    for _ in range(40):
+        assert hm.undo(image) is not None
+        assert hm.used_bytes <= hm.max_bytes
+    assert len(hm.redo_stack) == 40
+    assert all(step.tier != "raw" for step in hm.redo_stack[:-2])
+    hm.close()
+
+def test_undo_redo_roundtrip_through_spill():
+    hm = HistoryManager(max_bytes=8 * MB, hot_steps=2, background=False)
+    image = Image.new("RGB", (1000, 1000))
+    states = [image.tobytes()]
+    for frame in _frames(12):
+        hm.push(image)
+        image.paste(frame)
+        states.append(image.tobytes())
+    for i in range(12):
+        hm.undo(image)
+        assert image.tobytes() == states[-2 - i]
+    assert hm.disk_bytes > 0
+    for i in range(12):
+        hm.redo(image)
+        assert image.tobytes() == states[i + 1]
+        assert hm.used_bytes <= hm.max_bytes
+    hm.close()
+
+def test_push_releases_spilled_redo_steps():
+    hm = HistoryManager(max_bytes=4 * MB, hot_steps=1, background=False)
+    image = Image.new("RGB", (1000, 1000))
+    for frame in _frames(8):
+        hm.push(image)
+        image.paste(frame)
+    for _ in range(8): hm.undo(image)
+    hm.push(image, (0, 0, 10, 10))
+    assert hm.redo_stack == []
+    assert hm._spill.live_bytes == hm.disk_bytes
+    hm.close()
+
+def _unspill(hm, step):
+    # Riporta in RAM (compresso) un passo finito su disco
+    step.data = hm._spill.read(step.location)
+    hm._spill.release(step.location)
+    step.location, step.tier = None, "compressed"
+
+def test_disk_budget_drops_spilled_steps_not_ram_history():
+    hm = HistoryManager(max_bytes=1 * MB, hot_steps=1, background=False)
+    image = Image.new("RGB", (1000, 1000))
+    states = [image.tobytes()]
+    for frame in _frames(6):
+        hm.push(image)
+        image.paste(frame)
+        states.append(image.tobytes())
+    assert [s.tier for s in hm.undo_stack[:-1]] == ["disk"] * 5
+    # Il passo più vecchio torna in RAM, quelli successivi restano su disco
+    _unspill(hm, hm.undo_stack[0])
+    hm.max_bytes = 1024 * MB
+    hm.disk_budget = sum(step.location[1] for step in hm.undo_stack[2:-1])
+
+    hm._enforce_budget()
+    assert hm._spill.live_bytes <= hm.disk_budget
+    # Cadono solo il passo su disco più vecchio e quello (non più raggiungibile) sotto di lui
+    assert len(hm.undo_stack) == 4
+    assert all(step.tier == "disk" for step in hm.undo_stack[:-1])
+    # I passi rimasti ripristinano ancora gli stati giusti (budget ampio: gli undo non scartano altro)
+    hm.disk_budget = 1024 * MB
+    for i in range(4):
+        hm.undo(image)
+        assert image.tobytes() == states[-2 - i]
+    assert hm.undo(image) is None
+    hm.close()
+
+def test_disk_budget_evicts_spilled_redo_steps():
+    hm = HistoryManager(max_bytes=1 * MB, hot_steps=1, background=False)
+    image = Image.new("RGB", (1000, 1000))
+    for frame in _frames(8):
+        hm.push(image)
+        image.paste(frame)
+    for _ in range(4): hm.undo(image)
+    # Undo tutto in RAM, Redo su disco oltre il budget: si scartano solo passi di Redo
+    for step in hm.undo_stack:
+        if step.tier == "disk": _unspill(hm, step)
+    spilled = [s for s in hm.redo_stack if s.tier == "disk"]
+    assert len(spilled) >= 2
+    hm.max_bytes = 1024 * MB
+    hm.disk_budget = hm._spill.live_bytes - 1
+    hm._enforce_budget()
+    assert len(hm.undo_stack) == 4
+    assert hm._spill.live_bytes <= hm.disk_budget
+    assert hm.disk_bytes == hm._spill.live_bytes
+    assert len(hm.redo_stack) == 3
+    hm.close()